@@ -6,7 +6,16 @@
 # Import the necessary libraries
 import pygame
 import ChessVar
+import Client
+import Engine
+import GameRecord
+import Ponder
+import Profiling
+import Tablebase
+import argparse
+import functools
 import os
+import threading
 import time
 
 
@@ -15,121 +24,451 @@ screen_width = 1200
 screen_height = int(screen_width * 9 / 16)
 
 fps = 120
-clock = pygame.time.Clock()
+# Made by init_display, so importing this file does not open a window
+clock = None
 
 timer = 300
 
-screen = pygame.display.set_mode((screen_width, screen_height))
-pygame.display.set_caption('Falcon-Hunter Chess')
+screen = None
 
 black_square_color = (73, 97, 209)
 white_square_color = (240, 240, 200)
 falcon_hunter_rectangle_color = (150, 200, 255)
+highlight_color = (40, 40, 40, 110)
 
 ratio = screen_width / 16
 
+# Piece images scaled to the board, keyed by (color, code, ratio), filled by make_image
+piece_images = {}
+
+# Off-screen surface with the squares and the falcon/hunter panel, drawn once by make_board_layer
+board_layer = None
+# Pieces on the screen as (color, code, x, y) after the last draw_board, or None when the whole
+# screen has to be redrawn
+drawn_pieces = None
+# Text and area of each timer on the screen, keyed by the timer's position
+drawn_timers = {}
+
+# Fonts keyed by (name, size), filled by get_font
+fonts = {}
+timer_font_name = 'Noto Sans'
+button_font_name = 'Aerial'
+
+# Event posted for every message from the game server when playing online, with the message
+# as its message attribute (None once the connection is lost)
+NETWORK_EVENT = pygame.USEREVENT + 1
+# Event posted for every depth finished by the background analysis, with the result dictionary
+# from Ponder.Ponderer as its result attribute
+PONDER_EVENT = pygame.USEREVENT + 2
+# Event posted when the computer player has chosen its move, with the packed move (None if it
+# has none) as its move attribute and the ChessVar game it was chosen for as its game attribute
+ENGINE_EVENT = pygame.USEREVENT + 3
+
+# Analysis shown in the side panel as (lines of text, area on screen) after the last
+# draw_analysis, or None when nothing is shown
+drawn_analysis = None
+
+# Performance overlay, shown and hidden with F3: how long each part of the last frame took
+# in seconds by name, the frames counted so far in the current second as [start, frames,
+# fps of the second before], when the overlay may next be redrawn, and its area on screen
+hud_visible = False
+hud_timings = {}
+hud_frames = [0.0, 0, 0]
+hud_next_draw = 0.0
+hud_rect = None
+hud_font_name = 'Noto Sans'
+
 chess_game = None
 white_timer = None
 black_timer = None
 
 
-def main():
+def main(engine_color=None, record_path=None, profile_path=None, server_address=None, game_number=None,
+         ponder=False):
+    """Runs the game. If engine_color is 'White' or 'Black', the computer plays that color.
+    If record_path is given, every finished game is appended to that game archive. If
+    profile_path is given, the ChessVar methods are measured (see Profiling), the performance
+    overlay starts shown, and the numbers are written to that file as JSON on quitting.
+    If server_address (host, port) is given, the game is played online against a Server.py
+    game server: a new game is started there, or the game with game_number is joined, and the
+    server decides which moves are played and keeps the clocks. If ponder is True, the
+    position is analysed in the background while a person is to move, with the best line and
+    score shown next to the timers, and the computer player searches with what was found."""
+    global hud_visible
+    if profile_path is not None:
+        Profiling.enable()
+        hud_visible = True
     
     # Creates the game object
-    pygame.init()
-    pygame.font.init()
+    init_display()
     run = True
 
     chess_game = ChessVar.ChessVar()
-    draw_board(chess_game)
+    load_piece_images()
+    pygame.display.update(draw_board(chess_game))
 
-    selected_piece = None
+    selected_square = None
     initial_square = None
+    # Legal moves of the selected piece by target square, found once when it is picked up
+    targets = {}
 
     click_sound = get_sound('click')
     unable_sound = get_sound('unable')
     ding_sound = get_sound('ding')
 
-    time_of_last_frame = 0
+    time_of_last_frame = pygame.time.get_ticks()
 
     white_timer = timer
     black_timer = timer
 
     start = False
 
+    # The analysis process, the hash of the position it was last sent (None while it is
+    # stopped), and its newest result for that position
+    ponderer = None
+    pondered_hash = None
+    analysis = None
+    if ponder:
+        ponderer = Ponder.Ponderer(on_result=post_ponder_result)
+    engine = None
+    # The computer player's search running in the background as (thread, stop event), or None
+    engine_search = None
+    if engine_color is not None:
+        # Endings covered by the tables built with Tablebase.py are played from them
+        engine = Engine.Engine(table=ponderer.get_table() if ponderer is not None else None,
+                               tablebase=Tablebase.Tablebase())
+
+    # The color played online, which stays None until the server has seated this player
+    client = None
+    network_color = None
+    if server_address is not None:
+        client = Client.GameClient(server_address[0], server_address[1], on_message=post_network_message)
+        if game_number is None:
+            client.send('new', time=timer)
+        else:
+            client.send('join', game=game_number)
+
     while run:
+        frame_start = time.perf_counter()
+        # Keeps the analysis on the current position while a person is to move
+        if ponderer is not None:
+            wanted_hash = None
+            if chess_game.get_game_state() == 'UNFINISHED' and \
+                    (engine is None or chess_game._player_turn != engine_color):
+                wanted_hash = chess_game.get_hash()
+            if wanted_hash != pondered_hash:
+                if wanted_hash is None:
+                    ponderer.stop()
+                else:
+                    ponderer.analyse(chess_game)
+                    analysis = None
+                pondered_hash = wanted_hash
+        # Waits for input while nothing is moving, and only runs at the full frame rate while a
+        # piece is being dragged or the computer has to move
+        if selected_square is not None:
+            events = get_events(True)
+        elif engine is not None and chess_game._player_turn == engine_color and engine_search is None:
+            events = get_events(False, 0)
+        elif start:
+            running_timer = white_timer if chess_game._player_turn == 'White' else black_timer
+            events = get_events(False, time_until_timer_changes(running_timer))
+        else:
+            events = get_events(False)
+
+        events_start = time.perf_counter()
         # Takes a list of events
-        for event in pygame.event.get():
+        for event in events:
             # Checks whether the X in the top right is clicked
 
             if event.type == pygame.QUIT:
                 run = False
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                start = True
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                hud_visible = not hud_visible
+            if event.type == PONDER_EVENT and event.result['hash'] == pondered_hash:
+                analysis = event.result
+            if event.type == ENGINE_EVENT and event.game is chess_game:
+                engine_search = None
+                # Takes the rest of the thinking time off the computer's clock before the turn
+                # changes
+                now = pygame.time.get_ticks()
+                if engine_color == 'White':
+                    white_timer -= (now - time_of_last_frame) / 1000
+                else:
+                    black_timer -= (now - time_of_last_frame) / 1000
+                time_of_last_frame = now
+                if event.move is not None and chess_game.get_game_state() == 'UNFINISHED':
+                    moved_from, moved_to = ChessVar.get_move_notation(event.move, engine_color)
+                    if len(moved_from) == 1:
+                        chess_game.enter_fairy_piece(moved_from, moved_to)
+                        pygame.mixer.Sound.play(ding_sound)
+                    else:
+                        chess_game.make_move(moved_from, moved_to)
+                        pygame.mixer.Sound.play(click_sound)
+            if event.type == NETWORK_EVENT:
+                message = event.message
+                if message is None:
+                    print('Lost the connection to the server')
+                    run = False
+                elif message['type'] == 'joined':
+                    network_color = message['color']
+                    chess_game = ChessVar.ChessVar()
+                    white_timer = black_timer = message['time']
+                    start = False
+                    pygame.display.set_caption('Falcon-Hunter Chess - game ' + str(message['game']) + ' as ' + network_color)
+                elif message['type'] in ('start', 'update'):
+                    # A move is new if the server's turn has moved on from the one shown here
+                    if message['packed'] is not None and message['turn'] != chess_game._player_turn:
+                        chess_game.push_move(message['packed'])
+                        if message['packed'] >> ChessVar.MOVE_DROP_SHIFT:
+                            pygame.mixer.Sound.play(ding_sound)
+                        else:
+                            pygame.mixer.Sound.play(click_sound)
+                    if message['state'] != 'UNFINISHED' and chess_game.get_game_state() == 'UNFINISHED':
+                        chess_game.set_game_state(message['state'])
+                    white_timer, black_timer = message['clocks']['White'], message['clocks']['Black']
+                    time_of_last_frame = pygame.time.get_ticks()
+                    start = True
+                elif message['type'] == 'error':
+                    pygame.mixer.Sound.play(unable_sound)
+            if event.type == pygame.MOUSEBUTTONDOWN and \
+                    (client is None or (start and chess_game._player_turn == network_color)) and \
+                    (engine is None or chess_game._player_turn != engine_color):
+                if client is None and not start:
+                    # The clocks start from the first click, not from when the window opened
+                    start = True
+                    time_of_last_frame = pygame.time.get_ticks()
                 mouse_position = find_square_from_mouse()   
                 if len(mouse_position) == 2:    
                     initial_square = find_square_from_mouse()
-                    row, column = ChessVar.get_board_indexes(initial_square)
-                    piece = chess_game._board[row][column]
+                    piece = chess_game.search_square(initial_square)
                     if '[]' not in piece.get_code():
-                        selected_piece = piece
-                        piece_square = initial_square
+                        # Pieces are shared objects, so the square is what tells them apart
+                        selected_square = initial_square
+                        targets = chess_game.legal_targets(initial_square)
                 elif len(mouse_position) == 1:
-                    selected_piece = mouse_position
+                    selected_square = mouse_position
+                    targets = chess_game.legal_targets(mouse_position)
 
 
-            if event.type == pygame.MOUSEBUTTONUP and selected_piece is not None:
+            if event.type == pygame.MOUSEBUTTONUP and selected_square is not None:
                 final_square = find_square_from_mouse()
                 print(final_square)
                 if final_square == 'Off Board' or len(final_square) != 2:
                     pygame.mixer.Sound.play(unable_sound)
-                elif type(selected_piece) is str:
-                    move = chess_game.enter_fairy_piece(selected_piece, final_square)
-                    if move:
-                        pygame.mixer.Sound.play(ding_sound)
-                else:
-                    move = chess_game.make_move(initial_square, final_square)
-                    if move:
-                        pygame.mixer.Sound.play(click_sound)
-                selected_piece = None
+                elif final_square in targets:
+                    # The move was already found to be legal when the piece was picked up
+                    move = targets[final_square]
+                    if client is not None:
+                        # Online, the move is only played once the server sends it back
+                        moved_from, moved_to = ChessVar.get_move_notation(move, chess_game._player_turn)
+                        client.send('move', **{'from': moved_from, 'to': moved_to})
+                    else:
+                        chess_game.push_move(move)
+                        if move >> ChessVar.MOVE_DROP_SHIFT:
+                            pygame.mixer.Sound.play(ding_sound)
+                        else:
+                            pygame.mixer.Sound.play(click_sound)
+                selected_square = None
                 initial_square = None
-
-        if white_timer <= 0:
+                targets = {}
+        record_frame_time('events', time.perf_counter() - events_start)
+
+        # Starts the computer thinking when it is its turn, using the time left on its clock. It
+        # searches in the background, so the window and its clock keep going until its move
+        # comes in as an ENGINE_EVENT
+        if engine is not None and chess_game._player_turn == engine_color and \
+                chess_game.get_game_state() == 'UNFINISHED' and engine_search is None:
+            time_left = white_timer if engine_color == 'White' else black_timer
+            moves_to_go = 30
+            if ponderer is not None:
+                ponderer.stop()
+                pondered_hash = None
+                # If the move just played is the one the analysis expected, the table already
+                # holds a deep search of this position, so a short search is enough
+                history = chess_game.get_move_history()
+                if analysis is not None and history and analysis['pv'] and analysis['pv'][0] == history[-1]:
+                    moves_to_go = 120
+                analysis = None
+            if not start:
+                start = True
+                time_of_last_frame = pygame.time.get_ticks()
+            engine_search = start_engine_move(engine, chess_game, time_left, moves_to_go)
+
+        if client is not None:
+            # Online the server decides when a clock has run out, so the shown clocks just
+            # stop at zero until it says so
+            white_timer, black_timer = max(white_timer, 0), max(black_timer, 0)
+        elif white_timer <= 0:
             chess_game.set_game_state('BLACK_WON')
         elif black_timer <= 0: 
             chess_game.set_game_state('WHITE_WON')
 
         if chess_game.get_game_state() is not 'UNFINISHED':
-            player_wins(chess_game)
+            if record_path is not None:
+                with GameRecord.GameWriter(record_path) as writer:
+                    writer.write_chess_var(chess_game)
+            if engine_search is not None:
+                # The computer ran out of time while thinking
+                stop_engine_move(engine_search)
+                engine_search = None
+            if not player_wins(chess_game):
+                break
             white_timer = timer
             black_timer = timer
             chess_game = ChessVar.ChessVar()
             start = False
+            # The time spent on the end screen does not count on either clock
+            time_of_last_frame = pygame.time.get_ticks()
+            if client is not None:
+                network_color = None
+                client.send('new', time=timer)
         else:
-            draw_board(chess_game, selected_piece)
+            draw_start = time.perf_counter()
+            dirty_rects = draw_board(chess_game, selected_square, targets)
+            timers_start = time.perf_counter()
+            record_frame_time('draw_board', timers_start - draw_start)
             white_timer_save = white_timer
             black_timer_save = black_timer
-            time_of_last_frame, white_timer, black_timer = manage_timers(chess_game._player_turn, time_of_last_frame, white_timer, black_timer)
+            time_of_last_frame, white_timer, black_timer, timer_rects = manage_timers(chess_game._player_turn, time_of_last_frame, white_timer, black_timer)
             if not start:
                 white_timer = white_timer_save
-                black_timer = black_timer
-            
-            clock.tick(fps)
+                black_timer = black_timer_save
+            record_frame_time('manage_timers', time.perf_counter() - timers_start)
+
+            # Only the parts of the screen that changed are sent to the display
+            analysis_rects = draw_analysis(analysis) if ponderer is not None else []
+            pygame.display.update(dirty_rects + timer_rects + analysis_rects + draw_hud())
+        record_frame_time('frame', time.perf_counter() - frame_start)
+        count_frame()
+
+    if profile_path is not None:
+        Profiling.dump_json(profile_path)
+    if client is not None:
+        client.close()
+    if engine_search is not None:
+        stop_engine_move(engine_search)
+    if ponderer is not None:
+        # The engine searches in the ponderer's shared memory, so it has to go first
+        engine = None
+        ponderer.close()
+    pygame.quit()
+    
 
-        # Timers are rendered in the function
-        
-        pygame.display.update()
-        
 
+def replay_main(archive_path, game_number=0):
+    """Shows the game with the given number (counting from 0) of a GameRecord archive and
+    lets it be stepped through: the left and right arrow keys go back and forward a ply, the
+    down and up keys ten plies, Home and End to the start and end, and the slider under the
+    side panel can be clicked or dragged to any ply."""
+    global hud_visible
+    init_display()
+    load_piece_images()
+    with GameRecord.GameArchive(archive_path) as archive:
+        moves, result = archive[game_number]
+    replay = GameRecord.GameReplay(moves, result)
+    ply = 0
+    pygame.display.update(draw_board(replay.seek(ply)) + draw_replay_panel(replay))
+    # Holding a key down keeps stepping through the game
+    pygame.key.set_repeat(300, 40)
+    key_steps = {pygame.K_LEFT: -1, pygame.K_RIGHT: 1, pygame.K_DOWN: -10, pygame.K_UP: 10}
+    sliding = False
+    run = True
+    while run:
+        wanted = ply
+        for event in get_events(False):
+            if event.type == pygame.QUIT:
+                run = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key in key_steps:
+                    wanted += key_steps[event.key]
+                elif event.key == pygame.K_HOME:
+                    wanted = 0
+                elif event.key == pygame.K_END:
+                    wanted = len(replay)
+                elif event.key == pygame.K_F3:
+                    hud_visible = not hud_visible
+            elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and \
+                    get_slider_rect().inflate(0, ratio / 2).collidepoint(event.pos):
+                sliding = True
+                wanted = get_slider_ply(replay, event.pos[0])
+            elif event.type == pygame.MOUSEMOTION and sliding:
+                wanted = get_slider_ply(replay, event.pos[0])
+            elif event.type == pygame.MOUSEBUTTONUP:
+                sliding = False
+        wanted = max(0, min(wanted, len(replay)))
+        if wanted != ply:
+            frame_start = time.perf_counter()
+            ply = wanted
+            game = replay.seek(ply)
+            draw_start = time.perf_counter()
+            rects = draw_board(game) + draw_replay_panel(replay)
+            record_frame_time('draw_board', time.perf_counter() - draw_start)
+            record_frame_time('frame', time.perf_counter() - frame_start)
+            pygame.display.update(rects + draw_hud())
+            count_frame()
+        else:
+            pygame.display.update(draw_hud())
     pygame.quit()
-    
 
 
-def draw_board(chess_game, selected_piece=None):
-    """Draws the board of the given game and information"""
-    screen.fill((0, 0, 0))
+def get_slider_rect():
+    """Returns the area of the replay slider, under the side panel."""
+    return pygame.Rect(int(ratio * 10.75), int(screen_height - ratio * 1.25), int(ratio * 4.75), int(ratio / 5))
+
+
+def get_slider_ply(replay, x):
+    """Returns the ply of the replay that the given x position on the slider stands for."""
+    rect = get_slider_rect()
+    return round((x - rect.x) / rect.width * len(replay))
+
+
+def draw_replay_panel(replay):
+    """Draws the ply of the replay out of its length, the move that led to it, the result
+    once the last ply is reached, and the slider. Returns the list of rectangles redrawn."""
+    slider = get_slider_rect()
+    font_size = int(ratio / 3)
+    line_height = get_font(timer_font_name, font_size).get_linesize()
+    area = pygame.Rect(slider.x - int(ratio / 4), slider.y - line_height * 2 - int(ratio / 4),
+                       slider.width + int(ratio / 2), line_height * 2 + slider.height + int(ratio / 2))
+    screen.blit(board_layer, area, area)
+    ply = replay.get_ply()
+    text = 'Ply ' + str(ply) + ' / ' + str(len(replay))
+    move = replay.get_last_move()
+    if move is not None:
+        # The player who made the move is the one not to move now
+        turn = 'Black' if replay.seek(ply)._player_turn == 'White' else 'White'
+        text += '   ' + ' '.join(ChessVar.get_move_notation(move, turn))
+    lines = [text]
+    if ply == len(replay):
+        lines.append({'WHITE_WON': 'White won', 'BLACK_WON': 'Black won', 'DRAW': 'Draw'}.get(
+            replay.get_result(), 'Unfinished'))
+    for number, line in enumerate(lines):
+        screen.blit(render_text(line, timer_font_name, font_size, (220, 220, 220)),
+                    (slider.x, slider.y - line_height * (2 - number) - int(ratio / 8)))
+    pygame.draw.rect(screen, (90, 90, 90), slider, border_radius=int(slider.height / 2))
+    filled = slider.copy()
+    filled.width = int(slider.width * ply / max(1, len(replay)))
+    pygame.draw.rect(screen, falcon_hunter_rectangle_color, filled, border_radius=int(slider.height / 2))
+    pygame.draw.circle(screen, (255, 255, 255), (slider.x + filled.width, slider.centery), slider.height)
+    return [area]
+
+
+def init_display():
+    """Starts pygame and opens the game window. Called by main rather than on import, so the
+    functions in this file can be used without a display."""
+    global screen, clock
+    pygame.init()
+    pygame.font.init()
+    screen = pygame.display.set_mode((screen_width, screen_height))
+    pygame.display.set_caption('Falcon-Hunter Chess')
+    clock = pygame.time.Clock()
 
-    board = chess_game._board
+
+def make_board_layer():
+    """Returns a surface with everything on the screen that never changes: the background,
+    the squares of the board and the background rectangle for the fairy pieces."""
+    layer = pygame.Surface((screen_width, screen_height))
+    layer.fill((0, 0, 0))
 
     # Draws the board
     for row in range(8):
@@ -140,66 +479,268 @@ def draw_board(chess_game, selected_piece=None):
             else:
                 color = white_square_color
             square = pygame.Rect((ratio * (column + 1), screen_height - (ratio * (row + 1.5)), ratio, ratio))
-            pygame.draw.rect(screen, color, square)
+            pygame.draw.rect(layer, color, square)
     # Draws the background rectangle for the fairy pieces
     rectangle = pygame.Rect((ratio * (8 + 1), screen_height - (ratio * (7 + 1.5)), ratio * 1.5, ratio * 8))
-    pygame.draw.rect(screen, falcon_hunter_rectangle_color, rectangle)
+    pygame.draw.rect(layer, falcon_hunter_rectangle_color, rectangle)
+    return layer
+
+
+def get_drawn_pieces(chess_game, selected_square=None, targets=()):
+    """Returns every image to draw as (color, code, x, y): first the highlights on the target
+    squares of the selected piece, then the pieces, with the piece being dragged last so it is
+    drawn on top."""
+    pieces = []
+    dragged = []
+    board = chess_game._board
 
-    # Draws the board pieces
+    # Marks the squares the selected piece can move to
+    for square in targets:
+        row, col = ChessVar.get_board_indexes(square)
+        x, y = get_square_location(row, col)
+        pieces.append(('highlight', '', int(x), int(y)))
+
+    # Finds the board pieces
     for row in range(8):
         for col in range(8):
             piece = board[row][col]
             color = 'w'
             if piece.get_color() == 'Black':
                 color = 'b'
-            code = piece.get_code().lower()
+            code = piece.get_code().strip().lower()
             if '[]' not in code:
-                img = make_image(color, code)
                 # Checks if a piece is currently being dragged from its position
-                if selected_piece == piece and selected_piece is not None and len(find_square_from_mouse()) == 2:
+                if selected_square == ChessVar.get_board_notation(row, col) and len(find_square_from_mouse()) == 2:
                     x, y = pygame.mouse.get_pos()
-                    x -= ratio / 2
-                    y -= ratio / 2
+                    dragged.append((color, code, int(x - ratio / 2), int(y - ratio / 2)))
                 else:
                     x, y = get_square_location(row, col)
-                screen.blit(img, (x, y))
-
-    # Draws the Falcons/Hunters
-    # Messy and repetitive
-    x, y
-    if chess_game._white_hunter == False:
-        if selected_piece == 'H':
-            x, y = pygame.mouse.get_pos()
-            x, y = x - ratio / 2, y - ratio / 2
-        else:
-            x, y = ratio * 9.25, screen_height - (ratio * 1.5)
-        img = make_image('w', 'h')
-        screen.blit(img, (x, y))
-    if chess_game._white_falcon == False:
-        if selected_piece == 'F':
-            x, y = pygame.mouse.get_pos()
-            x, y = x - ratio / 2, y - ratio / 2
-        else:
-            x, y = ratio * 9.25, screen_height - (ratio * 2.5)
-        img = make_image('w', 'f')
-        screen.blit(img, (x, y))
-    if chess_game._black_hunter == False:
-        if selected_piece == 'h':
-            x, y = pygame.mouse.get_pos()
-            x, y = x - ratio / 2, y - ratio / 2
-        else:
-            x, y = ratio * 9.25, screen_height - (ratio * 8.5)
-        img = make_image('b', 'h')
-        screen.blit(img, (x, y))
-    if chess_game._black_falcon == False:
-        if selected_piece == 'f':
-            x, y = pygame.mouse.get_pos()
-            x, y = x - ratio / 2, y - ratio / 2
-        else:
-            x, y = ratio * 9.25, screen_height - (ratio * 7.5)
-        img = make_image('b', 'f')
-        screen.blit(img, (x, y))
-        
+                    pieces.append((color, code, int(x), int(y)))
+
+    # Finds the Falcons/Hunters that have not been entered yet, with their place in the panel
+    reserve = ((chess_game._white_hunter, 'H', 'w', 1.5), (chess_game._white_falcon, 'F', 'w', 2.5),
+               (chess_game._black_hunter, 'h', 'b', 8.5), (chess_game._black_falcon, 'f', 'b', 7.5))
+    for used, letter, color, rows_up in reserve:
+        if used == False:
+            if selected_square == letter:
+                x, y = pygame.mouse.get_pos()
+                dragged.append((color, letter.lower(), int(x - ratio / 2), int(y - ratio / 2)))
+            else:
+                pieces.append((color, letter.lower(), int(ratio * 9.25), int(screen_height - (ratio * rows_up))))
+    return pieces + dragged
+
+
+def draw_board(chess_game, selected_square=None, targets=()):
+    """Draws the board of the given game and information, highlighting the given target
+    squares. Only the areas where a piece appeared, disappeared or moved since the last call
+    are repainted, and their rectangles are returned to be passed to pygame.display.update."""
+    global board_layer, drawn_pieces
+    if board_layer is None:
+        board_layer = make_board_layer()
+    pieces = get_drawn_pieces(chess_game, selected_square, targets)
+
+    if drawn_pieces is None:
+        screen.blit(board_layer, (0, 0))
+        for color, code, x, y in pieces:
+            screen.blit(get_drawn_image(color, code), (x, y))
+        drawn_pieces = pieces
+        return [screen.get_rect()]
+
+    # The squares under every piece that changed get the board layer drawn back over them,
+    # then every piece that overlaps them is drawn again in order
+    changed = set(drawn_pieces).symmetric_difference(pieces)
+    dirty_rects = [pygame.Rect(x, y, ratio, ratio) for color, code, x, y in changed]
+    drawn_pieces = pieces
+    for rect in dirty_rects:
+        cover_with_board(rect)
+    forget_covered_overlays(dirty_rects)
+    return dirty_rects
+
+
+def cover_with_board(rect):
+    """Draws the board layer back over rect with the pieces last drawn there on top, so
+    covering up a timer or overlay does not cut a piece being dragged over it."""
+    screen.set_clip(rect)
+    screen.blit(board_layer, rect, rect)
+    for color, code, x, y in drawn_pieces or ():
+        if rect.colliderect((x, y, ratio, ratio)):
+            screen.blit(get_drawn_image(color, code), (x, y))
+    screen.set_clip(None)
+
+
+def forget_covered_overlays(rects):
+    """Makes the next draw_timer, draw_analysis and draw_hud calls repaint the timers, analysis
+    and performance overlay if the given rectangles, just covered with the board layer (like
+    under a falcon/hunter being dragged over the side panel), overlap them."""
+    global drawn_analysis, hud_next_draw
+    for position, (text, rect) in drawn_timers.items():
+        if rect.collidelist(rects) != -1:
+            drawn_timers[position] = (None, rect)
+    if drawn_analysis is not None and drawn_analysis[1].collidelist(rects) != -1:
+        drawn_analysis = None
+    if hud_rect is not None and hud_rect.collidelist(rects) != -1:
+        hud_next_draw = 0.0
+
+
+def redraw_everything():
+    """Makes the next draw_board and manage_timers calls repaint the whole screen, for after
+    something else (like the end game menu) has been drawn over it."""
+    global drawn_pieces, hud_next_draw, drawn_analysis
+    drawn_pieces = None
+    drawn_timers.clear()
+    drawn_analysis = None
+    hud_next_draw = 0.0
+
+
+def post_network_message(message):
+    """Passes a message from the game server (called from the client's reader thread) to
+    the main loop as a NETWORK_EVENT."""
+    pygame.event.post(pygame.event.Event(NETWORK_EVENT, message=message))
+
+
+def start_engine_move(engine, chess_game, time_left, moves_to_go=30):
+    """Starts the engine choosing a move for the given game in a background thread, so the
+    window keeps responding while it thinks, and returns (thread, stop event). The move is
+    posted to the main loop as an ENGINE_EVENT, unless the stop event is set first."""
+    # The search plays moves on the game it is given, so it gets a copy with the same history
+    # (which it needs to see repetitions)
+    game = GameRecord.replay(chess_game.get_move_history())
+    stop = threading.Event()
+
+    def think():
+        move = engine.choose_move(game, time_left, moves_to_go, should_stop=stop.is_set)
+        if not stop.is_set():
+            pygame.event.post(pygame.event.Event(ENGINE_EVENT, move=move, game=chess_game))
+
+    thread = threading.Thread(target=think, daemon=True)
+    thread.start()
+    return thread, stop
+
+
+def stop_engine_move(search):
+    """Stops a search started by start_engine_move and waits for its thread to end."""
+    thread, stop = search
+    stop.set()
+    thread.join()
+
+
+def post_ponder_result(result):
+    """Passes a result from the background analysis (called from the ponderer's reader
+    thread) to the main loop as a PONDER_EVENT."""
+    pygame.event.post(pygame.event.Event(PONDER_EVENT, result=result))
+
+
+def get_analysis_lines(analysis):
+    """Returns the lines of text shown for a result of the background analysis: the score
+    from white's side in pawns (or the moves to a forced mate) with the depth, and the best
+    line in two rows."""
+    if analysis is None:
+        return ('Analysing...',)
+    score = analysis['score'] if analysis['turn'] == 'White' else -analysis['score']
+    if abs(score) > Engine.MATE_THRESHOLD:
+        moves_to_mate = (Engine.MATE_SCORE - abs(score) + 1) // 2
+        text = ('+' if score > 0 else '-') + 'M' + str(moves_to_mate)
+    else:
+        text = '%+.2f' % (score / 100)
+    turn = analysis['turn']
+    line = []
+    for move in analysis['pv']:
+        line.append(''.join(ChessVar.get_move_notation(move, turn)))
+        turn = 'Black' if turn == 'White' else 'White'
+    return (text + '  depth ' + str(analysis['depth']), ' '.join(line[:4]), ' '.join(line[4:8]))
+
+
+def draw_analysis(analysis):
+    """Draws the background analysis in the side panel between the timers if it changed
+    since it was last drawn. Returns the list of rectangles that were redrawn."""
+    global drawn_analysis
+    lines = get_analysis_lines(analysis)
+    if drawn_analysis is not None and drawn_analysis[0] == lines:
+        return []
+    font_size = int(ratio / 3)
+    line_height = get_font(timer_font_name, font_size).get_linesize()
+    rect = pygame.Rect(int(ratio * 10.75), int(screen_height - ratio * 5), int(ratio * 5.1), line_height * 3)
+    cover_with_board(rect)
+    for number, text in enumerate(lines):
+        # Best lines change all the time, so they are rendered directly instead of cached
+        surface = get_font(timer_font_name, font_size).render(text, True, (220, 220, 220))
+        screen.blit(surface, (rect.x, rect.y + number * line_height))
+    drawn_analysis = (lines, rect)
+    return [rect]
+
+
+def record_frame_time(name, seconds):
+    """Keeps how long the named part of the frame took for the performance overlay, and
+    adds it to the Profiling numbers when those are being collected."""
+    hud_timings[name] = seconds
+    if Profiling.is_enabled():
+        Profiling.record('Board.' + name, seconds)
+
+
+def count_frame():
+    """Counts a finished frame toward the frames per second shown on the overlay."""
+    now = time.perf_counter()
+    hud_frames[1] += 1
+    if now - hud_frames[0] >= 1:
+        hud_frames[2] = hud_frames[1] / (now - hud_frames[0])
+        hud_frames[0], hud_frames[1] = now, 0
+
+
+def draw_hud():
+    """Draws the performance overlay in the top right corner, at most four times a second so
+    it stays readable, or covers it back up once it has been hidden. Returns the list of
+    rectangles that were redrawn."""
+    global hud_next_draw, hud_rect
+    now = time.perf_counter()
+    if not hud_visible:
+        if hud_rect is None:
+            return []
+        rect, hud_rect = hud_rect, None
+        cover_with_board(rect)
+        return [rect]
+    if now < hud_next_draw:
+        return []
+    hud_next_draw = now + 0.25
+    lines = ['frame %.2f ms' % (hud_timings.get('frame', 0) * 1000),
+             'draw_board %.2f ms' % (hud_timings.get('draw_board', 0) * 1000),
+             'manage_timers %.2f ms' % (hud_timings.get('manage_timers', 0) * 1000),
+             'events %.2f ms' % (hud_timings.get('events', 0) * 1000),
+             'fps %.0f / %d' % (hud_frames[2], fps)]
+    # The numbers change every time, so they are rendered directly instead of through the
+    # render_text cache
+    font = get_font(hud_font_name, int(ratio / 4))
+    line_height = font.get_linesize()
+    rect = pygame.Rect(int(ratio * 12.5), 4, int(ratio * 3.4), line_height * len(lines) + 8)
+    if hud_rect is not None:
+        rect = rect.union(hud_rect)
+    cover_with_board(rect)
+    for number, line in enumerate(lines):
+        screen.blit(font.render(line, True, (200, 255, 200)), (rect.x + 4, 8 + number * line_height))
+    hud_rect = rect
+    return [rect]
+
+
+def get_events(dragging, timeout=None):
+    """Returns the events to handle this frame. While a piece is being dragged, the loop runs
+    at fps frames a second. Otherwise it sleeps until an event arrives or timeout milliseconds
+    pass (forever if timeout is None), so an idle board uses no CPU."""
+    if dragging:
+        clock.tick(fps)
+        return pygame.event.get()
+    if timeout is None:
+        event = pygame.event.wait()
+    elif timeout <= 0:
+        return pygame.event.get()
+    else:
+        event = pygame.event.wait(timeout)
+    return [event] + pygame.event.get()
+
+
+def time_until_timer_changes(time_left):
+    """Returns the number of milliseconds until the shown (whole second) value of a timer
+    with the given time left changes."""
+    return max(1, int((time_left - int(time_left)) * 1000) + 1)
+
 
 def find_square_from_mouse():
     """Returns what square the mouse is on, or if it's somewhere else"""
@@ -226,7 +767,8 @@ def get_square_location(row, column):
     return (x, y)
 
 def player_wins(game):
-    """Handles behavior when the game finishes and is won by a player."""
+    """Handles behavior when the game finishes and is won by a player. Returns True if the
+    players want to play again and False if they want to quit."""
 
     # Add winner screen at some point
     winner = game.get_game_state()
@@ -236,50 +778,74 @@ def player_wins(game):
     button_list = []
     button_list.append(make_basic_button((screen_width / 2) - ratio * 2, (screen_height / 2) - 2 * ratio, ratio * 4, ratio * 2, 'PLAY AGAIN'))
     button_list.append(make_basic_button((screen_width / 2) - ratio * 2, (screen_height / 2) - 0 * ratio, ratio * 4, ratio * 2, 'QUIT'))
-    run = True
-    
-    while run:
-        for event in pygame.event.get():
-            # Checks whether the X in the top right is clicked
-            if event.type == pygame.QUIT:
-                pygame.quit()
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_position = find_menu_mouse_position(button_list)
-                if mouse_position == 'QUIT':
-                    pygame.quit()
-                elif mouse_position == 'PLAY AGAIN':
-                    run = False  
-        
-        pygame.display.update()
+    pygame.display.update()
+
+    # Nothing on the menu changes, so it sleeps until the next event instead of redrawing
+    while True:
+        event = pygame.event.wait()
+        # Checks whether the X in the top right is clicked
+        if event.type == pygame.QUIT:
+            return False
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            mouse_position = find_menu_mouse_position(button_list)
+            if mouse_position == 'QUIT':
+                return False
+            elif mouse_position == 'PLAY AGAIN':
+                break
     print('Through')
     screen.fill((0, 0, 0))
+    redraw_everything()
+    return True
 
 def make_image(color, code):
-    """Initializes image of pieces with the given color and piece code"""
-    code = code.lower()
-    dir = os.path.dirname(os.path.realpath(__file__))
-    location = dir.strip() + "\\ChessPieces\\".strip() + color.strip() + code.strip() + '.png'.strip()
-    img = pygame.image.load(location).convert_alpha()
-    img = pygame.transform.scale(img, (ratio, ratio))
+    """Returns the image of the piece with the given color and piece code, scaled to the size
+    of a square. Each image is loaded from disk and scaled only once, then reused."""
+    code = code.strip().lower()
+    key = (color, code, ratio)
+    img = piece_images.get(key)
+    if img is None:
+        dir = os.path.dirname(os.path.realpath(__file__))
+        location = os.path.join(dir, 'ChessPieces', color + code + '.png')
+        img = pygame.image.load(location).convert_alpha()
+        img = pygame.transform.scale(img, (ratio, ratio))
+        piece_images[key] = img
     return img
 
+def get_drawn_image(color, code):
+    """Returns the image for an entry of get_drawn_pieces, which is a piece image or, for the
+    'highlight' color, the marker drawn on a square the selected piece can move to."""
+    if color != 'highlight':
+        return make_image(color, code)
+    key = (color, code, ratio)
+    img = piece_images.get(key)
+    if img is None:
+        img = pygame.Surface((ratio, ratio), pygame.SRCALPHA)
+        pygame.draw.circle(img, highlight_color, (ratio / 2, ratio / 2), ratio / 6)
+        piece_images[key] = img
+    return img
+
+def load_piece_images():
+    """Loads and scales every piece image ahead of time so the first frames do not stall."""
+    for color in 'wb':
+        for code in 'kqbnrpfh':
+            make_image(color, code)
+
 def get_sound(name):
     """Initializes sounds with given name"""
     dir = os.path.dirname(os.path.realpath(__file__))
-    location = dir.strip() + "\\Sounds\\".strip() + name.strip() + '.mp3'.strip()
+    location = os.path.join(dir, 'Sounds', name.strip() + '.mp3')
     sound = pygame.mixer.Sound(location)
     return sound
 
 def manage_timers(player_turn, time_of_last_frame, white_timer, black_timer):
+    """Counts down the timer of the player whose turn it is and draws both timers. Returns the
+    time of this frame, both timers, and the rectangles of the screen that were redrawn."""
     # Finds the time elapsed since previous frame
     time_since_last_frame = pygame.time.get_ticks() - time_of_last_frame
-    font = pygame.font.SysFont('Noto Sans', int(ratio * 1.5))
-
-    white_timer_text = font.render(str(int(white_timer)), False, (255, 255, 255))
-    screen.blit(white_timer_text, (ratio * 12, screen_height - (ratio * 3)))
 
-    black_timer_text = font.render(str(int(black_timer)), False, (255, 255, 255))
-    screen.blit(black_timer_text, (ratio * 12, screen_height - (ratio * 7)))
+    rects = []
+    rects += draw_timer(white_timer, (ratio * 12, screen_height - (ratio * 3)))
+    rects += draw_timer(black_timer, (ratio * 12, screen_height - (ratio * 7)))
 
     # Checks which player's turn is currently ongoing
     if player_turn == 'White':
@@ -287,7 +853,43 @@ def manage_timers(player_turn, time_of_last_frame, white_timer, black_timer):
     else:
         black_timer -= time_since_last_frame / 1000
 
-    return pygame.time.get_ticks(), white_timer, black_timer
+    return pygame.time.get_ticks(), white_timer, black_timer, rects
+
+
+def draw_timer(time_left, position):
+    """Draws the time left at the given position if the shown number changed since it was
+    last drawn. Returns the list of rectangles that were redrawn."""
+    text = str(int(time_left))
+    drawn = drawn_timers.get(position)
+    if drawn is not None and drawn[0] == text:
+        return []
+    text_surface = render_text(text, timer_font_name, int(ratio * 1.5))
+    rect = text_surface.get_rect(topleft=position)
+    if drawn is not None:
+        # Covers the old number with the board layer, since the new one may be narrower
+        cover_with_board(drawn[1])
+        rect = rect.union(drawn[1])
+    screen.blit(text_surface, position)
+    drawn_timers[position] = (text, text_surface.get_rect(topleft=position))
+    return [rect]
+
+
+def get_font(name, size):
+    """Returns the system font with the given name and size, only looking it up and loading
+    it the first time it is asked for."""
+    font = fonts.get((name, size))
+    if font is None:
+        font = pygame.font.SysFont(name, size)
+        fonts[(name, size)] = font
+    return font
+
+
+@functools.lru_cache(maxsize=256)
+def render_text(text, font_name, size, color=(255, 255, 255)):
+    """Returns a surface with the text rendered in the given font, size and color. The most
+    recently used surfaces are kept, so timer digits and button labels are only rendered
+    once. The returned surface is shared and must not be drawn on."""
+    return get_font(font_name, size).render(text, False, color)
 
 
 def make_rectangle_with_border(x, y, x_width, y_width, width, inside_color, border_color):
@@ -301,8 +903,7 @@ def make_basic_button(x, y, x_width, y_width, text):
     # Hacky solution that works for now
     make_rectangle_with_border(x, y, x_width, y_width, 5, (50, 50, 50), (255, 255, 255))
     font_size = min(int(x_width / 4.8), int(y_width / 3))
-    font = pygame.font.SysFont('Aerial', font_size)
-    text_surface = font.render(text, False, (255, 255, 255))
+    text_surface = render_text(text, button_font_name, font_size)
     text_rect = text_surface.get_rect(center = (x + (x_width / 2), y + (y_width / 2)))
     screen.blit(text_surface, text_rect)
     return x, y, x_width, y_width, text
@@ -319,6 +920,31 @@ def find_menu_mouse_position(button_info):
     return None
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Falcon-Hunter Chess')
+    parser.add_argument('--engine', choices=['White', 'Black'], default=None,
+                        help='lets the computer play the given color')
+    parser.add_argument('--record', default=None, help='game archive finished games are appended to')
+    parser.add_argument('--profile', default=None,
+                        help='measures the game and writes the numbers to this JSON file on quitting')
+    parser.add_argument('--ponder', action='store_true',
+                        help='analyses the position in the background and shows the best line')
+    parser.add_argument('--connect', default=None, metavar='HOST:PORT',
+                        help='plays online against a game server started with Server.py')
+    parser.add_argument('--replay', default=None, metavar='ARCHIVE',
+                        help='steps through a game recorded in this game archive (see --record)')
+    parser.add_argument('--game', type=int, default=None,
+                        help='with --connect, joins this game instead of starting a new one; '
+                             'with --replay, the game to show, counting from 0')
+    args = parser.parse_args()
+    if args.replay is not None:
+        replay_main(args.replay, args.game or 0)
+        raise SystemExit
+    server_address = None
+    if args.connect is not None:
+        if args.engine is not None:
+            parser.error('--engine cannot be used with --connect')
+        host, _, port = args.connect.rpartition(':')
+        server_address = (host or '127.0.0.1', int(port))
+    main(args.engine, args.record, args.profile, server_address, args.game, args.ponder)
 
 
@@ -4,123 +4,788 @@
 # Description: Class contains functionality to run a special variant of chess. Contains
 #              classes including a ChessVar which runs the board and keeps track of the
 #              pieces, and classes related to all of the pieces and an EmptySquare class
-#              for squares that are empty.
+#              for squares that are empty. There is only one object of each piece class per
+#              color, shared by every board, since where a piece stands is kept by the board.
 
 
 # This was not originally designed to have a visible board attached to it
 
+from array import array
+import random
+
+
+# Integer codes for the pieces stored in the board array. White pieces are positive,
+# black pieces are negative and 0 is an empty square.
+EMPTY = 0
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, FALCON, HUNTER = range(1, 9)
+
+# Converts a piece letter (uppercase for white, lowercase for black) to its code
+PIECE_CODES = {'P': PAWN, 'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING,
+               'F': FALCON, 'H': HUNTER, 'E': EMPTY}
+PIECE_CODES.update({letter.lower(): -code for letter, code in PIECE_CODES.items()})
+
+# Converts a piece code back to its letter, and to the printable version given by get_code()
+PIECE_LETTERS = {code: letter for letter, code in PIECE_CODES.items()}
+PIECE_KEYS = {code: ' ' + letter + ' ' for code, letter in PIECE_LETTERS.items()}
+PIECE_KEYS[EMPTY] = ' []'
+
+# Row and column steps for each direction a piece can slide or step in
+NORTH, SOUTH, EAST, WEST, NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST = range(8)
+DIRECTION_STEPS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+KNIGHT_STEPS = ((2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1))
+
+
+def _build_jump_table(steps):
+    """Returns a table with the tuple of squares reachable from each square by the given steps."""
+    table = []
+    for square in range(64):
+        row, column = square >> 3, square & 7
+        table.append(tuple((row + row_mod) * 8 + column + col_mod for row_mod, col_mod in steps
+                           if 0 <= row + row_mod < 8 and 0 <= column + col_mod < 8))
+    return tuple(table)
+
+
+def _build_ray_table():
+    """Returns a table with, for each square and direction, the tuple of squares a slider
+    passes through going that way, nearest first."""
+    table = []
+    for square in range(64):
+        rays = []
+        for row_mod, col_mod in DIRECTION_STEPS:
+            ray = []
+            row, column = (square >> 3) + row_mod, (square & 7) + col_mod
+            while 0 <= row < 8 and 0 <= column < 8:
+                ray.append(row * 8 + column)
+                row, column = row + row_mod, column + col_mod
+            rays.append(tuple(ray))
+        table.append(tuple(rays))
+    return tuple(table)
+
+
+KNIGHT_JUMPS = _build_jump_table(KNIGHT_STEPS)
+KING_JUMPS = _build_jump_table(DIRECTION_STEPS)
+RAYS = _build_ray_table()
+
+# The same jumps as bitmasks, so checking a single move is one shift
+KNIGHT_MASKS = tuple(sum(1 << target for target in targets) for targets in KNIGHT_JUMPS)
+KING_MASKS = tuple(sum(1 << target for target in targets) for targets in KING_JUMPS)
+
+# Board notation of each square index, and the square index of each notation in either case
+SQUARE_NAMES = tuple(chr(65 + (square & 7)) + str((square >> 3) + 1) for square in range(64))
+SQUARE_INDEXES = {name: square for square, name in enumerate(SQUARE_NAMES)}
+SQUARE_INDEXES.update({name.lower(): square for square, name in enumerate(SQUARE_NAMES)})
+
+# For every pair of squares, at index (origin << 6) | target: the direction going from origin
+# to target in a straight or diagonal line (-1 if they are not on one), and the squares between
+LINE_DIRECTIONS = array('b', [-1] * 4096)
+SQUARES_BETWEEN = [()] * 4096
+for _origin in range(64):
+    for _direction in range(8):
+        _ray = RAYS[_origin][_direction]
+        for _distance, _target in enumerate(_ray):
+            LINE_DIRECTIONS[_origin << 6 | _target] = _direction
+            SQUARES_BETWEEN[_origin << 6 | _target] = _ray[:_distance]
+SQUARES_BETWEEN = tuple(SQUARES_BETWEEN)
+
+# Directions each slider may move in, by signed piece code. The falcon moves like a bishop
+# forward and a rook backward, and the hunter the other way round, so these depend on color.
+SLIDER_DIRECTIONS = {
+    BISHOP: (NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST),
+    ROOK: (NORTH, SOUTH, EAST, WEST),
+    QUEEN: (NORTH, SOUTH, EAST, WEST, NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST),
+    FALCON: (NORTH_EAST, NORTH_WEST, SOUTH),
+    -FALCON: (SOUTH_EAST, SOUTH_WEST, NORTH),
+    HUNTER: (NORTH, SOUTH_EAST, SOUTH_WEST),
+    -HUNTER: (SOUTH, NORTH_EAST, NORTH_WEST),
+}
+SLIDER_DIRECTIONS[-BISHOP] = SLIDER_DIRECTIONS[BISHOP]
+SLIDER_DIRECTIONS[-ROOK] = SLIDER_DIRECTIONS[ROOK]
+SLIDER_DIRECTIONS[-QUEEN] = SLIDER_DIRECTIONS[QUEEN]
+# The same directions as bitmasks of direction numbers
+SLIDER_DIRECTION_MASKS = {piece: sum(1 << direction for direction in directions)
+                          for piece, directions in SLIDER_DIRECTIONS.items()}
+
+# For each slider code, the rays it moves along from each square
+SLIDER_RAYS = {piece: tuple(tuple(RAYS[square][direction] for direction in directions)
+                            for square in range(64))
+               for piece, directions in SLIDER_DIRECTIONS.items()}
+# Slider direction mask of every signed piece code at index piece + 8, 0 for the other pieces
+SLIDER_MASKS_BY_CODE = tuple(SLIDER_DIRECTION_MASKS.get(code, 0) for code in range(-8, 9))
+# The direction pointing back the other way, for each direction
+OPPOSITE_DIRECTIONS = (SOUTH, NORTH, WEST, EAST, SOUTH_WEST, SOUTH_EAST, NORTH_WEST, NORTH_EAST)
+
+# Squares a pawn of each color takes on from each square, with white being 1 and black -1
+PAWN_CAPTURES = {1: _build_jump_table(((1, 1), (1, -1))), -1: _build_jump_table(((-1, 1), (-1, -1)))}
+
+# Moves are packed into an integer: the origin square in the low 6 bits, the target square in
+# the next 6 bits and, for fairy piece drops, the dropped piece code (FALCON/HUNTER) above that.
+# A drop uses its target square as the origin square as well.
+MOVE_TARGET_SHIFT = 6
+MOVE_DROP_SHIFT = 12
+
+# Random 64-bit keys used to build the Zobrist hash of a position. The seed is fixed so every
+# process gives the same position the same hash.
+_zobrist_random = random.Random(0x46616C636F6E)
+# One key per signed piece code and square, at index ((piece + 8) << 6) | square. Empty squares
+# get 0 so a move onto an empty square needs no special case.
+ZOBRIST_PIECES = [0 if index >> 6 == 8 else _zobrist_random.getrandbits(64) for index in range(17 * 64)]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+# One key per signed falcon/hunter code for when that fairy piece has been entered, at piece + 8
+ZOBRIST_FAIRY_USED = [_zobrist_random.getrandbits(64) for _ in range(17)]
+# One key per pieces lost count for each color, with white at index 0 and black at index 1
+ZOBRIST_PIECES_LOST = ([_zobrist_random.getrandbits(64) for _ in range(32)],
+                       [_zobrist_random.getrandbits(64) for _ in range(32)])
+
+# Value of each piece kind in centipawns, indexed by the absolute value of the piece code
+PIECE_VALUES = (0, 100, 300, 320, 500, 900, 20000, 450, 450)
+# Value of a falcon/hunter that has not been entered yet, since it can still be dropped later.
+# It is worth a little more once a piece has been lost, as it can then be dropped right away.
+RESERVE_VALUE = 250
+DROPPABLE_RESERVE_VALUE = 300
+# Value of a color's fairy pieces in reserve, at [number not entered][pieces lost, up to 2]
+RESERVE_SCORES = tuple(tuple(min(unused, lost) * DROPPABLE_RESERVE_VALUE + (unused - min(unused, lost)) * RESERVE_VALUE
+                             for lost in range(3)) for unused in range(3))
+
+
+def _build_mobility_bonus(piece, weight):
+    """Returns a bonus for each square of weight centipawns for every square more (or less)
+    than on average that the white piece reaches from there on an empty board."""
+    if piece == KNIGHT:
+        reach = [len(targets) for targets in KNIGHT_JUMPS]
+    else:
+        reach = [sum(len(ray) for ray in rays) for rays in SLIDER_RAYS[piece]]
+    average = sum(reach) / 64
+    return tuple(round(weight * (count - average)) for count in reach)
+
+
+# Bonus of each white piece kind on each square, from A1 to H8. Pawns are worth more as they
+# advance and in the center, the king is safer at the back and on the sides, rooks like the
+# seventh row, and the other pieces are worth more where they reach more squares. The falcon and hunter reach furthest
+# where their long moves forward or backward still have room.
+PIECE_SQUARE_BONUS = {
+    PAWN: tuple((0, 0, 5, 10, 20, 30, 40, 0)[square >> 3] + (10 if square >> 3 in (3, 4) and square & 7 in (3, 4) else 0)
+                for square in range(64)),
+    KNIGHT: _build_mobility_bonus(KNIGHT, 4),
+    BISHOP: _build_mobility_bonus(BISHOP, 3),
+    ROOK: tuple(15 if square >> 3 == 6 else 0 for square in range(64)),
+    QUEEN: _build_mobility_bonus(QUEEN, 1),
+    KING: tuple(-15 * (square >> 3) + (10, 15, 5, 0, 0, 5, 15, 10)[square & 7] for square in range(64)),
+    FALCON: _build_mobility_bonus(FALCON, 4),
+    HUNTER: _build_mobility_bonus(HUNTER, 4),
+}
+# Value of each signed piece code on each square, at index ((piece + 8) << 6) | square, from
+# white's side: black pieces count against white and use the bonus of the square mirrored
+# top to bottom. Empty squares are worth 0 so a move onto an empty square needs no special case.
+PIECE_SQUARE_VALUES = [0] * (17 * 64)
+for _piece, _bonus in PIECE_SQUARE_BONUS.items():
+    for _square in range(64):
+        PIECE_SQUARE_VALUES[(_piece + 8) << 6 | _square] = PIECE_VALUES[_piece] + _bonus[_square]
+        PIECE_SQUARE_VALUES[(8 - _piece) << 6 | _square] = -PIECE_VALUES[_piece] - _bonus[_square ^ 56]
+
+# Positions are saved as text in a format like FEN, with five fields separated by spaces:
+#   placement     the rows from 8 down to 1 separated by '/', each with its pieces from the A
+#                 column to the H column as letters (PNBRQKFH, uppercase for white) and runs
+#                 of empty squares as digits
+#   turn          'w' or 'b' for the player whose turn it is
+#   reserves      the falcons/hunters that have not been entered yet out of 'FHfh', or '-'
+#   pieces lost   the white and black pieces lost counters, like '1/0'
+#   first moves   the bitmask of pawns that have not moved yet (see _first_moves), in lowercase
+#                 hex. Only pawns on their starting row can be in it.
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w FHfh 0/0 ff00000000ff00'
+# Turns the digits of a placement into that many '.' characters, one per square
+_FEN_EXPAND = str.maketrans({str(count): '.' * count for count in range(1, 9)})
+# Byte translation tables between placement characters and the bytes of the board array
+# (piece codes modulo 256). Characters that are not pieces become _FEN_BAD.
+_FEN_BAD = 127
+_FEN_TO_CODES = bytearray([_FEN_BAD]) * 256
+_FEN_TO_CODES[ord('.')] = EMPTY
+_CODES_TO_FEN = bytearray(b'?') * 256
+_CODES_TO_FEN[EMPTY] = ord('.')
+for _letter, _code in PIECE_CODES.items():
+    if _code != EMPTY:
+        _FEN_TO_CODES[ord(_letter)] = _code & 255
+        _CODES_TO_FEN[_code & 255] = ord(_letter)
+_FEN_TO_CODES, _CODES_TO_FEN = bytes(_FEN_TO_CODES), bytes(_CODES_TO_FEN)
+# The digits allowed in the pieces lost counters and the first moves bitmask
+_FEN_DECIMAL = '0123456789'
+_FEN_HEXADECIMAL = '0123456789abcdef'
+# The reserves fields get_fen writes: the letters of 'FHfh' still to be entered, in that
+# order, or '-' when there are none
+_FEN_RESERVES = frozenset(''.join([letter for bit, letter in enumerate('FHfh') if mask >> bit & 1]) or '-'
+                          for mask in range(16))
+# Runs of empty squares and their digit, longest first
+_FEN_RUNS = tuple(('.' * count, str(count)) for count in range(8, 0, -1))
+
+
 class ChessVar:
     """Contains functions that are able to run a special variant of chess, keep track
     of the board, and decide when someone wins the game. Works with all of the piece classes,
     as well as an EmptySquare class, which are the pieces that are actually on the board."""
+    # Keeps a game to its fixed set of fields instead of a dictionary per game, since many
+    # games can be held at once by the server or during analysis
+    __slots__ = ('_player_turn', '_squares', '_first_moves', '_move_stack', '_hash', '_position_counts',
+                 '_score', '_attacks', '_king_squares', '_game_state', '_state_checked_hash',
+                 '_white_falcon', '_white_hunter', '_black_falcon', '_black_hunter',
+                 '_white_pieces_lost', '_black_pieces_lost')
+
     def __init__(self):
         self._player_turn = 'White'
-        self._board = None
-        self.initialize_board()
+        # One piece code per square, with A1 at index 0 and H8 at index 63
+        self._squares = None
+        # Bitmask of the squares holding pawns that have not moved yet
+        self._first_moves = 0
+        # Information needed to take back each move played with push_move, latest last
+        self._move_stack = []
+        # Zobrist hash of the position, and how many times each hash has come up this game
+        self._hash = 0
+        self._position_counts = {}
+        # Static evaluation of the position from white's side (see get_score), kept up to date
+        # by push_move and pop_move
+        self._score = 0
+        # How many pieces of each color attack each square, with white at index 0 and black
+        # at index 1. Kept up to date by push_move, and by pop_move undoing its changes.
+        self._attacks = None
+        # Square of each color's king, with white at index 0 and black at index 1
+        self._king_squares = [-1, -1]
         self._game_state = 'UNFINISHED'
+        # Hash of the last position checked for checkmate/stalemate by get_game_state
+        self._state_checked_hash = None
         # Keeps track of whether each side has used their falcon/hunter or not
         self._white_falcon, self._white_hunter = False, False
         self._black_falcon, self._black_hunter = False, False
         self._white_pieces_lost = 0
         self._black_pieces_lost = 0
+        self.initialize_board()
 
     def get_game_state(self):
-        """Returns whether if the game is over, and if so, who won the game."""
+        """Returns whether if the game is over, and if so, who won the game: 'UNFINISHED',
+        'WHITE_WON', 'BLACK_WON', or 'DRAW' after a stalemate. A player who has no legal move
+        while in check is checkmated. Each position is only looked at once."""
+        if self._game_state == 'UNFINISHED' and self._state_checked_hash != self._hash:
+            moves = self.generate_moves()
+            self._state_checked_hash = self._hash
+            if not moves:
+                if not self.is_in_check():
+                    self._game_state = 'DRAW'
+                elif self._player_turn == 'White':
+                    self._game_state = 'BLACK_WON'
+                else:
+                    self._game_state = 'WHITE_WON'
         return self._game_state
 
+    @property
+    def _board(self):
+        """Returns the board as a list of rows of piece objects. Kept so code written
+        for the old object board (like Board.py) keeps working. The rows hold the shared
+        piece objects, so making them only costs the lists."""
+        squares = self._squares
+        return [[PIECE_OBJECTS[code] for code in squares[row:row + 8]] for row in range(0, 64, 8)]
+
     def make_move(self, moved_from, moved_to):
         """Takes a square the piece will move from and the target square,
         and executes the move if it is deemed legal, returning True in the process
         while updating the player turn. If not, then returns False"""
-        moved_from, moved_to = moved_from.upper(), moved_to.upper()
-        if moved_from == moved_to or self.get_game_state() != 'UNFINISHED':
+        if self.get_game_state() != 'UNFINISHED':
             return False
-        to_row, to_col = get_board_indexes(moved_to)
-        from_row, from_col = get_board_indexes(moved_from)
+        origin = SQUARE_INDEXES.get(moved_from)
+        target = SQUARE_INDEXES.get(moved_to)
         # Checks to see if the inputted board squares are valid
-        if not (is_on_board(to_row, to_col) and is_on_board(from_row, from_col)):
+        if origin is None or target is None or origin == target:
             return False
 
-        moved_object = self.search_square(moved_from)
-        removed_object = self.search_square(moved_to)
-        if moved_object.get_color() is not self._player_turn:  # Player must move pieces of their own color
+        squares = self._squares
+        piece = squares[origin]
+        # Player must move pieces of their own color
+        if (piece > 0) is not (self._player_turn == 'White') or piece == EMPTY:
             return False
-        if not moved_object.is_legal_move(self, moved_to):  # Looks for legal moves for each piece
+        if not MOVE_RULES[abs(piece)](self, origin, target):  # Looks for legal moves for each piece
             return False
-        moved_object.set_position(moved_to)
-        self._board[to_row][to_col] = moved_object
-        self._board[from_row][from_col] = self.make_new_piece('E', moved_from)
-        # Adds to the taken pieces for each color for tracking
-        if removed_object.get_code() != " []" and removed_object.get_code().upper() != " P ":
-            if self._player_turn == "White":
-                self._black_pieces_lost += 1
-            else:
-                self._white_pieces_lost += 1
-            # Updates whether either player won the game
-            if removed_object.get_code() == ' K ':
-                self._game_state = 'BLACK_WON'
-            elif removed_object.get_code() == ' k ':
-                self._game_state = 'WHITE_WON'
-
-        self.update_player_turn()
-
-        return True
+        # A move may not leave the player's own king attacked
+        return self._push_if_safe(origin | target << MOVE_TARGET_SHIFT)
     
     def set_game_state(self, state):
         self._game_state = state
 
+    def push_move(self, move):
+        """Plays a move packed by encode_move (normally one from generate_moves) without
+        checking whether it is legal. Updates the board, the player turn, the pieces lost
+        counters, the falcon/hunter flags, the attack counts and the game state in place, and
+        saves what is needed to take the move back with pop_move."""
+        squares = self._squares
+        origin = move & 63
+        target = move >> MOVE_TARGET_SHIFT & 63
+        drop = move >> MOVE_DROP_SHIFT
+        captured = squares[target]
+        self._move_stack.append((move, captured, self._first_moves, self._white_pieces_lost,
+                                 self._black_pieces_lost, self._game_state, self._hash, self._score))
+        # The hash is updated by removing the keys of what changes and adding the new ones
+        key = self._hash ^ ZOBRIST_BLACK_TO_MOVE
+        # The score is updated the same way, with the reserve values only changing when a
+        # fairy piece is entered or a piece other than a pawn is lost
+        score = self._score
+        if self._player_turn == 'White':
+            if drop:
+                reserve = self._get_reserve_score()
+                self._place_piece(target, drop)
+                key ^= ZOBRIST_PIECES[(drop + 8) << 6 | target] ^ ZOBRIST_FAIRY_USED[drop + 8] ^ \
+                    ZOBRIST_PIECES_LOST[0][self._white_pieces_lost] ^ \
+                    ZOBRIST_PIECES_LOST[0][self._white_pieces_lost - 1]
+                self._white_pieces_lost -= 1  # Means current on board pieces must have been taken
+                self._set_fairy_piece_used('White', drop, True)
+                score += PIECE_SQUARE_VALUES[(drop + 8) << 6 | target] + self._get_reserve_score() - reserve
+            else:
+                piece = squares[origin]
+                self._move_piece(origin, target, piece, captured)
+                key ^= ZOBRIST_PIECES[(piece + 8) << 6 | origin] ^ ZOBRIST_PIECES[(piece + 8) << 6 | target] ^ \
+                    ZOBRIST_PIECES[(captured + 8) << 6 | target]
+                score += PIECE_SQUARE_VALUES[(piece + 8) << 6 | target] - PIECE_SQUARE_VALUES[(piece + 8) << 6 | origin] - \
+                    PIECE_SQUARE_VALUES[(captured + 8) << 6 | target]
+                # Adds to the taken pieces for each color for tracking
+                if captured < -PAWN:
+                    key ^= ZOBRIST_PIECES_LOST[1][self._black_pieces_lost] ^ \
+                        ZOBRIST_PIECES_LOST[1][self._black_pieces_lost + 1]
+                    reserve = self._get_reserve_score()
+                    self._black_pieces_lost += 1
+                    score += self._get_reserve_score() - reserve
+                    if captured == -KING:
+                        self._game_state = 'WHITE_WON'
+            self._player_turn = 'Black'
+        else:
+            if drop:
+                reserve = self._get_reserve_score()
+                self._place_piece(target, -drop)
+                key ^= ZOBRIST_PIECES[(8 - drop) << 6 | target] ^ ZOBRIST_FAIRY_USED[8 - drop] ^ \
+                    ZOBRIST_PIECES_LOST[1][self._black_pieces_lost] ^ \
+                    ZOBRIST_PIECES_LOST[1][self._black_pieces_lost - 1]
+                self._black_pieces_lost -= 1
+                self._set_fairy_piece_used('Black', drop, True)
+                score += PIECE_SQUARE_VALUES[(8 - drop) << 6 | target] + self._get_reserve_score() - reserve
+            else:
+                piece = squares[origin]
+                self._move_piece(origin, target, piece, captured)
+                key ^= ZOBRIST_PIECES[(piece + 8) << 6 | origin] ^ ZOBRIST_PIECES[(piece + 8) << 6 | target] ^ \
+                    ZOBRIST_PIECES[(captured + 8) << 6 | target]
+                score += PIECE_SQUARE_VALUES[(piece + 8) << 6 | target] - PIECE_SQUARE_VALUES[(piece + 8) << 6 | origin] - \
+                    PIECE_SQUARE_VALUES[(captured + 8) << 6 | target]
+                if captured > PAWN:
+                    key ^= ZOBRIST_PIECES_LOST[0][self._white_pieces_lost] ^ \
+                        ZOBRIST_PIECES_LOST[0][self._white_pieces_lost + 1]
+                    reserve = self._get_reserve_score()
+                    self._white_pieces_lost += 1
+                    score += self._get_reserve_score() - reserve
+                    if captured == KING:
+                        self._game_state = 'BLACK_WON'
+            self._player_turn = 'White'
+        self._first_moves &= ~((1 << origin) | (1 << target))
+        self._hash = key
+        self._score = score
+        self._position_counts[key] = self._position_counts.get(key, 0) + 1
+
+    def _move_piece(self, origin, target, piece, captured):
+        """Moves the piece from origin to target (taking captured) on the board, and updates
+        the attack counts by only looking at the lines that go through the two squares."""
+        squares = self._squares
+        self._add_attacks(origin, piece, -1)
+        # Sliders that were blocked by the piece now reach further past its old square
+        squares[origin] = EMPTY
+        self._update_sliders_through(origin, 1)
+        # Each step leaves the counts matching the board, so the captured piece's attacks are
+        # taken away as they are with the old square emptied
+        if captured != EMPTY:
+            self._add_attacks(target, captured, -1)
+        squares[target] = piece
+        # Sliders passing over an empty target square are now blocked by the piece
+        if captured == EMPTY:
+            self._update_sliders_through(target, -1)
+        self._add_attacks(target, piece, 1)
+        if piece == KING or piece == -KING:
+            self._king_squares[piece < 0] = target
+
+    def _unmove_piece(self, origin, target, piece, captured):
+        """Takes back _move_piece, putting the piece back on origin and captured back on
+        target. Undoes each of its steps in reverse order, with the board as it was when that
+        step was done, so the attack counts come back exactly."""
+        squares = self._squares
+        self._add_attacks(target, piece, -1)
+        if captured == EMPTY:
+            self._update_sliders_through(target, 1)
+        squares[target] = captured
+        if captured != EMPTY:
+            self._add_attacks(target, captured, 1)
+        self._update_sliders_through(origin, -1)
+        squares[origin] = piece
+        self._add_attacks(origin, piece, 1)
+        if piece == KING or piece == -KING:
+            self._king_squares[piece < 0] = origin
+
+    def _place_piece(self, square, piece):
+        """Puts the piece on the empty square and updates the attack counts."""
+        self._squares[square] = piece
+        self._update_sliders_through(square, -1)
+        self._add_attacks(square, piece, 1)
+
+    def _remove_piece(self, square, piece):
+        """Takes back _place_piece, emptying the square again."""
+        self._add_attacks(square, piece, -1)
+        self._update_sliders_through(square, 1)
+        self._squares[square] = EMPTY
+
+    def _add_attacks(self, square, piece, amount):
+        """Adds amount to the attack count of every square the piece attacks from the given
+        square, as the board stands."""
+        attacks = self._attacks[piece < 0]
+        if piece == PAWN or piece == -PAWN:
+            for target in PAWN_CAPTURES[1 if piece > 0 else -1][square]:
+                attacks[target] += amount
+        elif piece == KNIGHT or piece == -KNIGHT:
+            for target in KNIGHT_JUMPS[square]:
+                attacks[target] += amount
+        elif piece == KING or piece == -KING:
+            for target in KING_JUMPS[square]:
+                attacks[target] += amount
+        else:
+            squares = self._squares
+            for ray in SLIDER_RAYS[piece][square]:
+                for target in ray:
+                    attacks[target] += amount
+                    if squares[target] != EMPTY:
+                        break
+
+    def _update_sliders_through(self, square, amount):
+        """Adds amount to the attack counts of the squares past the given square for every
+        slider whose line of attack reaches it. Called with 1 when the square is emptied and
+        with -1 when a piece is put on it."""
+        squares = self._squares
+        rays = RAYS[square]
+        for direction in range(8):
+            # The nearest piece behind the square, looking back against the direction
+            for source in rays[OPPOSITE_DIRECTIONS[direction]]:
+                piece = squares[source]
+                if piece != EMPTY:
+                    if SLIDER_MASKS_BY_CODE[piece + 8] >> direction & 1:
+                        attacks = self._attacks[piece < 0]
+                        for target in rays[direction]:
+                            attacks[target] += amount
+                            if squares[target] != EMPTY:
+                                break
+                    break
+
+    def compute_attacks(self):
+        """Builds the attack counts of the current position from scratch and returns them as
+        a list of two arrays, white first."""
+        self._attacks, saved = [array('B', bytes(64)), array('B', bytes(64))], self._attacks
+        for square in range(64):
+            if self._squares[square] != EMPTY:
+                self._add_attacks(square, self._squares[square], 1)
+        self._attacks, attacks = saved, self._attacks
+        return attacks
+
+    def pop_move(self):
+        """Takes back the last move played with push_move, restoring the position exactly,
+        and returns that move. Returns None if there is no move to take back."""
+        if not self._move_stack:
+            return None
+        count = self._position_counts[self._hash] - 1
+        if count:
+            self._position_counts[self._hash] = count
+        else:
+            del self._position_counts[self._hash]
+        move, captured, self._first_moves, self._white_pieces_lost, self._black_pieces_lost, \
+            self._game_state, self._hash, self._score = self._move_stack.pop()
+        self._state_checked_hash = None
+        self.update_player_turn()
+        target = move >> MOVE_TARGET_SHIFT & 63
+        drop = move >> MOVE_DROP_SHIFT
+        if drop:
+            self._set_fairy_piece_used(self._player_turn, drop, False)
+            self._remove_piece(target, self._squares[target])
+        else:
+            self._unmove_piece(move & 63, target, self._squares[target], captured)
+        return move
+
+    def is_square_attacked(self, square, color):
+        """Returns whether any piece of the given color ('White' or 'Black') attacks the
+        square (0 for A1 to 63 for H8)."""
+        return self._attacks[color != 'White'][square] > 0
+
+    def is_in_check(self):
+        """Returns whether the king of the player whose turn it is is attacked."""
+        black = self._player_turn != 'White'
+        king = self._king_squares[black]
+        return king >= 0 and self._attacks[not black][king] > 0
+
+    def get_pinned_squares(self, color=None):
+        """Returns a bitmask of the squares holding pieces of the given color (the player
+        whose turn it is by default) that are pinned to their king by an enemy slider."""
+        black = (color or self._player_turn) != 'White'
+        king = self._king_squares[black]
+        if king < 0:
+            return 0
+        squares = self._squares
+        sign = -1 if black else 1
+        pinned = 0
+        for direction in range(8):
+            blocker = -1
+            for square in RAYS[king][direction]:
+                piece = squares[square] * sign
+                if piece == EMPTY:
+                    continue
+                if blocker < 0 and piece > 0:
+                    blocker = square
+                    continue
+                # The piece behind the king's own piece pins it if it slides back toward the king
+                if blocker >= 0 and piece < 0 and \
+                        SLIDER_MASKS_BY_CODE[squares[square] + 8] >> OPPOSITE_DIRECTIONS[direction] & 1:
+                    pinned |= 1 << blocker
+                break
+        return pinned
+
+    def _push_if_safe(self, move):
+        """Plays the move with push_move unless it would leave the player's own king
+        attacked. Returns whether the move was played."""
+        black = self._player_turn != 'White'
+        self.push_move(move)
+        if self._attacks[not black][self._king_squares[black]]:
+            self.pop_move()
+            return False
+        return True
+
+    def get_move_history(self):
+        """Returns the list of moves (packed as by encode_move) played since the board was set
+        up, oldest first."""
+        return [entry[0] for entry in self._move_stack]
+
+    def get_hash(self):
+        """Returns the 64-bit Zobrist hash of the current position. It covers the pieces on
+        the board, the player turn, which falcons/hunters have been entered and the pieces
+        lost counters, and is kept up to date by push_move and pop_move."""
+        return self._hash
+
+    def compute_hash(self):
+        """Builds the Zobrist hash of the current position from scratch."""
+        key = 0
+        for square in range(64):
+            piece = self._squares[square]
+            if piece != EMPTY:
+                key ^= ZOBRIST_PIECES[(piece + 8) << 6 | square]
+        if self._player_turn == 'Black':
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        for piece, used in ((FALCON, self._white_falcon), (HUNTER, self._white_hunter),
+                            (-FALCON, self._black_falcon), (-HUNTER, self._black_hunter)):
+            if used:
+                key ^= ZOBRIST_FAIRY_USED[piece + 8]
+        key ^= ZOBRIST_PIECES_LOST[0][self._white_pieces_lost] ^ ZOBRIST_PIECES_LOST[1][self._black_pieces_lost]
+        return key
+
+    def get_score(self):
+        """Returns the static evaluation of the position in centipawns from white's side: the
+        value of the pieces on their squares (see PIECE_SQUARE_VALUES) and of the falcons/
+        hunters not entered yet, white's minus black's. Kept up to date by push_move and
+        pop_move, so it costs nothing to read."""
+        return self._score
+
+    def compute_score(self):
+        """Builds the score returned by get_score from scratch."""
+        score = self._get_reserve_score()
+        for square in range(64):
+            score += PIECE_SQUARE_VALUES[(self._squares[square] + 8) << 6 | square]
+        return score
+
+    def _get_reserve_score(self):
+        """Returns the value of white's falcon/hunter not entered yet minus black's."""
+        return RESERVE_SCORES[(not self._white_falcon) + (not self._white_hunter)][min(self._white_pieces_lost, 2)] - \
+            RESERVE_SCORES[(not self._black_falcon) + (not self._black_hunter)][min(self._black_pieces_lost, 2)]
+
+    def get_repetition_count(self):
+        """Returns how many times the current position has come up in this game, counting
+        the current one. Only positions reached through push_move (and so make_move and
+        enter_fairy_piece) since initialize_board are counted."""
+        return self._position_counts.get(self._hash, 0)
+
+    def _set_fairy_piece_used(self, color, piece, used):
+        """Sets whether the given color has entered its falcon/hunter (piece code) yet."""
+        if color == 'White':
+            if piece == HUNTER:
+                self._white_hunter = used
+            else:
+                self._white_falcon = used
+        else:
+            if piece == HUNTER:
+                self._black_hunter = used
+            else:
+                self._black_falcon = used
+
+    def generate_moves(self):
+        """Returns a list of every legal move and fairy piece drop for the player whose turn
+        it is, each packed into an integer by encode_move. Moves that would leave the player's
+        own king attacked are left out. The attack counts and pins decide most moves
+        straight away, so only moves of pinned pieces and moves while in check are tried out."""
+        moves = self.generate_pseudo_moves()
+        if not moves:
+            return moves
+        black = self._player_turn != 'White'
+        king = self._king_squares[black]
+        if king < 0:
+            return moves
+        enemy_attacks = self._attacks[not black]
+        in_check = enemy_attacks[king] > 0
+        pinned = self.get_pinned_squares()
+        if not in_check and not pinned:
+            # Only the king can walk into an attack
+            return [move for move in moves if move & 63 != king or move >> MOVE_DROP_SHIFT
+                    or not enemy_attacks[move >> MOVE_TARGET_SHIFT & 63]]
+        legal = []
+        for move in moves:
+            origin = move & 63
+            if origin == king and not move >> MOVE_DROP_SHIFT:
+                # A square attacked now stays attacked after the king moves there
+                if enemy_attacks[move >> MOVE_TARGET_SHIFT & 63]:
+                    continue
+                # While in check, a slider can also attack the squares behind the king
+                if in_check and not self._is_safe(move, black):
+                    continue
+            elif in_check or pinned >> origin & 1:
+                if not self._is_safe(move, black):
+                    continue
+            legal.append(move)
+        return legal
+
+    def _is_safe(self, move, black):
+        """Returns whether the move leaves the king of the player moving it unattacked."""
+        self.push_move(move)
+        safe = not self._attacks[not black][self._king_squares[black]]
+        self.pop_move()
+        return safe
+
+    def generate_pseudo_moves(self):
+        """Returns a list of every move and fairy piece drop the pieces of the player whose
+        turn it is can make, packed by encode_move, without checking whether the player's own
+        king is left attacked. Uses the precomputed jump and ray tables so the whole list is
+        built in one pass over the board."""
+        if self._game_state != 'UNFINISHED':
+            return []
+        squares = self._squares
+        moves = []
+        append = moves.append
+        color = 1 if self._player_turn == 'White' else -1
+        for origin in range(64):
+            piece = squares[origin]
+            if piece * color <= 0:
+                continue
+            kind = piece * color
+            if kind == PAWN:
+                forward = origin + 8 * color
+                if 0 <= forward < 64:
+                    if squares[forward] == EMPTY:
+                        append(origin | forward << MOVE_TARGET_SHIFT)
+                        if self._first_moves >> origin & 1 and squares[forward + 8 * color] == EMPTY:
+                            append(origin | (forward + 8 * color) << MOVE_TARGET_SHIFT)
+                    for target in PAWN_CAPTURES[color][origin]:
+                        if squares[target] * color < 0:
+                            append(origin | target << MOVE_TARGET_SHIFT)
+            elif kind == KNIGHT or kind == KING:
+                for target in (KNIGHT_JUMPS if kind == KNIGHT else KING_JUMPS)[origin]:
+                    if squares[target] * color <= 0:
+                        append(origin | target << MOVE_TARGET_SHIFT)
+            else:
+                for ray in SLIDER_RAYS[piece][origin]:
+                    for target in ray:
+                        taken = squares[target]
+                        if taken == EMPTY:
+                            append(origin | target << MOVE_TARGET_SHIFT)
+                        else:
+                            if taken * color < 0:
+                                append(origin | target << MOVE_TARGET_SHIFT)
+                            break
+        # Fairy piece drops onto the empty squares of the player's first two rows
+        if color == 1:
+            drops = [] if self._white_pieces_lost <= 0 else \
+                [code for code, used in ((HUNTER, self._white_hunter), (FALCON, self._white_falcon)) if not used]
+            drop_squares = range(16)
+        else:
+            drops = [] if self._black_pieces_lost <= 0 else \
+                [code for code, used in ((HUNTER, self._black_hunter), (FALCON, self._black_falcon)) if not used]
+            drop_squares = range(48, 64)
+        for code in drops:
+            for target in drop_squares:
+                if squares[target] == EMPTY:
+                    append(target | target << MOVE_TARGET_SHIFT | code << MOVE_DROP_SHIFT)
+        return moves
+
+    def legal_targets(self, square):
+        """Returns the legal moves of the piece on the given square (ie. E2) as a dictionary
+        from each target square's notation to the packed move, so the move can be played with
+        push_move. The square can also be a fairy piece letter (H, F, h or f), giving the
+        squares it can be entered on. Only the player whose turn it is has legal moves. Does
+        not change the game or its pieces in any way."""
+        if square in SQUARE_INDEXES:
+            origin = SQUARE_INDEXES[square]
+            return {SQUARE_NAMES[move >> MOVE_TARGET_SHIFT & 63]: move for move in self.generate_moves()
+                    if move & 63 == origin and not move >> MOVE_DROP_SHIFT}
+        drop = PIECE_CODES.get(square, EMPTY)
+        if drop not in (HUNTER, FALCON, -HUNTER, -FALCON) or get_color(square) != self._player_turn:
+            return {}
+        drop = abs(drop)
+        return {SQUARE_NAMES[move >> MOVE_TARGET_SHIFT & 63]: move for move in self.generate_moves()
+                if move >> MOVE_DROP_SHIFT == drop}
+
+    def perft(self, depth):
+        """Returns the number of positions reached by playing every sequence of depth legal
+        moves from the current position. Used to check and benchmark move generation."""
+        if depth <= 0:
+            return 1
+        moves = self.generate_moves()
+        if depth == 1:
+            return len(moves)
+        nodes = 0
+        for move in moves:
+            self.push_move(move)
+            nodes += self.perft(depth - 1)
+            self.pop_move()
+        return nodes
+
     def search_square(self, square):
         """Takes a square and returns the object type that is currently there."""
-        row, column = get_board_indexes(square)
-        return self._board[row][column]
+        return PIECE_OBJECTS[self._squares[get_square_index(square)]]
+
+    def is_first_move(self, square):
+        """Takes a square and returns whether it holds a pawn that has not moved yet."""
+        return self._first_moves >> get_square_index(square) & 1 == 1
+
+    def get_piece_code(self, square):
+        """Takes a square index (0 for A1 to 63 for H8) and returns the integer code of
+        the piece there, positive for white, negative for black and 0 when empty."""
+        return self._squares[square]
 
     def enter_fairy_piece(self, piece_type, square_entered):
         """Takes a type of fairy piece (black/white hunter/falcon) and executes a
         move onto the board by that piece if it is deemed legal. Otherwise returns false."""
         if self.get_game_state() != 'UNFINISHED':
             return False
-        row, col = get_board_indexes(square_entered)
+        square = SQUARE_INDEXES.get(square_entered)
+        if square is None:
+            return False
+        row = square >> 3
         color = get_color(piece_type)
-        square = self.search_square(square_entered)
-        if square.get_code() == ' []':  # Square must be empty
+        if self._squares[square] == EMPTY:  # Square must be empty
             if color == "White":
                 if self._white_pieces_lost > 0 and self._player_turn == 'White':
                     if 0 <= row <= 1:
                         # White hunter
                         if piece_type == 'H' and self._white_hunter is False:
-                            piece = self.make_new_piece('H', square_entered)
-                            self._board[row][col] = piece
-                            self._white_pieces_lost -= 1  # Means current on board pieces must have been taken
-                            self.update_player_turn()
-                            self._white_hunter = True
-                            return True
+                            return self._push_if_safe(encode_move(square, square, HUNTER))
                         # White falcon
                         elif piece_type == 'F' and self._white_falcon is False:
-                            piece = self.make_new_piece('F', square_entered)
-                            self._board[row][col] = piece
-                            self._white_pieces_lost -= 1
-                            self.update_player_turn()
-                            self._white_falcon = True
-                            return True
+                            return self._push_if_safe(encode_move(square, square, FALCON))
             else:
                 if self._black_pieces_lost > 0 and self._player_turn == 'Black':
                     if 6 <= row <= 7:
                         # Black hunter
                         if piece_type == 'h' and self._black_hunter is False:
-                            piece = self.make_new_piece('h', square_entered)
-                            self._board[row][col] = piece
-                            self._black_pieces_lost -= 1
-                            self.update_player_turn()
-                            self._black_hunter = True
-                            return True
+                            return self._push_if_safe(encode_move(square, square, HUNTER))
                         # Black falcon
                         elif piece_type == 'f' and self._black_falcon is False:
-                            piece = self.make_new_piece('f', square_entered)
-                            self._board[row][col] = piece
-                            self._black_pieces_lost -= 1
-                            self.update_player_turn()
-                            self._black_falcon = True
-                            return True
+                            return self._push_if_safe(encode_move(square, square, FALCON))
         return False
 
     def print_board(self):
@@ -128,7 +793,7 @@ class ChessVar:
         for row in range(7, -1, -1):
             row_string = ''
             for column in range(8):
-                row_string += self._board[row][column].get_code() + ' '
+                row_string += PIECE_KEYS[self._squares[row * 8 + column]] + ' '
             print(row_string + '\n')
 
     def update_player_turn(self):
@@ -140,264 +805,223 @@ class ChessVar:
 
     def initialize_board(self):
         """Sets up the board in the initial position for the game"""
-        empty_array = [[n for n in range(8)] for m in range(8)]
-        # This is a string containing the initial object that needs to be in each square
-        set_string = "RNBQKBNR" + "P" * 8 + "e" * 32 + "p" * 8 + "rnbqkbnr"
-        for row in range(8):
-            for column in range(8):
-                board_index = (row * 8) + column
-                letter = set_string[board_index]
-                empty_array[row][column] = self.make_new_piece(letter, get_board_notation(row, column))
-        self._board = empty_array
-
-    def make_new_piece(self, given_letter, position):
-        """Takes a coded letter and position of a piece, and returns a piece object
-        with the color and position."""
-        color = ''
-        if given_letter.isupper():
-            color = "White"
-        else:
-            color = "Black"
-        piece_maker = {  # Contains functionality to make each type of piece depending on the
-                         # passed in key
-            'K': King(position, color),
-            'Q': Queen(position, color),
-            'B': Bishop(position, color),
-            'N': Knight(position, color),
-            'R': Rook(position, color),
-            'P': Pawn(position, color),
-            'F': Falcon(position, color),
-            'H': Hunter(position, color),
-            'E': EmptySquare(position)
-        }
-        return piece_maker[given_letter.upper()]
+        self.set_fen(START_FEN)
+
+    def get_fen(self):
+        """Returns the position as text in the format described at START_FEN, which
+        set_fen can load back."""
+        return make_fen(self._squares, self._player_turn,
+                        (self._white_falcon, self._white_hunter, self._black_falcon, self._black_hunter),
+                        self._white_pieces_lost, self._black_pieces_lost, self._first_moves)
+
+    def set_fen(self, fen):
+        """Sets up the position given as text by get_fen, as if the game had started there:
+        the move history and repetition counts start over. Raises ValueError, leaving the
+        game as it was, if the text is not a position with one king of each color."""
+        squares, player_turn, used, white_lost, black_lost, first_moves = parse_fen(fen)
+        if squares.count(KING) != 1 or squares.count(-KING) != 1:
+            raise ValueError('A position needs one king of each color: ' + repr(fen))
+        self._squares = squares
+        self._player_turn = player_turn
+        self._white_falcon, self._white_hunter, self._black_falcon, self._black_hunter = used
+        self._white_pieces_lost, self._black_pieces_lost = white_lost, black_lost
+        self._first_moves = first_moves
+        self._move_stack = []
+        self._king_squares = [squares.index(KING), squares.index(-KING)]
+        self._attacks = self.compute_attacks()
+        self._game_state = 'UNFINISHED'
+        self._state_checked_hash = None
+        self._hash = self.compute_hash()
+        self._score = self.compute_score()
+        self._position_counts = {self._hash: 1}
+
+    def get_snapshot(self):
+        """Returns the position as a tuple of strings, bytes and integers, together with the
+        attack counts, hash and score built from it, which set_snapshot can load back.
+        Snapshots take a few hundred bytes and can be pickled to send them to other
+        processes."""
+        return (self._squares.tobytes(), self._player_turn,
+                (self._white_falcon, self._white_hunter, self._black_falcon, self._black_hunter),
+                self._white_pieces_lost, self._black_pieces_lost, self._first_moves,
+                tuple(self._king_squares), self._attacks[0].tobytes(), self._attacks[1].tobytes(),
+                self._hash, self._score)
+
+    def set_snapshot(self, snapshot):
+        """Sets up the position saved by get_snapshot, like set_fen does. Nothing is parsed,
+        checked or rebuilt, so loading many positions this way is several times faster than
+        with set_fen, but the snapshot must come from get_snapshot."""
+        squares, self._player_turn, used, self._white_pieces_lost, self._black_pieces_lost, \
+            self._first_moves, king_squares, white_attacks, black_attacks, self._hash, \
+            self._score = snapshot
+        self._squares = array('b', squares)
+        self._white_falcon, self._white_hunter, self._black_falcon, self._black_hunter = used
+        self._king_squares = list(king_squares)
+        self._attacks = [array('B', white_attacks), array('B', black_attacks)]
+        self._move_stack = []
+        self._game_state = 'UNFINISHED'
+        self._state_checked_hash = None
+        self._position_counts = {self._hash: 1}
 
 
 class Helper:
+    """Base of the piece classes. A piece object only knows its color, so one object of each
+    class per color is shared by every square and every board it stands on (see
+    PIECE_OBJECTS). Piece objects cannot be changed."""
+    __slots__ = ('_color',)
 
-    def __init__(self, position, color):
-        self._position = position
-        self._color = color
+    def __init__(self, color):
+        object.__setattr__(self, '_color', color)
 
-    def get_position(self):
-        """Returns the position of the square."""
-        return self._position
+    def __setattr__(self, name, value):
+        raise AttributeError('Pieces are shared between boards and cannot be changed')
 
     def get_color(self):
         """Returns the color of the square."""
         return self._color
 
-    def set_position(self, position):
-        """Sets the position of the square to the given position."""
-        self._position = position
-
-    def set_color(self, color):
-        """Sets the color of the square to the given color."""
-        self._color = color
-
 
 class King(Helper):
     """Contains functionality for the King piece on the board. Works with the ChessVar class
     as this is the blueprint for the King that goes on the ChessVar board."""
+    __slots__ = ()
 
     def get_code(self):
         """Returns a printable version of the piece for display on the board."""
         return get_colored_key(" K ", self._color)
 
-    def is_legal_move(self, board, target):
-        """Takes the board and a target square and returns whether or not the piece can move to
-        the given target"""
-        current_row, current_column = get_board_indexes(self._position)
-        # All possible moves for the King relative to the starting position (all 1 square moves)
-        relative_moves = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]
-        possible_squares = []
-        for row_mod, col_mod in relative_moves:
-            new_row = current_row + row_mod
-            new_col = current_column + col_mod
-            if is_on_board(new_row, new_col):
-                target_square = board.search_square(get_board_notation(new_row, new_col))
-                if get_color(target_square.get_code()) != self._color:
-                    possible_squares.append(get_board_notation(new_row, new_col))
-
-        return target.upper() in possible_squares
+    def is_legal_move(self, board, origin, target):
+        """Takes the board, the square the piece is on and a target square and returns whether
+        or not the piece can move to the given target."""
+        return king_functionality(board, get_square_index(origin), get_square_index(target))
 
 
 class Queen(Helper):
     """Contains functionality for the Queen piece on the board. Works with the ChessVar class
         as this is the blueprint for the Queen that goes on the ChessVar board."""
+    __slots__ = ()
 
     def get_code(self):
         """Returns a printable version of the piece for display on the board."""
         return get_colored_key(" Q ", self._color)
 
-    def is_legal_move(self, board, target):
-        """Takes the board and a target square and returns whether or not the piece can move to
-        the given target"""
-        bishop = bishop_functionality(self, board, target)
-        rook = rook_functionality(self, board, target)
-        return bishop or rook
+    def is_legal_move(self, board, origin, target):
+        """Takes the board, the square the piece is on and a target square and returns whether
+        or not the piece can move to the given target."""
+        return queen_functionality(board, get_square_index(origin), get_square_index(target))
 
 
 class Bishop(Helper):
     """Contains functionality for the Bishop piece on the board. Works with the ChessVar class
         as this is the blueprint for the Bishop that goes on the ChessVar board."""
+    __slots__ = ()
 
     def get_code(self):
         """Returns a printable version of the piece for display on the board."""
         return get_colored_key(" B ", self._color)
 
-    def is_legal_move(self, board, target):
-        """Takes the board and a target square and returns whether or not the piece can move to
-        the given target"""
-        return bishop_functionality(self, board, target)
+    def is_legal_move(self, board, origin, target):
+        """Takes the board, the square the piece is on and a target square and returns whether
+        or not the piece can move to the given target."""
+        return bishop_functionality(board, get_square_index(origin), get_square_index(target))
 
 
 class Knight(Helper):
     """Contains functionality for the Knight piece on the board. Works with the ChessVar class
         as this is the blueprint for the Knight that goes on the ChessVar board."""
+    __slots__ = ()
 
     def get_code(self):
         """Returns a printable version of the piece for display on the board."""
         return get_colored_key(" N ", self._color)
 
-    def is_legal_move(self, board, target):
-        """Takes the board and a target square and returns whether or not the piece can move to
-        the given target"""
-        current_row, current_column = get_board_indexes(self._position)
-        relative_moves = [(2, 1), (1, 2), (-1, 2), (-2, 1), (-2, -1), (-1, -2), (1, -2), (2, -1)]
-        possible_squares = []
-        for row_mod, col_mod in relative_moves:
-            new_row = current_row + row_mod
-            new_col = current_column + col_mod
-            if is_on_board(new_row, new_col):
-                target_square = board.search_square(get_board_notation(new_row, new_col))
-                if get_color(target_square.get_code()) != self._color:
-                    possible_squares.append(get_board_notation(new_row, new_col))
-
-        if target.upper() not in possible_squares:
-            return False
-        return True
+    def is_legal_move(self, board, origin, target):
+        """Takes the board, the square the piece is on and a target square and returns whether
+        or not the piece can move to the given target."""
+        return knight_functionality(board, get_square_index(origin), get_square_index(target))
 
 
 class Rook(Helper):
     """Contains functionality for the Rook piece on the board. Works with the ChessVar class
         as this is the blueprint for the Rook that goes on the ChessVar board."""
+    __slots__ = ()
 
     def get_code(self):
         """Returns a printable version of the piece for display on the board."""
         return get_colored_key(" R ", self._color)
 
-    def is_legal_move(self, board, target):
-        """Takes the board and a target square and returns whether or not the piece can move to
-        the given target"""
-        return rook_functionality(self, board, target)
+    def is_legal_move(self, board, origin, target):
+        """Takes the board, the square the piece is on and a target square and returns whether
+        or not the piece can move to the given target."""
+        return rook_functionality(board, get_square_index(origin), get_square_index(target))
 
 
 class Pawn(Helper):
     """Contains functionality for the Pawn piece on the board. Works with the ChessVar class
         as this is the blueprint for the Pawn that goes on the ChessVar board."""
-    def __init__(self, position, color):
-        super().__init__(position, color)
-        self._is_first_move = True
+    __slots__ = ()
 
     def get_code(self):
         """Returns a printable version of the piece for display on the board."""
         return get_colored_key(" P ", self._color)
 
-    def is_legal_move(self, board, target):
-        """Takes the board and a target square and returns whether or not the piece can move to
-        the given target"""
-        current_row, current_col = get_board_indexes(self._position)
-        target_row, target_col = get_board_indexes(target)
-        color_multiplier = 1
-        if self._color == 'Black':
-            color_multiplier = -1
-        if target_col == current_col and is_on_board(current_row + color_multiplier, current_col):  # If pawn is moving straight
-            first_square = get_board_notation(current_row + color_multiplier, current_col)
-            # Searched square in front of pawn for empty
-
-            if board.search_square(first_square).get_code() != " []":
-                return False
-            if current_row + color_multiplier == target_row:
-                self._is_first_move = False
-                return True
-            # 2 move rule functionality
-            if self._is_first_move:
-                second_square = get_board_notation(current_row + (color_multiplier * 2), current_col)
-                if board.search_square(second_square).get_code() != " []":
-                    return False
-                if current_row + (color_multiplier * 2) == target_row:
-                    self._is_first_move = False
-                    return True
-            return False
-
-        if target_col + 1 == current_col or target_col - 1 == current_col:  # If pawn is taking diagonally
-            if current_row + color_multiplier == target_row:
-                piece = board.search_square(target)
-                if piece.get_code() != " []":
-                    if get_color(piece.get_code()) != self._color:
-                        return True
-        return False
+    def is_legal_move(self, board, origin, target):
+        """Takes the board, the square the piece is on and a target square and returns whether
+        or not the piece can move to the given target. Whether the pawn has moved yet is tracked by the board."""
+        return pawn_functionality(board, get_square_index(origin), get_square_index(target))
 
 
 class Falcon(Helper):
     """Contains functionality for the Falcon piece on the board. Works with the ChessVar class
         as this is the blueprint for the Falcon that goes on the ChessVar board."""
+    __slots__ = ()
 
     def get_code(self):
         """Returns a printable version of the piece for display on the board."""
         return get_colored_key(" F ", self._color)
 
-    def is_legal_move(self, board, target):
-        """Takes the board and a target square and returns whether or not the piece can move to
-        the given target"""
-        target_row, target_col = get_board_indexes(target)
-        current_row, current_col = get_board_indexes(self._position)
-        color_multiplier = 1
-        if self._color == 'Black':
-            color_multiplier = -1
-        if (current_row - target_row) * color_multiplier > 0:  # Checks if piece will move backward for rook
-            return rook_functionality(self, board, target)
-        elif (current_row - target_row) * color_multiplier < 0:  # Check if piece will move forward for bishop
-            return bishop_functionality(self, board, target)
-        return False
+    def is_legal_move(self, board, origin, target):
+        """Takes the board, the square the piece is on and a target square and returns whether
+        or not the piece can move to the given target."""
+        return falcon_functionality(board, get_square_index(origin), get_square_index(target))
 
 
 class Hunter(Helper):
     """Contains functionality for the Hunter piece on the board. Works with the ChessVar class
         as this is the blueprint for the Hunter that goes on the ChessVar board."""
+    __slots__ = ()
 
     def get_code(self):
         """Returns a printable version of the piece for display on the board."""
         return get_colored_key(" H ", self._color)
 
-    def is_legal_move(self, board, target):
-        """Takes the board and a target square and returns whether or not the piece can move to
-        the given target"""
-        target_row, target_col = get_board_indexes(target)
-        current_row, current_col = get_board_indexes(self._position)
-        color_multiplier = 1
-        if self._color == 'Black':
-            color_multiplier = -1
-        if (current_row - target_row) * color_multiplier < 0:  # Checks if the piece will move forward for rook
-            return rook_functionality(self, board, target)
-        elif (current_row - target_row) * color_multiplier > 0:  # Checks if piece will move backward for bishop
-            return bishop_functionality(self, board, target)
-        return False
+    def is_legal_move(self, board, origin, target):
+        """Takes the board, the square the piece is on and a target square and returns whether
+        or not the piece can move to the given target."""
+        return hunter_functionality(board, get_square_index(origin), get_square_index(target))
 
 
 class EmptySquare(Helper):
     """Contains functions for EmptySquares on the ChessVar board. Is essentially a placeholder
     for other pieces, so will get used as an object on the board."""
+    __slots__ = ()
 
-    def __init__(self, position):
-        super().__init__(position, None)
+    def __init__(self):
+        super().__init__(None)
 
     def get_code(self):
         """Returns a printable version of the square for display on the board."""
         return " []"
 
 
+# Contains the class used to make each type of piece depending on its letter
+PIECE_CLASSES = {'K': King, 'Q': Queen, 'B': Bishop, 'N': Knight, 'R': Rook, 'P': Pawn,
+                 'F': Falcon, 'H': Hunter}
+# The one object of each piece kind and color, by signed piece code (the EmptySquare at EMPTY)
+PIECE_OBJECTS = {code: PIECE_CLASSES[letter](color) for letter in PIECE_CLASSES
+                 for code, color in ((PIECE_CODES[letter], 'White'), (-PIECE_CODES[letter], 'Black'))}
+PIECE_OBJECTS[EMPTY] = EmptySquare()
+
+
 def get_colored_key(key, color):
     """Takes a piece 'key' and returns it uppercase or lowercase depending on which color it
     is, with uppercase meaning a white piece and lowercase meaning a black piece."""
@@ -410,7 +1034,11 @@ def get_colored_key(key, color):
 
 def get_board_indexes(square):
     """Takes a square in traditional board notation (ie. E5) and converts
-    it to the indexes for the array, returning the ."""
+    it to the (row, column) indexes for the board."""
+    index = SQUARE_INDEXES.get(square)
+    if index is not None:
+        return index >> 3, index & 7
+    # Squares off the board still give indexes, which is_on_board can reject
     letter = str(square[0]).upper()
     letter = ord(letter) - 65
     number = int(square[1]) - 1
@@ -419,9 +1047,9 @@ def get_board_indexes(square):
 
 def get_board_notation(row, column):
     """Returns a board notation (ie: E4) of the given row and column"""
-    row = str(row + 1)
-    letter = chr(column + 65)
-    return letter + row
+    if 0 <= row < 8 and 0 <= column < 8:
+        return SQUARE_NAMES[row * 8 + column]
+    return chr(column + 65) + str(row + 1)
 
 
 def is_on_board(row, column):
@@ -439,52 +1067,167 @@ def get_color(key):
         return "Black"
 
 
-def rook_functionality(self, board, target):
+def get_square_index(square):
+    """Takes a square in traditional board notation (ie. E5) and returns its index in the
+    board array, from 0 for A1 to 63 for H8."""
+    index = SQUARE_INDEXES.get(square)
+    if index is None:
+        row, column = get_board_indexes(square)
+        return row * 8 + column
+    return index
+
+
+def encode_move(origin, target, drop=EMPTY):
+    """Packs a move from the origin square index to the target square index into an integer.
+    For a fairy piece drop, drop is FALCON or HUNTER and origin should equal target."""
+    return origin | target << MOVE_TARGET_SHIFT | drop << MOVE_DROP_SHIFT
+
+
+def decode_move(move):
+    """Returns the origin square, target square and dropped piece code (0 for a normal
+    move) of a move packed by encode_move."""
+    return move & 63, move >> MOVE_TARGET_SHIFT & 63, move >> MOVE_DROP_SHIFT
+
+
+def get_move_notation(move, player_turn):
+    """Returns a packed move as the pair of arguments taken by ChessVar.make_move (ie. E2, E4)
+    or, for drops, by ChessVar.enter_fairy_piece (ie. H, A1) for the given player."""
+    origin, target, drop = decode_move(move)
+    if drop:
+        return get_colored_key(PIECE_LETTERS[drop], player_turn), SQUARE_NAMES[target]
+    return SQUARE_NAMES[origin], SQUARE_NAMES[target]
+
+
+def parse_fen(fen):
+    """Reads a position in the format described at START_FEN and returns its parts as
+    (squares array, player turn, (white falcon used, white hunter used, black falcon used,
+    black hunter used), white pieces lost, black pieces lost, first moves bitmask). Raises
+    ValueError if the text is not a position."""
+    try:
+        placement, turn, reserves, lost, first_moves = fen.split()
+        rows = placement.translate(_FEN_EXPAND).split('/')
+        white_lost, black_lost = lost.split('/')
+        # Only the digits get_fen writes are taken, so each position has a single text
+        if white_lost.strip(_FEN_DECIMAL) or black_lost.strip(_FEN_DECIMAL) or \
+                first_moves.strip(_FEN_HEXADECIMAL):
+            raise ValueError
+        white_lost, black_lost = int(white_lost), int(black_lost)
+        first_moves = int(first_moves, 16)
+        data = ''.join(reversed(rows)).encode('ascii').translate(_FEN_TO_CODES)
+    except ValueError:
+        raise ValueError('Bad position ' + repr(fen)) from None
+    if len(rows) != 8 or len(data) != 64 or _FEN_BAD in data or \
+            any(len(row) != 8 for row in rows):
+        raise ValueError('Bad piece placement in position ' + repr(fen))
+    if turn not in ('w', 'b') or reserves not in _FEN_RESERVES or \
+            not 0 <= white_lost < 32 or not 0 <= black_lost < 32:
+        raise ValueError('Bad position ' + repr(fen))
+    # Only a pawn still on its starting row can have its first move left
+    start_pawns = 0
+    for square in range(8, 16):
+        if data[square] == PAWN:
+            start_pawns |= 1 << square
+        if data[square + 40] == -PAWN & 255:
+            start_pawns |= 1 << square + 40
+    if first_moves & ~start_pawns:
+        raise ValueError('Bad first moves in position ' + repr(fen))
+    squares = array('b')
+    squares.frombytes(data)
+    used = ('F' not in reserves, 'H' not in reserves, 'f' not in reserves, 'h' not in reserves)
+    return squares, 'White' if turn == 'w' else 'Black', used, white_lost, black_lost, first_moves
+
+
+def make_fen(squares, player_turn, used, white_lost, black_lost, first_moves):
+    """Returns the text of a position from the same parts parse_fen gives back."""
+    text = squares.tobytes().translate(_CODES_TO_FEN).decode('ascii')
+    placement = '/'.join([text[56:64], text[48:56], text[40:48], text[32:40],
+                          text[24:32], text[16:24], text[8:16], text[0:8]])
+    for run, digit in _FEN_RUNS:
+        placement = placement.replace(run, digit)
+    reserves = ''.join([letter for letter, entered in zip('FHfh', used) if not entered]) or '-'
+    return '%s %s %s %d/%d %x' % (placement, 'w' if player_turn == 'White' else 'b', reserves,
+                                  white_lost, black_lost, first_moves)
+
+
+# The functions below check a single move on the board array. They take the ChessVar and the
+# origin and target square indexes, and assume the origin holds the piece being moved.
+
+def king_functionality(board, origin, target):
+    """Returns whether or not a king move (one square in any direction) is legal."""
+    squares = board._squares
+    return KING_MASKS[origin] >> target & 1 == 1 and squares[target] * squares[origin] <= 0
+
+
+def knight_functionality(board, origin, target):
+    """Returns whether or not a knight move is legal."""
+    squares = board._squares
+    return KNIGHT_MASKS[origin] >> target & 1 == 1 and squares[target] * squares[origin] <= 0
+
+
+def pawn_functionality(board, origin, target):
+    """Returns whether or not a pawn move is legal. A pawn moves one square forward, two
+    squares forward on its first move, and takes diagonally forward."""
+    squares = board._squares
+    piece = squares[origin]
+    color = 1 if piece > 0 else -1
+    if squares[target] * piece < 0:  # If pawn is taking diagonally
+        return target in PAWN_CAPTURES[color][origin]
+    if squares[target] != EMPTY:
+        return False
+    forward = origin + 8 * color
+    if target == forward:
+        return True
+    # 2 move rule functionality, the square in front of the pawn must be empty too
+    if target == forward + 8 * color:
+        return board._first_moves >> origin & 1 == 1 and squares[forward] == EMPTY
+    return False
+
+
+def slider_functionality(board, origin, target, direction_mask):
+    """Returns whether or not a sliding move is legal, for a piece allowed to slide in the
+    directions set in direction_mask (see SLIDER_DIRECTION_MASKS)."""
+    line = origin << 6 | target
+    direction = LINE_DIRECTIONS[line]
+    if direction < 0 or not direction_mask >> direction & 1:
+        return False
+    squares = board._squares
+    # Every square between the origin and target must be empty
+    for square in SQUARES_BETWEEN[line]:
+        if squares[square] != EMPTY:
+            return False
+    return squares[target] * squares[origin] <= 0
+
+
+def falcon_functionality(board, origin, target):
+    """Returns whether or not a falcon move is legal. The falcon moves like a bishop going
+    forward and like a rook going backward."""
+    return slider_functionality(board, origin, target, SLIDER_DIRECTION_MASKS[board._squares[origin]])
+
+
+def hunter_functionality(board, origin, target):
+    """Returns whether or not a hunter move is legal. The hunter moves like a rook going
+    forward and like a bishop going backward."""
+    return slider_functionality(board, origin, target, SLIDER_DIRECTION_MASKS[board._squares[origin]])
+
+
+def queen_functionality(board, origin, target):
+    """Returns whether or not a queen move is legal."""
+    return slider_functionality(board, origin, target, SLIDER_DIRECTION_MASKS[QUEEN])
+
+
+def rook_functionality(board, origin, target):
     """Returns whether or not a rook-style move is legal. Can be used for pieces other than
     rook (like Queen)."""
-    target_row, target_col = get_board_indexes(target)
-    current_row, current_col = get_board_indexes(self.get_position())
-    if target_col == current_col:
-        ratio = (target_row - current_row) / abs(target_row - current_row)
-        for square_index in range(int(current_row + ratio), int(target_row), int(ratio)):
-            square_code = get_board_notation(square_index, target_col)
-            square = board.search_square(square_code)
-            if square.get_code() != ' []':
-                return False
-        target_square = board.search_square(target)
-        if get_color(target_square.get_code()) != self.get_color():
-            return True
-    if target_row == current_row:
-        ratio = (target_col - current_col) / abs(target_col - current_col)
-        for square_index in range(int(current_row + ratio), int(target_row), int(ratio)):
-            square_code = get_board_notation(target_row, square_index)
-            square = board.search_square(square_code)
-            if square.get_code() != ' []':
-                return False
-        target_square = board.search_square(target)
-        if get_color(target_square.get_code()) != self.get_color():
-            return True
-    return False
+    return slider_functionality(board, origin, target, SLIDER_DIRECTION_MASKS[ROOK])
 
 
-def bishop_functionality(self, board, target):
+def bishop_functionality(board, origin, target):
     """Returns whether or not a bishop-style move is legal. Can be used for pieces other than
         rook (like Queen)."""
-    target_row, target_col = get_board_indexes(target)
-    current_row, current_col = get_board_indexes(self.get_position())
-    row_dif = abs(target_row - current_row)
-    col_dif = abs(target_col - current_col)
-    if row_dif == col_dif:
-        ratio_row = (target_row - current_row) / row_dif
-        ratio_col = (target_col - current_col) / col_dif
-        for square_index in range(1, int(row_dif)):
-            row_index = current_row + (square_index * ratio_row)
-            column_index = current_col + (square_index * ratio_col)
-            square_code = get_board_notation(int(row_index), int(column_index))
-            square = board.search_square(square_code)
-            if square.get_code() != ' []':
-                return False
-        target_square = board.search_square(target)
-        if get_color(target_square.get_code()) != self.get_color():
-            return True
-    return False
+    return slider_functionality(board, origin, target, SLIDER_DIRECTION_MASKS[BISHOP])
+
+
+# Move rule for each piece code, indexed by the absolute value of the code
+MOVE_RULES = (None, pawn_functionality, knight_functionality, bishop_functionality,
+              rook_functionality, queen_functionality, king_functionality,
+              falcon_functionality, hunter_functionality)
@@ -0,0 +1,59 @@
+# Description: A blocking client for the game server in Server.py. Messages are sent from the
+#              calling thread, and a background thread reads what the server pushes, either
+#              handing each message to a callback (which is how Board.py turns them into pygame
+#              events) or queueing them to be picked up with receive.
+
+import json
+import queue
+import socket
+import threading
+
+
+class GameClient:
+    """A connection to a game server. If on_message is given, it is called from the reader
+    thread with every message from the server (as a dictionary), and with None once the
+    connection closes. Otherwise the messages are kept for receive."""
+
+    def __init__(self, host, port, on_message=None):
+        self._socket = socket.create_connection((host, port))
+        self._file = self._socket.makefile('r', encoding='utf-8')
+        self._on_message = on_message
+        self._messages = queue.Queue()
+        self._send_lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_messages, daemon=True)
+        self._reader.start()
+
+    def _read_messages(self):
+        try:
+            for line in self._file:
+                self._deliver(json.loads(line))
+        except (OSError, ValueError):
+            pass
+        self._deliver(None)
+
+    def _deliver(self, message):
+        if self._on_message is not None:
+            self._on_message(message)
+        else:
+            self._messages.put(message)
+
+    def send(self, message_type, **fields):
+        """Sends a message of the given type with the given fields, like
+        send('move', **{'from': 'E2', 'to': 'E4'})."""
+        fields['type'] = message_type
+        data = (json.dumps(fields) + '\n').encode()
+        with self._send_lock:
+            self._socket.sendall(data)
+
+    def receive(self, timeout=None):
+        """Returns the next message from the server, waiting up to timeout seconds (forever
+        if None). Returns None if the connection has closed. Raises queue.Empty if nothing
+        came in time. Only used when there is no on_message callback."""
+        return self._messages.get(timeout=timeout)
+
+    def close(self):
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
@@ -0,0 +1,274 @@
+# Description: Contains a computer player for the ChessVar game. It searches with iterative
+#              deepening alpha-beta, a quiescence search of captures and move ordering, and
+#              plays on the ChessVar board through push_move/pop_move and generate_moves.
+
+import time
+import ChessVar
+from Transposition import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND
+
+
+# Value of each piece kind, indexed by the absolute value of the piece code
+PIECE_VALUES = ChessVar.PIECE_VALUES
+
+MATE_SCORE = 100000
+INFINITY = 1000000
+MAX_DEPTH = 64
+# Scores further from 0 than this are forced wins or losses, counted in plies from MATE_SCORE
+MATE_THRESHOLD = MATE_SCORE - 1000
+
+# How often (in nodes) the search checks whether its time is up
+_TIME_CHECK_NODES = 1024
+
+
+def _score_to_table(score, ply):
+    """Returns a score found ply plies below the root as it is stored in the transposition
+    table: mates are counted from the position itself instead of from the root, so the entry
+    is right however far from the root the position comes up again."""
+    if score > MATE_THRESHOLD:
+        return score + ply
+    if score < -MATE_THRESHOLD:
+        return score - ply
+    return score
+
+
+def _score_from_table(score, ply):
+    """Returns a score stored by _score_to_table as seen from a root ply plies above."""
+    if score > MATE_THRESHOLD:
+        return score - ply
+    if score < -MATE_THRESHOLD:
+        return score + ply
+    return score
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time given to it runs out."""
+
+
+def evaluate(game):
+    """Returns a static score of the position in centipawns, from the point of view of the
+    player whose turn it is. The board keeps the score up to date as moves are played (see
+    ChessVar.get_score), so this is only a lookup."""
+    if game._player_turn == 'Black':
+        return -game._score
+    return game._score
+
+
+class Engine:
+    """Searches ChessVar positions for the best move. Keeps its transposition table, killer
+    moves and history scores between searches so later moves of a game are found faster."""
+
+    def __init__(self, memory_mb=16, table=None, tablebase=None):
+        """Makes an engine with a transposition table of memory_mb megabytes, or using the
+        given TranspositionTable (which may be shared with other engines). If a
+        Tablebase.Tablebase is given, positions it covers are played from its tables."""
+        self._table = table if table is not None else TranspositionTable(memory_mb)
+        self._tablebase = tablebase
+        self._killers = [[0, 0] for _ in range(MAX_DEPTH + 1)]
+        self._history = {}
+        self._nodes = 0
+        self._stop_time = None
+        self._should_stop = None
+
+    def get_nodes(self):
+        """Returns how many positions the last search looked at."""
+        return self._nodes
+
+    def choose_move(self, game, time_left, moves_to_go=30, should_stop=None):
+        """Returns the move (packed as by ChessVar.encode_move) to play in the given game when
+        the player to move has time_left seconds on their clock, or None if there is no move.
+        Spends about 1/moves_to_go of the remaining time, or less if should_stop (see search)
+        returns True first."""
+        budget = max(0.05, min(time_left / moves_to_go, time_left / 4))
+        return self.search(game, max_time=budget, should_stop=should_stop)[0]
+
+    def search(self, game, max_time=None, max_depth=MAX_DEPTH, start_depth=1, should_stop=None,
+               on_depth=None):
+        """Searches the position of the given game by iterative deepening, from start_depth
+        until max_depth is reached, max_time seconds have passed or should_stop (a function
+        checked now and then, if given) returns True. If on_depth is given, it is called with
+        (depth, score, best move) each time a depth is finished. Returns (best move, score,
+        depth completed). The game is left in the same position it was given in."""
+        moves = game.generate_moves()
+        if not moves:
+            return None, 0, 0
+        if self._tablebase is not None:
+            known = self._tablebase.get_best_move(game)
+            if known is not None:
+                # The tables are exact, so their answer counts as searched to the end
+                move, result, plies = known
+                score = 0 if result == 'DRAW' else MATE_SCORE - plies if result == 'WIN' else plies - MATE_SCORE
+                if on_depth is not None:
+                    on_depth(MAX_DEPTH, score, move)
+                return move, score, MAX_DEPTH
+        self._stop_time = None if max_time is None else time.perf_counter() + max_time
+        self._should_stop = should_stop
+        self._nodes = 0
+        self._table.new_search()
+        for killers in self._killers:
+            killers[0] = killers[1] = 0
+        best_move, best_score, completed = moves[0], 0, 0
+        stack_size = len(game._move_stack)
+        for depth in range(max(1, start_depth), max_depth + 1):
+            try:
+                score = self._negamax(game, depth, -INFINITY, INFINITY, 0)
+            except SearchTimeout:
+                # Takes back the moves the interrupted search still had on the board
+                while len(game._move_stack) > stack_size:
+                    game.pop_move()
+                break
+            entry = self._table.probe(game.get_hash())
+            if entry is not None and entry[3]:
+                best_move = entry[3]
+            best_score, completed = score, depth
+            if on_depth is not None:
+                on_depth(depth, score, best_move)
+            # No need to look deeper once a forced win or loss has been found
+            if abs(score) > MATE_THRESHOLD:
+                break
+        return best_move, best_score, completed
+
+    def get_principal_variation(self, game, max_length=8):
+        """Returns the line of best moves from the game's position as found in the
+        transposition table, as a list of packed moves of at most max_length moves. Stops
+        early at a move that is not legal, which can happen after a hash collision. The game
+        is left in the same position it was given in."""
+        line = []
+        seen = set()
+        while len(line) < max_length and game.get_hash() not in seen:
+            seen.add(game.get_hash())
+            entry = self._table.probe(game.get_hash())
+            if entry is None or entry[3] not in game.generate_moves():
+                break
+            line.append(entry[3])
+            game.push_move(entry[3])
+        for _ in line:
+            game.pop_move()
+        return line
+
+    def _check_time(self):
+        """Stops the search when its time has run out or it has been told to stop."""
+        if self._stop_time is not None and time.perf_counter() > self._stop_time:
+            raise SearchTimeout()
+        if self._should_stop is not None and self._should_stop():
+            raise SearchTimeout()
+
+    def _negamax(self, game, depth, alpha, beta, ply):
+        """Returns the score of the position for the player to move, searching depth plies
+        deep with alpha-beta pruning."""
+        self._nodes += 1
+        if not self._nodes % _TIME_CHECK_NODES:
+            self._check_time()
+        if depth <= 0:
+            return self._quiescence(game, alpha, beta, ply)
+
+        key = game.get_hash()
+        hash_move = 0
+        entry = self._table.probe(key)
+        if entry is not None:
+            entry_depth, entry_score, flag, hash_move = entry
+            entry_score = _score_from_table(entry_score, ply)
+            if entry_depth >= depth and ply > 0:
+                if flag == EXACT:
+                    return entry_score
+                if flag == LOWER_BOUND and entry_score >= beta:
+                    return entry_score
+                if flag == UPPER_BOUND and entry_score <= alpha:
+                    return entry_score
+
+        moves = game.generate_moves()
+        if not moves:
+            # Checkmate loses, and stalemate is a draw
+            return -MATE_SCORE + ply if game.is_in_check() else 0
+        moves = self._order_moves(game, moves, hash_move, ply)
+        original_alpha = alpha
+        best_score, best_move = -INFINITY, 0
+        squares = game._squares
+        for move in moves:
+            quiet = squares[move >> ChessVar.MOVE_TARGET_SHIFT & 63] == ChessVar.EMPTY
+            game.push_move(move)
+            score = -self._negamax(game, depth - 1, -beta, -alpha, ply + 1)
+            game.pop_move()
+            if score > best_score:
+                best_score, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if quiet:
+                            killers = self._killers[ply]
+                            if killers[0] != move:
+                                killers[1], killers[0] = killers[0], move
+                            self._history[move] = self._history.get(move, 0) + depth * depth
+                        break
+
+        if best_score <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_score >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self._table.store(key, depth, _score_to_table(best_score, ply), flag, best_move)
+        return best_score
+
+    def _quiescence(self, game, alpha, beta, ply):
+        """Returns the score of the position searching only captures, so the search does not
+        stop in the middle of an exchange. When in check every way out of it is searched
+        instead, since the player cannot choose to stand still."""
+        self._nodes += 1
+        if not self._nodes % _TIME_CHECK_NODES:
+            self._check_time()
+        if game.is_in_check():
+            moves = game.generate_moves()
+            if not moves:
+                return -MATE_SCORE + ply
+            for move in moves:
+                game.push_move(move)
+                score = -self._quiescence(game, -beta, -alpha, ply + 1)
+                game.pop_move()
+                if score >= beta:
+                    return score
+                if score > alpha:
+                    alpha = score
+            return alpha
+        stand_pat = evaluate(game)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        squares = game._squares
+        captures = [move for move in game.generate_moves()
+                    if squares[move >> ChessVar.MOVE_TARGET_SHIFT & 63] != ChessVar.EMPTY]
+        # Most valuable victim first, then least valuable attacker
+        captures.sort(key=lambda move: PIECE_VALUES[abs(squares[move & 63])]
+                      - 16 * PIECE_VALUES[abs(squares[move >> ChessVar.MOVE_TARGET_SHIFT & 63])])
+        for move in captures:
+            game.push_move(move)
+            score = -self._quiescence(game, -beta, -alpha, ply + 1)
+            game.pop_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _order_moves(self, game, moves, hash_move, ply):
+        """Returns the moves sorted so the ones most likely to be best are searched first: the
+        move from the transposition table, captures by most valuable victim, killer moves,
+        and the rest by their history score."""
+        squares = game._squares
+        killers = self._killers[ply]
+        history = self._history
+
+        def move_order(move):
+            if move == hash_move:
+                return -10000000
+            taken = squares[move >> ChessVar.MOVE_TARGET_SHIFT & 63]
+            if taken != ChessVar.EMPTY:
+                return -1000000 - 16 * PIECE_VALUES[abs(taken)] + PIECE_VALUES[abs(squares[move & 63])]
+            if move == killers[0]:
+                return -900000
+            if move == killers[1]:
+                return -800000
+            return -history.get(move, 0)
+
+        moves.sort(key=move_order)
+        return moves
@@ -0,0 +1,275 @@
+# Description: Reads and writes archives of ChessVar games in a compact binary format, one
+#              fixed width record per move or fairy piece drop, so large archives can be
+#              streamed game by game and individual games found through an index file. Also
+#              steps through a recorded game to any ply for replaying it (see GameReplay).
+#
+# Format (all numbers little endian):
+#   file header   4 byte magic "FHGR", 1 byte version, 3 reserved bytes
+#   each game     2 byte number of plies, 1 byte result code, 1 reserved byte,
+#                 then 2 bytes per ply holding the move packed by ChessVar.encode_move:
+#                 origin square in bits 0-5, target square in bits 6-11 and the dropped
+#                 piece code (FALCON/HUNTER, or 0 for a normal move) in bits 12-15
+#   index file    the archive path plus ".idx", holding the 8 byte offset of every game
+
+from array import array
+import mmap
+import os
+import struct
+import sys
+import ChessVar
+
+
+MAGIC = b'FHGR'
+VERSION = 1
+FILE_HEADER = struct.Struct('<4sB3x')
+GAME_HEADER = struct.Struct('<HBx')
+
+# Codes for the game state saved with each game
+RESULT_CODES = {'UNFINISHED': 0, 'WHITE_WON': 1, 'BLACK_WON': 2, 'DRAW': 3}
+RESULT_NAMES = {code: name for name, code in RESULT_CODES.items()}
+
+_SWAP_BYTES = sys.byteorder == 'big'
+
+# Plies between the positions a GameReplay keeps
+KEYFRAME_INTERVAL = 16
+
+
+def get_index_path(path):
+    """Returns the path of the index file that goes with the archive at path."""
+    return path + '.idx'
+
+
+class GameWriter:
+    """Appends games to an archive file and their offsets to its index file. Use it as a
+    context manager, or call close when done."""
+
+    def __init__(self, path):
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        # Games added next to a missing or stale index would be the only ones it lists, so
+        # the index is rebuilt from the archive first (which also checks it is an archive)
+        if not new_file and not _index_matches(path):
+            build_index(path)
+        self._file = open(path, 'ab')
+        if new_file:
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+        self._index = open(get_index_path(path), 'wb' if new_file else 'ab')
+
+    def write_game(self, moves, result='UNFINISHED'):
+        """Adds a game made of the given packed moves (like ChessVar.get_move_history) and its
+        game state to the archive, and returns the offset it was written at."""
+        offset = self._file.tell()
+        plies = array('H', moves)
+        if _SWAP_BYTES:
+            plies.byteswap()
+        self._file.write(GAME_HEADER.pack(len(plies), RESULT_CODES[result]))
+        plies.tofile(self._file)
+        offsets = array('Q', [offset])
+        if _SWAP_BYTES:
+            offsets.byteswap()
+        offsets.tofile(self._index)
+        return offset
+
+    def write_chess_var(self, game):
+        """Adds the moves played in the given ChessVar game and its game state."""
+        return self.write_game(game.get_move_history(), game.get_game_state())
+
+    def close(self):
+        self._file.close()
+        self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _read_file_header(file):
+    """Checks the file header of an archive opened for reading."""
+    magic, version = FILE_HEADER.unpack(file.read(FILE_HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('Not a Falcon-Hunter game archive')
+
+
+def _read_game(file):
+    """Reads the game at the current position of file and returns (moves, result), or None
+    at the end of the file."""
+    header = file.read(GAME_HEADER.size)
+    if len(header) < GAME_HEADER.size:
+        return None
+    plies, result = GAME_HEADER.unpack(header)
+    moves = array('H')
+    moves.frombytes(file.read(plies * 2))
+    if _SWAP_BYTES:
+        moves.byteswap()
+    return moves, RESULT_NAMES[result]
+
+
+def read_games(path):
+    """Yields (moves, result) for every game in the archive in order, reading one game at a
+    time so archives of any size can be streamed. The moves are an array of packed moves."""
+    with open(path, 'rb') as file:
+        _read_file_header(file)
+        while True:
+            game = _read_game(file)
+            if game is None:
+                return
+            yield game
+
+
+def build_index(path):
+    """Writes the index file for an archive by skipping from game header to game header, and
+    returns the number of games."""
+    offsets = array('Q')
+    with open(path, 'rb') as file:
+        _read_file_header(file)
+        offset = file.tell()
+        size = os.path.getsize(path)
+        while offset + GAME_HEADER.size <= size:
+            offsets.append(offset)
+            plies, result = GAME_HEADER.unpack(file.read(GAME_HEADER.size))
+            offset += GAME_HEADER.size + plies * 2
+            file.seek(offset)
+    if _SWAP_BYTES:
+        offsets.byteswap()
+    with open(get_index_path(path), 'wb') as index:
+        offsets.tofile(index)
+    return len(offsets)
+
+
+def _index_matches(path):
+    """Returns whether the index file of the archive at path lists all of its games, going
+    by its first game starting after the file header and its last game ending at the end of
+    the archive."""
+    index_path = get_index_path(path)
+    if not os.path.exists(index_path):
+        return False
+    index_size = os.path.getsize(index_path)
+    size = os.path.getsize(path)
+    if index_size % 8:
+        return False
+    if not index_size:
+        return size == FILE_HEADER.size
+    with open(index_path, 'rb') as index:
+        first = int.from_bytes(index.read(8), 'little')
+        index.seek(index_size - 8)
+        last = int.from_bytes(index.read(8), 'little')
+    if first != FILE_HEADER.size:
+        return False
+    with open(path, 'rb') as file:
+        file.seek(last)
+        header = file.read(GAME_HEADER.size)
+    if len(header) < GAME_HEADER.size:
+        return False
+    plies, result = GAME_HEADER.unpack(header)
+    return last + GAME_HEADER.size + plies * 2 == size
+
+
+class GameArchive:
+    """Gives random access to the games of an archive by game number through its index file,
+    which is memory mapped so opening even a very large archive is instant. A missing or
+    stale index is rebuilt first."""
+
+    def __init__(self, path):
+        if not _index_matches(path):
+            build_index(path)
+        self._file = open(path, 'rb')
+        _read_file_header(self._file)
+        self._index_file = open(get_index_path(path), 'rb')
+        if os.path.getsize(get_index_path(path)):
+            self._index_map = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._offsets = memoryview(self._index_map).cast('Q')
+        else:
+            self._index_map = None
+            self._offsets = ()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, number):
+        """Returns (moves, result) of the game with the given number, counting from 0."""
+        offset = self._offsets[number]
+        if _SWAP_BYTES:
+            offset = int.from_bytes(offset.to_bytes(8, 'little'), 'big')
+        self._file.seek(offset)
+        return _read_game(self._file)
+
+    def close(self):
+        if self._index_map is not None:
+            self._offsets.release()
+            self._index_map.close()
+        self._index_file.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def replay(moves, plies=None):
+    """Returns a ChessVar game with the first plies moves (all of them by default) played."""
+    game = ChessVar.ChessVar()
+    for move in moves[:plies]:
+        game.push_move(move)
+    return game
+
+
+class GameReplay:
+    """Steps through a recorded game to any ply. The position every keyframe_interval plies
+    is kept as a ChessVar snapshot (a few hundred bytes each), so going to a ply only sets up
+    the nearest kept position before it and plays at most keyframe_interval - 1 moves, however
+    long the game is. Going a few plies forward or back plays or takes back just those moves."""
+
+    def __init__(self, moves, result='UNFINISHED', keyframe_interval=KEYFRAME_INTERVAL):
+        self._moves = moves
+        self._result = result
+        self._interval = keyframe_interval
+        # Position at every multiple of the interval, including the last ply if it is one
+        self._keyframes = []
+        game = ChessVar.ChessVar()
+        for ply, move in enumerate(moves):
+            if ply % keyframe_interval == 0:
+                self._keyframes.append(game.get_snapshot())
+            game.push_move(move)
+        if len(moves) % keyframe_interval == 0:
+            self._keyframes.append(game.get_snapshot())
+        # The game shown, set up from the keyframe at ply _base with the moves up to _ply
+        # pushed on it, so those can be taken back with pop_move
+        self._game = ChessVar.ChessVar()
+        self._base = 0
+        self._ply = 0
+
+    def __len__(self):
+        """Returns the number of plies in the game."""
+        return len(self._moves)
+
+    def get_ply(self):
+        """Returns the ply the game is at, 0 being the starting position."""
+        return self._ply
+
+    def get_result(self):
+        """Returns the game state saved with the game, like 'WHITE_WON'."""
+        return self._result
+
+    def get_last_move(self):
+        """Returns the packed move that led to the current ply, or None at the start."""
+        return self._moves[self._ply - 1] if self._ply else None
+
+    def seek(self, ply):
+        """Goes to the given ply (kept between 0 and the number of plies) and returns the
+        ChessVar game showing it. The game is reused, so it changes on the next seek."""
+        ply = max(0, min(ply, len(self._moves)))
+        base = ply - ply % self._interval
+        # Starts over from the keyframe when that is shorter than walking from where it is
+        if ply < self._base or abs(ply - self._ply) > ply - base:
+            self._game.set_snapshot(self._keyframes[ply // self._interval])
+            self._base = self._ply = base
+        while self._ply < ply:
+            self._game.push_move(self._moves[self._ply])
+            self._ply += 1
+        while self._ply > ply:
+            self._game.pop_move()
+            self._ply -= 1
+        return self._game
@@ -0,0 +1,141 @@
+# Description: Runs ChessVar games without pygame or a display, driven by one text command per
+#              line on standard input with the answers written to standard output. Meant for
+#              batch jobs, CI and other programs that want to play the game.
+#
+# Commands:
+#   new                  starts a new game
+#   move <from> <to>     plays a move, like "move E2 E4" (or "move E2E4")
+#   drop <piece> <to>    enters a falcon/hunter, like "drop H B1" or "drop f G8"
+#   undo                 takes back the last move or drop
+#   moves                lists every legal move and drop for the player to move
+#   go [seconds]         lets the engine choose and play a move (1 second by default)
+#   state                prints the game state and whose turn it is
+#   board                prints the board
+#   hash                 prints the Zobrist hash of the position
+#   fen [position]       prints the position as text (see ChessVar.START_FEN), or sets it up
+#   quit                 stops reading commands
+# Every command answers with a line starting with "ok" or "error".
+
+import inspect
+import math
+import sys
+import ChessVar
+
+
+class HeadlessGame:
+    """Keeps one ChessVar game and runs text commands against it."""
+
+    def __init__(self):
+        self._game = ChessVar.ChessVar()
+        self._engine = None
+
+    def get_game(self):
+        """Returns the ChessVar game the commands are played on."""
+        return self._game
+
+    def run_command(self, line):
+        """Runs a single command line and returns the answer as a string (which can be several
+        lines), or None if the command asks to quit."""
+        words = line.split()
+        if not words:
+            return ''
+        command, arguments = words[0].lower(), words[1:]
+        handler = getattr(self, '_command_' + command, None)
+        if command == 'quit':
+            return None
+        if handler is None:
+            return 'error unknown command ' + command
+        # Checks the number of arguments against the handler before calling it
+        try:
+            inspect.signature(handler).bind(*arguments)
+        except TypeError:
+            return 'error wrong arguments for ' + command
+        return handler(*arguments)
+
+    def _command_new(self):
+        self._game = ChessVar.ChessVar()
+        return 'ok'
+
+    def _command_move(self, moved_from, moved_to=None):
+        if moved_to is None:
+            moved_from, moved_to = moved_from[:2], moved_from[2:]
+        if len(moved_from) != 2 or len(moved_to) != 2:
+            return 'error illegal move'
+        if self._game.make_move(moved_from, moved_to):
+            return 'ok ' + self._game.get_game_state()
+        return 'error illegal move'
+
+    def _command_drop(self, piece_type, square):
+        if len(piece_type) != 1 or len(square) != 2:
+            return 'error illegal drop'
+        if self._game.enter_fairy_piece(piece_type, square.upper()):
+            return 'ok ' + self._game.get_game_state()
+        return 'error illegal drop'
+
+    def _command_undo(self):
+        if self._game.pop_move() is None:
+            return 'error nothing to undo'
+        return 'ok'
+
+    def _command_moves(self):
+        turn = self._game._player_turn
+        moves = [' '.join(ChessVar.get_move_notation(move, turn)) for move in self._game.generate_moves()]
+        return 'ok ' + ', '.join(moves)
+
+    def _command_go(self, seconds='1'):
+        try:
+            max_time = float(seconds)
+        except ValueError:
+            max_time = math.nan
+        if not 0 < max_time < math.inf:
+            return 'error bad time ' + seconds
+        # Only loads the engine when it is first needed
+        if self._engine is None:
+            import Engine
+            self._engine = Engine.Engine()
+        move, score, depth = self._engine.search(self._game, max_time=max_time)
+        if move is None:
+            return 'error no legal moves'
+        turn = self._game._player_turn
+        notation = ' '.join(ChessVar.get_move_notation(move, turn))
+        self._game.push_move(move)
+        return 'ok ' + notation + ' score ' + str(score) + ' depth ' + str(depth)
+
+    def _command_state(self):
+        return 'ok ' + self._game.get_game_state() + ' ' + self._game._player_turn
+
+    def _command_board(self):
+        rows = []
+        for row in range(7, -1, -1):
+            rows.append(''.join(ChessVar.PIECE_KEYS[self._game.get_piece_code(row * 8 + column)]
+                                for column in range(8)))
+        return 'ok\n' + '\n'.join(rows)
+
+    def _command_hash(self):
+        return 'ok ' + format(self._game.get_hash(), '016x')
+
+    def _command_fen(self, *fields):
+        if not fields:
+            return 'ok ' + self._game.get_fen()
+        try:
+            self._game.set_fen(' '.join(fields))
+        except ValueError:
+            return 'error bad position'
+        return 'ok'
+
+
+def run(input_file=sys.stdin, output_file=sys.stdout):
+    """Reads commands from input_file until it ends or a quit command, writing each answer to
+    output_file as soon as it is ready."""
+    game = HeadlessGame()
+    for line in input_file:
+        answer = game.run_command(line)
+        if answer is None:
+            break
+        if answer:
+            output_file.write(answer + '\n')
+            output_file.flush()
+
+
+if __name__ == '__main__':
+    run()
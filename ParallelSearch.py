@@ -0,0 +1,185 @@
+# Description: Searches a ChessVar position on several cores at once in the "Lazy SMP" style.
+#              Every worker process runs the normal engine search on the same root position,
+#              half of them starting one depth deeper so they get ahead of each other, and
+#              they all share one transposition table kept in shared memory. What one worker
+#              finds is then reused by the others through the table. Returns the best move with
+#              node counts, nodes per second and, with --scaling, how the speed grows with the
+#              number of workers.
+
+import argparse
+import multiprocessing
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+import ChessVar
+import Engine
+from Transposition import TranspositionTable, get_table_size
+
+# Seconds to wait for a result before checking that the workers still running are alive
+WORKER_CHECK_INTERVAL = 0.1
+
+
+def _worker_main(index, memory_name, memory_mb, tasks, results, stop):
+    """Runs in each worker process: searches every task it is given with an engine using the
+    shared table until it is given None."""
+    memory = shared_memory.SharedMemory(name=memory_name)
+    engine = Engine.Engine(table=TranspositionTable(memory_mb, buffer=memory.buf))
+    game = ChessVar.ChessVar()
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            fen, max_time, max_depth = task
+            game.set_fen(fen)
+            start = time.perf_counter()
+            # Odd numbered helpers skip the first depth, so the workers are spread over two
+            # depths instead of all searching the same tree in the same order
+            move, score, depth = engine.search(game, max_time, max_depth, start_depth=1 + index % 2,
+                                               should_stop=stop.is_set)
+            elapsed = time.perf_counter() - start
+            if index == 0:
+                # The main worker is done, so the helpers can stop as well
+                stop.set()
+            results.put((index, move, score, depth, engine.get_nodes(), elapsed))
+    finally:
+        # Drops the engine's view of the shared memory before closing it
+        del engine
+        memory.close()
+
+
+class ParallelSearch:
+    """A pool of worker processes searching together through a transposition table of
+    memory_mb megabytes in shared memory. The workers and table are kept between searches,
+    so later searches of a game reuse earlier results. Use it as a context manager, or call
+    close when done."""
+
+    def __init__(self, workers=None, memory_mb=64):
+        self._worker_count = workers or os.cpu_count()
+        self._memory = shared_memory.SharedMemory(create=True, size=get_table_size(memory_mb))
+        self._results = multiprocessing.Queue()
+        self._stop = multiprocessing.Event()
+        self._tasks = []
+        self._workers = []
+        for index in range(self._worker_count):
+            tasks = multiprocessing.Queue()
+            worker = multiprocessing.Process(target=_worker_main, daemon=True,
+                                             args=(index, self._memory.name, memory_mb, tasks,
+                                                   self._results, self._stop))
+            worker.start()
+            self._tasks.append(tasks)
+            self._workers.append(worker)
+
+    def get_worker_count(self):
+        return self._worker_count
+
+    def search(self, game, max_time=None, max_depth=Engine.MAX_DEPTH):
+        """Searches the position of the given game (which is not changed) until the main
+        worker reaches max_depth or max_time seconds have passed. Returns a dictionary with
+        the best move (packed as by ChessVar.encode_move, or None if there is no legal move),
+        its score and depth, the total nodes searched by all workers, the seconds taken,
+        the nodes per second, and the move, score, depth and nodes of each worker. Raises
+        RuntimeError if a worker process dies before giving its result."""
+        start = time.perf_counter()
+        self._stop.clear()
+        fen = game.get_fen()
+        for tasks in self._tasks:
+            tasks.put((fen, max_time, max_depth))
+        workers = []
+        while len(workers) < len(self._workers):
+            try:
+                workers.append(self._results.get(timeout=WORKER_CHECK_INTERVAL))
+            except queue.Empty:
+                self._check_workers({result[0] for result in workers})
+        elapsed = time.perf_counter() - start
+        workers.sort()
+        # The deepest finished search wins, with the main worker first among equals
+        best = max(workers, key=lambda result: (result[3], -result[0]))
+        nodes = sum(result[4] for result in workers)
+        return {'move': best[1], 'score': best[2], 'depth': best[3], 'nodes': nodes,
+                'seconds': elapsed, 'nps': nodes / max(elapsed, 1e-9),
+                'workers': [{'move': move, 'score': score, 'depth': depth, 'nodes': worker_nodes,
+                             'seconds': seconds}
+                            for index, move, score, depth, worker_nodes, seconds in workers]}
+
+    def _check_workers(self, finished):
+        """Raises RuntimeError if a worker whose index is not in finished has died, so its
+        result will never come. The other workers are stopped as well, since the search
+        cannot be used any more."""
+        for index, worker in enumerate(self._workers):
+            if index not in finished and not worker.is_alive():
+                for other in self._workers:
+                    other.terminate()
+                raise RuntimeError(f'search worker {index} stopped with exit code {worker.exitcode}')
+
+    def close(self):
+        """Stops the workers and frees the shared memory."""
+        for tasks in self._tasks:
+            tasks.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._memory.close()
+        self._memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def measure_scaling(game, max_depth, worker_counts, memory_mb=64):
+    """Searches the game's position to max_depth with each number of workers in
+    worker_counts, every time starting from an empty table, and returns one dictionary per
+    count with the search result plus the speedup in time to depth and in nodes per second
+    over the first count."""
+    rows = []
+    for count in worker_counts:
+        with ParallelSearch(count, memory_mb) as search:
+            result = search.search(game, max_depth=max_depth)
+        result['worker_count'] = count
+        if rows:
+            result['speedup'] = rows[0]['seconds'] / max(result['seconds'], 1e-9)
+            result['nps_scaling'] = result['nps'] / max(rows[0]['nps'], 1e-9)
+        else:
+            result['speedup'] = result['nps_scaling'] = 1.0
+        rows.append(result)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parallel analysis for Falcon-Hunter Chess')
+    parser.add_argument('--fen', default=ChessVar.START_FEN, help='position to analyse (see ChessVar.START_FEN)')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--depth', type=int, default=Engine.MAX_DEPTH, help='depth to search to')
+    parser.add_argument('--time', type=float, default=None, help='seconds to search for')
+    parser.add_argument('--memory', type=int, default=64, help='megabytes of shared transposition table')
+    parser.add_argument('--scaling', action='store_true',
+                        help='search to --depth with 1, 2, 4, ... workers and compare their speed')
+    args = parser.parse_args()
+    if args.time is None and args.depth == Engine.MAX_DEPTH:
+        parser.error('give --depth or --time')
+    game = ChessVar.ChessVar()
+    game.set_fen(args.fen)
+    turn = game._player_turn
+
+    if args.scaling:
+        counts = [1]
+        while counts[-1] * 2 <= (args.workers or os.cpu_count()):
+            counts.append(counts[-1] * 2)
+        for row in measure_scaling(game, args.depth, counts, args.memory):
+            print(f"{row['worker_count']:3d} workers: {row['seconds']:.2f}s, {row['nps']:.0f} nodes/s, "
+                  f"speedup {row['speedup']:.2f}, nodes/s scaling {row['nps_scaling']:.2f}")
+        return
+
+    with ParallelSearch(args.workers, args.memory) as search:
+        result = search.search(game, args.time, args.depth)
+    move = ' '.join(ChessVar.get_move_notation(result['move'], turn)) if result['move'] is not None else 'none'
+    print(f"best move {move} score {result['score']} depth {result['depth']}")
+    print(f"{result['nodes']} nodes in {result['seconds']:.2f}s ({result['nps']:.0f} nodes/s) "
+          f"on {len(result['workers'])} workers")
+
+
+if __name__ == '__main__':
+    main()
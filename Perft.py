@@ -0,0 +1,141 @@
+# Description: Counts the positions reached from a ChessVar position to a fixed depth (perft),
+#              split into captures, fairy piece drops and checks. Run from the command
+#              line to benchmark move generation in nodes per second, or with --verify to check
+#              the counts of a fixed set of positions against their known values.
+
+import argparse
+import time
+import ChessVar
+
+
+# Positions used by the benchmark and the correctness suite. Each is reached by playing the
+# moves from the initial position, with drops written as the piece letter and the square.
+POSITIONS = {
+    'initial': [],
+    # Both sides have lost a piece so every falcon/hunter can be dropped
+    'reserves': ['G1H3', 'H7H5', 'G2G3', 'C7C5', 'B1C3', 'G7G6', 'A1B1', 'D7D5', 'D2D3', 'C8H3',
+                 'C1D2', 'H3F1', 'C3B5', 'F7F5', 'E1F1'],
+    # A white falcon is on the board, the black hunter has been dropped and taken, and the
+    # white hunter and black falcon are still in reserve
+    'falcon on board': ['C2C4', 'B7B6', 'B2B3', 'B8A6', 'G1F3', 'A6B8', 'H2H3', 'C7C6', 'H3H4',
+                        'B6B5', 'C4B5', 'C6B5', 'B1A3', 'G8F6', 'D2D3', 'E7E5', 'F3D4', 'F8A3',
+                        'C1A3', 'E5D4', 'FB1', 'hE7', 'A3E7'],
+    # All four falcons/hunters are on the board
+    'all fairies': ['E2E4', 'B8C6', 'E4E5', 'D7D6', 'F1A6', 'B7A6', 'G1E2', 'C6B4', 'C2C3', 'A8B8',
+                    'B2B3', 'C8F5', 'FG1', 'F5B1', 'HB2', 'D6E5', 'H2H4', 'D8C8', 'A1B1', 'fA8',
+                    'C3B4', 'C8D8', 'D2D4', 'C7C5', 'E2G3', 'hC7'],
+}
+
+# Known (nodes, captures, drops, checks) for each position and depth
+EXPECTED = {
+    ('initial', 1): (20, 0, 0, 0),
+    ('initial', 2): (400, 0, 0, 0),
+    ('initial', 3): (8902, 34, 0, 12),
+    ('initial', 4): (197289, 1576, 8, 469),
+    ('reserves', 1): (39, 0, 12, 0),
+    ('reserves', 2): (1829, 52, 390, 75),
+    ('reserves', 3): (66104, 1349, 15820, 17),
+    ('reserves', 4): (2970665, 125520, 628024, 110469),
+    ('falcon on board', 1): (29, 2, 4, 1),
+    ('falcon on board', 2): (855, 51, 169, 0),
+    ('falcon on board', 3): (26456, 1814, 3446, 762),
+    ('falcon on board', 4): (791590, 48003, 131379, 1068),
+    ('all fairies', 1): (35, 3, 0, 0),
+    ('all fairies', 2): (1133, 207, 0, 7),
+    ('all fairies', 3): (40036, 3872, 0, 593),
+    ('all fairies', 4): (1321850, 226649, 0, 21720),
+}
+
+
+def get_position(name):
+    """Returns a new ChessVar game set up in the position with the given name."""
+    game = ChessVar.ChessVar()
+    for move in POSITIONS[name]:
+        if len(move) == 3:
+            played = game.enter_fairy_piece(move[0], move[1:])
+        else:
+            played = game.make_move(move[:2], move[2:])
+        if not played:
+            raise ValueError('Illegal move ' + move + ' in position ' + name)
+    return game
+
+
+def perft(game, depth):
+    """Returns (nodes, captures, drops, checks) for the positions reached by playing every
+    sequence of depth legal moves from the game's current position. The last three count
+    the moves leading to those positions that took a piece, entered a falcon/hunter, or
+    attacked the other king."""
+    if depth <= 0:
+        return 1, 0, 0, 0
+    moves = game.generate_moves()
+    if depth == 1:
+        squares = game._squares
+        captures = drops = checks = 0
+        for move in moves:
+            if squares[move >> ChessVar.MOVE_TARGET_SHIFT & 63] != ChessVar.EMPTY:
+                captures += 1
+            elif move >> ChessVar.MOVE_DROP_SHIFT:
+                drops += 1
+            game.push_move(move)
+            checks += game.is_in_check()
+            game.pop_move()
+        return len(moves), captures, drops, checks
+    nodes = captures = drops = checks = 0
+    for move in moves:
+        game.push_move(move)
+        counts = perft(game, depth - 1)
+        game.pop_move()
+        nodes += counts[0]
+        captures += counts[1]
+        drops += counts[2]
+        checks += counts[3]
+    return nodes, captures, drops, checks
+
+
+def divide(game, depth):
+    """Prints the number of positions reached after each move from the game's position, which
+    helps find which move a wrong count comes from."""
+    for move in game.generate_moves():
+        notation = ''.join(ChessVar.get_move_notation(move, game._player_turn))
+        game.push_move(move)
+        print(notation, game.perft(depth - 1))
+        game.pop_move()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Perft benchmark for Falcon-Hunter Chess')
+    parser.add_argument('--depth', type=int, default=3, help='number of moves to search')
+    parser.add_argument('--position', choices=list(POSITIONS), default=None,
+                        help='only run the given position')
+    parser.add_argument('--divide', action='store_true', help='print the count after each move')
+    parser.add_argument('--verify', action='store_true',
+                        help='check the counts of every position against their known values')
+    args = parser.parse_args()
+
+    if args.verify:
+        failures = 0
+        for (name, depth), expected in EXPECTED.items():
+            result = perft(get_position(name), depth)
+            status = 'ok' if result == expected else 'FAILED, expected ' + str(expected)
+            failures += result != expected
+            print(name, 'depth', depth, result, status)
+        raise SystemExit(1 if failures else 0)
+
+    names = [args.position] if args.position else list(POSITIONS)
+    total_nodes, total_time = 0, 0
+    for name in names:
+        game = get_position(name)
+        if args.divide:
+            divide(game, args.depth)
+        start = time.perf_counter()
+        nodes, captures, drops, checks = perft(game, args.depth)
+        elapsed = time.perf_counter() - start
+        total_nodes += nodes
+        total_time += elapsed
+        print(f'{name}: depth {args.depth} nodes {nodes} captures {captures} drops {drops} '
+              f'checks {checks} ({elapsed:.2f}s, {nodes / max(elapsed, 1e-9):.0f} nodes/s)')
+    print(f'total: {total_nodes} nodes in {total_time:.2f}s, {total_nodes / max(total_time, 1e-9):.0f} nodes/s')
+
+
+if __name__ == '__main__':
+    main()
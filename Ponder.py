@@ -0,0 +1,103 @@
+# Description: Analyses ChessVar positions in a background process while a player is thinking,
+#              so the user interface never waits on the search. Each time the analysis finishes
+#              a depth, its best line and score are handed back. The analysis keeps its results
+#              in a transposition table in shared memory, and an engine in the main process can
+#              search with that same table, so whatever was worked out while pondering is there
+#              the moment it is the engine's turn.
+
+import multiprocessing
+import os
+import threading
+from multiprocessing import shared_memory
+import ChessVar
+import Engine
+from Transposition import TranspositionTable, get_table_size
+
+
+# Longest best line reported
+PV_LENGTH = 8
+
+
+def _ponder_main(memory_name, memory_mb, commands, results):
+    """Runs in the analysis process: analyses each position it is sent (as a FEN string) until
+    another command comes in, or the depth limit or a forced win is reached. A command of
+    'stop' only stops, and None ends the process."""
+    if hasattr(os, 'nice'):
+        # Leaves the user interface the first claim on the CPU
+        os.nice(10)
+    memory = shared_memory.SharedMemory(name=memory_name)
+    engine = Engine.Engine(table=TranspositionTable(memory_mb, buffer=memory.buf))
+    game = ChessVar.ChessVar()
+
+    def report(depth, score, move):
+        results.put({'hash': game.get_hash(), 'turn': game._player_turn, 'depth': depth,
+                     'score': score, 'pv': engine.get_principal_variation(game, PV_LENGTH) or [move],
+                     'nodes': engine.get_nodes()})
+
+    try:
+        while True:
+            command = commands.get()
+            # Only the newest command matters if several came in while busy
+            while not commands.empty():
+                command = commands.get()
+            if command is None:
+                break
+            if command == 'stop':
+                continue
+            game.set_fen(command)
+            # The search stops as soon as the next command is waiting
+            engine.search(game, should_stop=lambda: not commands.empty(), on_depth=report)
+    finally:
+        del engine
+        memory.close()
+        results.put(None)
+
+
+class Ponderer:
+    """Runs the analysis process. on_result is called from a background thread with a
+    dictionary for every depth finished: the hash of the position analysed, whose turn it
+    is there ('turn'), the depth, the score for that player, the best line as packed moves
+    ('pv') and the nodes searched. Call close when done."""
+
+    def __init__(self, memory_mb=32, on_result=None):
+        self._memory = shared_memory.SharedMemory(create=True, size=get_table_size(memory_mb))
+        self._table = TranspositionTable(memory_mb, buffer=self._memory.buf)
+        self._commands = multiprocessing.Queue()
+        self._results = multiprocessing.Queue()
+        self._on_result = on_result
+        self._process = multiprocessing.Process(target=_ponder_main, daemon=True,
+                                                args=(self._memory.name, memory_mb, self._commands,
+                                                      self._results))
+        self._process.start()
+        self._reader = threading.Thread(target=self._read_results, daemon=True)
+        self._reader.start()
+
+    def _read_results(self):
+        while True:
+            result = self._results.get()
+            if result is None:
+                return
+            if self._on_result is not None:
+                self._on_result(result)
+
+    def get_table(self):
+        """Returns the shared transposition table, for an Engine in this process to use."""
+        return self._table
+
+    def analyse(self, game):
+        """Stops whatever is being analysed and starts on the position of the given game."""
+        self._commands.put(game.get_fen())
+
+    def stop(self):
+        """Stops analysing, freeing the CPU (the results found so far stay in the table)."""
+        self._commands.put('stop')
+
+    def close(self):
+        """Ends the analysis process and frees the shared memory."""
+        self._commands.put(None)
+        self._process.join()
+        self._reader.join()
+        # The table's view of the memory has to go before the memory can be closed
+        self._table = None
+        self._memory.close()
+        self._memory.unlink()
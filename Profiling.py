@@ -0,0 +1,104 @@
+# Description: Opt-in call counters and timers for finding slow spots while the game is running.
+#              Nothing is measured, and nothing costs anything, until enable() is called. It then
+#              wraps the ChessVar methods worth watching (make_move, the is_legal_move method and
+#              move rule of every piece, search_square and the move generator)
+#              in timing wrappers, and disable() puts the originals back. Other code, like the
+#              frame timings in Board.py, can add its own numbers with record. Everything can be
+#              dumped as JSON.
+
+import functools
+import json
+import time
+import ChessVar
+
+
+# Call count, total seconds and longest call in seconds for each measured name
+_stats = {}
+# (owner, attribute name, original value) of everything enable replaced
+_originals = []
+
+
+def record(name, seconds):
+    """Adds one call taking the given number of seconds to the numbers kept for name."""
+    stats = _stats.get(name)
+    if stats is None:
+        _stats[name] = [1, seconds, seconds]
+    else:
+        stats[0] += 1
+        stats[1] += seconds
+        if seconds > stats[2]:
+            stats[2] = seconds
+
+
+def _timed(function, name):
+    """Returns a version of function that records how long each call takes under name."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(name, time.perf_counter() - start)
+    return wrapper
+
+
+def _replace(owner, attribute, name):
+    """Swaps owner.attribute for a timed version of it, remembering the original."""
+    original = getattr(owner, attribute)
+    _originals.append((owner, attribute, original))
+    setattr(owner, attribute, _timed(original, name))
+
+
+def is_enabled():
+    """Returns whether the ChessVar methods are being measured."""
+    return bool(_originals)
+
+
+def enable():
+    """Starts measuring the ChessVar methods. Does nothing if they are already measured."""
+    if _originals:
+        return
+    game_class = ChessVar.ChessVar
+    for attribute in ('make_move', 'enter_fairy_piece', 'search_square',
+                      'legal_targets', 'generate_moves', 'push_move', 'pop_move'):
+        _replace(game_class, attribute, 'ChessVar.' + attribute)
+    for piece_class in set(ChessVar.PIECE_CLASSES.values()):
+        if 'is_legal_move' in vars(piece_class):
+            _replace(piece_class, 'is_legal_move', piece_class.__name__ + '.is_legal_move')
+    # make_move checks moves through the rule functions directly, one per piece kind
+    _originals.append((ChessVar, 'MOVE_RULES', ChessVar.MOVE_RULES))
+    ChessVar.MOVE_RULES = tuple(rule if rule is None else _timed(rule, 'ChessVar.' + rule.__name__)
+                                for rule in ChessVar.MOVE_RULES)
+
+
+def disable():
+    """Stops measuring and puts the original ChessVar methods back. The numbers recorded so
+    far are kept."""
+    while _originals:
+        owner, attribute, original = _originals.pop()
+        setattr(owner, attribute, original)
+
+
+def reset():
+    """Forgets every number recorded so far."""
+    _stats.clear()
+
+
+def get_stats():
+    """Returns a dictionary from each measured name to its calls, total milliseconds, mean
+    microseconds per call and longest call in milliseconds."""
+    return {name: {'calls': calls,
+                   'total_ms': round(total * 1000, 3),
+                   'mean_us': round(total * 1000000 / calls, 3),
+                   'max_ms': round(longest * 1000, 3)}
+            for name, (calls, total, longest) in sorted(_stats.items())}
+
+
+def dump_json(path=None):
+    """Returns the numbers from get_stats as a JSON string, also writing it to path if one
+    is given."""
+    text = json.dumps(get_stats(), indent=2)
+    if path is not None:
+        with open(path, 'w') as file:
+            file.write(text + '\n')
+    return text
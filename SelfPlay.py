@@ -0,0 +1,135 @@
+# Description: Plays many complete ChessVar games without the board UI, spread over every
+#              core with a process pool. Each side uses a move selection policy (random,
+#              greedy capture or the engine at a fixed depth), and the result of each game is
+#              written to a JSON lines file as soon as that game finishes.
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import time
+import ChessVar
+import Engine
+import GameRecord
+
+
+def random_policy(game, rng):
+    """Returns a random legal move."""
+    return rng.choice(game.generate_moves())
+
+
+def greedy_policy(game, rng):
+    """Returns the move taking the most valuable piece, or a random move if nothing can be
+    taken."""
+    moves = game.generate_moves()
+    squares = game._squares
+    best_value, best_moves = 0, []
+    for move in moves:
+        value = Engine.PIECE_VALUES[abs(squares[move >> ChessVar.MOVE_TARGET_SHIFT & 63])]
+        if value > best_value:
+            best_value, best_moves = value, [move]
+        elif value == best_value and value:
+            best_moves.append(move)
+    return rng.choice(best_moves or moves)
+
+
+class EnginePolicy:
+    """Returns the engine's best move searched to a fixed depth."""
+
+    def __init__(self, depth):
+        self._depth = depth
+        self._engine = Engine.Engine(memory_mb=4)
+
+    def __call__(self, game, rng):
+        return self._engine.search(game, max_depth=self._depth)[0]
+
+
+def make_policy(name):
+    """Returns the policy described by name: 'random', 'greedy' or 'engine:<depth>'."""
+    if name == 'random':
+        return random_policy
+    if name == 'greedy':
+        return greedy_policy
+    if name.startswith('engine:'):
+        return EnginePolicy(int(name.split(':', 1)[1]))
+    raise ValueError('Unknown policy ' + name)
+
+
+def play_game(game_number, white_policy, black_policy, seed, max_plies, record=False):
+    """Plays one game between the two named policies and returns a dictionary with its
+    result. A game still going after max_plies plies is stopped and reported as
+    'UNFINISHED'. If record is True, the packed moves of the game are included too."""
+    rng = random.Random(seed * 1000003 + game_number)
+    policies = {'White': make_policy(white_policy), 'Black': make_policy(black_policy)}
+    drops = {'White': 0, 'Black': 0}
+    game = ChessVar.ChessVar()
+    start = time.perf_counter()
+    plies = 0
+    while game.get_game_state() == 'UNFINISHED' and plies < max_plies:
+        if not game.generate_moves():
+            break
+        player = game._player_turn
+        move = policies[player](game, rng)
+        if move >> ChessVar.MOVE_DROP_SHIFT:
+            drops[player] += 1
+        game.push_move(move)
+        plies += 1
+    result = {'game': game_number, 'white': white_policy, 'black': black_policy,
+              'winner': game.get_game_state(), 'plies': plies,
+              'white_drops': drops['White'], 'black_drops': drops['Black'],
+              'seconds': round(time.perf_counter() - start, 4)}
+    if record:
+        result['moves'] = game.get_move_history()
+    return result
+
+
+def _play_game_task(task):
+    """Unpacks a task tuple for the process pool."""
+    return play_game(*task)
+
+
+def run_games(games, white_policy, black_policy, output, workers=None, seed=0, max_plies=300,
+              record_path=None):
+    """Plays the given number of games over a pool of worker processes, appending each result
+    to the output file as one JSON line as soon as the game finishes. If record_path is given,
+    the moves of each game are also appended to that game archive (see GameRecord). Returns a
+    dictionary counting the winners."""
+    tasks = ((number, white_policy, black_policy, seed, max_plies, record_path is not None)
+             for number in range(games))
+    totals = {}
+    with multiprocessing.Pool(workers or os.cpu_count()) as pool, open(output, 'a') as file, \
+            (GameRecord.GameWriter(record_path) if record_path is not None
+             else contextlib.nullcontext()) as writer:
+        for result in pool.imap_unordered(_play_game_task, tasks):
+            if writer is not None:
+                writer.write_game(result.pop('moves'), result['winner'])
+            file.write(json.dumps(result) + '\n')
+            file.flush()
+            totals[result['winner']] = totals.get(result['winner'], 0) + 1
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Self-play game runner for Falcon-Hunter Chess')
+    parser.add_argument('--games', type=int, default=100, help='number of games to play')
+    parser.add_argument('--white', default='random', help="white's policy: random, greedy or engine:<depth>")
+    parser.add_argument('--black', default='random', help="black's policy: random, greedy or engine:<depth>")
+    parser.add_argument('--output', default='selfplay.jsonl', help='file the results are appended to')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the random policies')
+    parser.add_argument('--max-plies', type=int, default=300, help='plies after which a game is stopped')
+    parser.add_argument('--record', default=None, help='game archive the moves of every game are appended to')
+    args = parser.parse_args()
+    # Makes sure the policy names are valid before starting the pool
+    make_policy(args.white)
+    make_policy(args.black)
+    start = time.perf_counter()
+    totals = run_games(args.games, args.white, args.black, args.output, args.workers, args.seed,
+                       args.max_plies, args.record)
+    print(f'{args.games} games in {time.perf_counter() - start:.1f}s: {totals}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+# Description: Hosts many ChessVar games at once in a single process with asyncio. Players
+#              connect over TCP and send one JSON message per line. The server checks every
+#              move with make_move/enter_fairy_piece, keeps the clocks itself and pushes each
+#              update to both players, so Board.py (or any other client, see Client.py) only
+#              has to show what the server says.
+#
+# Messages from a client:
+#   {"type": "new", "time": 300, "color": "White"}   starts a game and waits for an opponent
+#                                                    (time and color are optional)
+#   {"type": "join", "game": 1}                      joins a waiting game as the other color
+#   {"type": "move", "from": "E2", "to": "E4"}       plays a move, or enters a falcon/hunter
+#                                                    with the piece letter as "from" ("H", "f")
+#   {"type": "resign"}                               gives up the game
+#   {"type": "state"}                                asks for the game's current state
+# Messages from the server:
+#   {"type": "joined", "game": 1, "color": "White", "time": 300}
+#   {"type": "start", ...}, {"type": "update", ...} and {"type": "state", ...} with the game
+#   ("game"), the last move as "move" [from, to] and "packed" (see ChessVar.encode_move), the
+#   game state ("state"), whose turn it is ("turn") and the seconds left on each clock
+#   ("clocks": {"White": ..., "Black": ...})
+#   {"type": "error", "message": "..."}
+
+import argparse
+import asyncio
+import json
+import math
+import ChessVar
+
+
+DEFAULT_TIME = 300.0
+COLORS = ('White', 'Black')
+
+
+def _is_number(value):
+    """Returns whether a value from a message is a JSON number (true and false are not)."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+async def _skip_line(reader):
+    """Throws away the rest of a line too long for the reader's buffer, up to and including
+    its newline. Raises asyncio.IncompleteReadError if the connection closes first."""
+    while True:
+        try:
+            await reader.readuntil(b'\n')
+            return
+        except asyncio.LimitOverrunError as error:
+            await reader.readexactly(error.consumed)
+
+
+class GameSession:
+    """One game hosted by the server: the ChessVar game, the connection playing each color,
+    and the clocks. Each clock holds the seconds its player had left when the current turn
+    started, and the running clock is worked out from turn_started when it is needed."""
+    __slots__ = ('number', 'game', 'players', 'clocks', 'turn_started', 'flag_timer', 'last_move')
+
+    def __init__(self, number, time_control):
+        self.number = number
+        self.game = ChessVar.ChessVar()
+        self.players = {'White': None, 'Black': None}
+        self.clocks = {'White': float(time_control), 'Black': float(time_control)}
+        self.turn_started = None
+        self.flag_timer = None
+        self.last_move = None
+
+    def is_started(self):
+        """Returns whether both players have joined and the clocks are running."""
+        return self.turn_started is not None
+
+    def get_clocks(self, now):
+        """Returns the seconds left on each player's clock at the given loop time."""
+        clocks = dict(self.clocks)
+        if self.is_started() and self.game.get_game_state() == 'UNFINISHED':
+            turn = self.game._player_turn
+            clocks[turn] = max(0.0, clocks[turn] - (now - self.turn_started))
+        return clocks
+
+
+class Connection:
+    """A connected client, and the game and color it is playing if any."""
+    __slots__ = ('writer', 'session', 'color')
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.session = None
+        self.color = None
+
+
+class GameServer:
+    """Accepts connections and runs the games. Everything happens on one asyncio event loop,
+    so no locking is needed and a game is only ever touched by one message at a time."""
+
+    def __init__(self, time_control=DEFAULT_TIME):
+        self._time_control = time_control
+        self._sessions = {}
+        self._next_number = 1
+        self._server = None
+
+    def get_session_count(self):
+        """Returns how many games are being hosted."""
+        return len(self._sessions)
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Starts listening for connections and returns the port being listened on (useful
+        with port 0, which lets the system pick a free one)."""
+        self._server = await asyncio.start_server(self.handle_connection, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        """Stops listening and cancels every clock."""
+        for session in self._sessions.values():
+            if session.flag_timer is not None:
+                session.flag_timer.cancel()
+        self._sessions.clear()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def handle_connection(self, reader, writer):
+        """Reads and answers the messages of one client until it disconnects."""
+        connection = Connection(writer)
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b'\n')
+                except asyncio.IncompleteReadError as error:
+                    # The connection closed, maybe after a last line with no newline
+                    line = error.partial
+                except asyncio.LimitOverrunError:
+                    await _skip_line(reader)
+                    self._send(connection, {'type': 'error', 'message': 'message is too long'})
+                    continue
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                    handler = getattr(self, '_message_' + str(message.get('type')), None)
+                except (ValueError, AttributeError, RecursionError):
+                    self._send(connection, {'type': 'error', 'message': 'messages must be JSON objects'})
+                    continue
+                if handler is None:
+                    self._send(connection, {'type': 'error', 'message': 'unknown message type'})
+                    continue
+                handler(connection, message)
+                # Waits for slow clients here, so one of them cannot make the server buffer
+                # without limit
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._leave(connection)
+            writer.close()
+
+    def _send(self, connection, message):
+        """Queues a message to a client without waiting for it to be sent."""
+        if connection is not None and not connection.writer.is_closing():
+            connection.writer.write((json.dumps(message) + '\n').encode())
+
+    def _broadcast(self, session, message):
+        for player in session.players.values():
+            self._send(player, message)
+
+    def _describe(self, session, message_type):
+        """Returns a message with everything a client needs to show the game."""
+        game = session.game
+        return {'type': message_type, 'game': session.number,
+                'move': session.last_move and list(ChessVar.get_move_notation(*session.last_move)),
+                'packed': session.last_move and session.last_move[0],
+                'state': game.get_game_state(), 'turn': game._player_turn,
+                'clocks': session.get_clocks(asyncio.get_running_loop().time())}
+
+    def _message_new(self, connection, message):
+        color = message.get('color', 'White')
+        if color not in COLORS:
+            self._send(connection, {'type': 'error', 'message': 'color must be White or Black'})
+            return
+        time_control = message.get('time', self._time_control)
+        if not _is_number(time_control) or not 0 < time_control < math.inf:
+            self._send(connection, {'type': 'error', 'message': 'time must be a positive number'})
+            return
+        # Starting a new game leaves the one being played, so only once the message is good
+        if connection.session is not None:
+            self._leave(connection)
+        session = GameSession(self._next_number, time_control)
+        self._next_number += 1
+        self._sessions[session.number] = session
+        self._seat(connection, session, color)
+
+    def _message_join(self, connection, message):
+        number = message.get('game')
+        if not isinstance(number, int) or isinstance(number, bool):
+            self._send(connection, {'type': 'error', 'message': 'game must be a game number'})
+            return
+        session = self._sessions.get(number)
+        if session is None:
+            self._send(connection, {'type': 'error', 'message': 'no such game'})
+            return
+        free = [color for color in COLORS if session.players[color] is None]
+        if not free or session.is_started() or connection.session is session:
+            self._send(connection, {'type': 'error', 'message': 'game is full'})
+            return
+        if connection.session is not None:
+            self._leave(connection)
+        self._seat(connection, session, free[0])
+        # Both players are here, so White's clock starts
+        session.turn_started = asyncio.get_running_loop().time()
+        self._schedule_flag(session)
+        self._broadcast(session, self._describe(session, 'start'))
+
+    def _seat(self, connection, session, color):
+        session.players[color] = connection
+        connection.session, connection.color = session, color
+        self._send(connection, {'type': 'joined', 'game': session.number, 'color': color,
+                                'time': session.clocks[color]})
+
+    def _message_move(self, connection, message):
+        session = connection.session
+        if session is None or not session.is_started():
+            self._send(connection, {'type': 'error', 'message': 'game has not started'})
+            return
+        game = session.game
+        if game.get_game_state() != 'UNFINISHED':
+            self._send(connection, {'type': 'error', 'message': 'game is over'})
+            return
+        if game._player_turn != connection.color:
+            self._send(connection, {'type': 'error', 'message': 'not your turn'})
+            return
+        moved_from, moved_to = message.get('from'), message.get('to')
+        if not isinstance(moved_from, str) or not isinstance(moved_to, str):
+            self._send(connection, {'type': 'error', 'message': 'from and to must be strings'})
+            return
+        now = asyncio.get_running_loop().time()
+        left = session.clocks[connection.color] - (now - session.turn_started)
+        if left <= 0:
+            # The move came in after the clock ran out, even if the timer has not fired yet
+            self._flag(session)
+            return
+        if len(moved_from) == 1:
+            played = game.enter_fairy_piece(moved_from, moved_to)
+        else:
+            played = game.make_move(moved_from, moved_to)
+        if not played:
+            self._send(connection, {'type': 'error', 'message': 'illegal move'})
+            return
+        session.clocks[connection.color] = left
+        session.turn_started = now
+        session.last_move = (game._move_stack[-1][0], connection.color)
+        self._schedule_flag(session)
+        self._broadcast(session, self._describe(session, 'update'))
+
+    def _message_resign(self, connection, message):
+        session = connection.session
+        if session is None or session.game.get_game_state() != 'UNFINISHED':
+            self._send(connection, {'type': 'error', 'message': 'no game to resign'})
+            return
+        self._end(session, 'BLACK_WON' if connection.color == 'White' else 'WHITE_WON')
+
+    def _message_state(self, connection, message):
+        if connection.session is None:
+            self._send(connection, {'type': 'error', 'message': 'not in a game'})
+            return
+        self._send(connection, self._describe(connection.session, 'state'))
+
+    def _schedule_flag(self, session):
+        """Sets a timer for when the clock of the player to move runs out, replacing the one
+        for the previous turn. Nothing is scheduled once the game is over."""
+        if session.flag_timer is not None:
+            session.flag_timer.cancel()
+            session.flag_timer = None
+        if session.game.get_game_state() == 'UNFINISHED':
+            left = session.clocks[session.game._player_turn]
+            session.flag_timer = asyncio.get_running_loop().call_later(left, self._flag, session)
+
+    def _flag(self, session):
+        """Ends the game when the player to move has run out of time."""
+        loser = session.game._player_turn
+        session.clocks[loser] = 0.0
+        self._end(session, 'BLACK_WON' if loser == 'White' else 'WHITE_WON')
+
+    def _end(self, session, state):
+        """Ends the game with the given state (unless it already ended on the board) and
+        tells both players."""
+        if session.flag_timer is not None:
+            session.flag_timer.cancel()
+            session.flag_timer = None
+        if session.game.get_game_state() == 'UNFINISHED':
+            session.clocks = session.get_clocks(asyncio.get_running_loop().time())
+            session.game.set_game_state(state)
+        self._broadcast(session, self._describe(session, 'update'))
+
+    def _leave(self, connection):
+        """Takes a player out of their game. Leaving a game in progress loses it, and a game
+        nobody is left in is forgotten."""
+        session = connection.session
+        if session is None:
+            return
+        connection.session = None
+        if session.is_started() and session.game.get_game_state() == 'UNFINISHED':
+            self._end(session, 'BLACK_WON' if connection.color == 'White' else 'WHITE_WON')
+        session.players[connection.color] = None
+        if not any(session.players.values()):
+            if session.flag_timer is not None:
+                session.flag_timer.cancel()
+            self._sessions.pop(session.number, None)
+
+
+async def run(host, port, time_control):
+    server = GameServer(time_control)
+    port = await server.start(host, port)
+    print(f'Serving Falcon-Hunter Chess on {host}:{port}')
+    await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Game server for Falcon-Hunter Chess')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on')
+    parser.add_argument('--time', type=float, default=DEFAULT_TIME,
+                        help='seconds on each clock when a game does not ask for its own')
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.host, args.port, args.time))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,524 @@
+# Description: Builds and probes endgame tablebases for small Falcon-Hunter Chess endings such
+#              as K+F vs K, K+H vs K and K+F vs K+H. A table holds, for every position of its
+#              pieces, whether the player to move wins, loses or draws with best play and how
+#              many plies it takes to checkmate. Tables are built by retrograde analysis: the
+#              checkmates are found first, then the positions one move before them, and so on
+#              backward, with the work spread over worker processes. Each table is written as
+#              one byte per position and is read through mmap, so opening one costs nothing
+#              until a position is looked up.
+#
+# Tables only cover positions without pawns where neither player can ever enter a falcon or
+# hunter: each player has either entered both, or has lost no pieces and has only a king left
+# to lose. A position is stored from the side of the player to move, one byte each:
+#   0          draw
+#   1 to 254   the game ends in checkmate after (value - 1) plies, so an even value means the
+#              player to move wins and an odd value means they lose (1 is already checkmated)
+#   255        not a legal position
+# Positions are numbered by the squares of their pieces, white's first (king, then the others
+# in the order KQRBNFH), then black's the same way, and the player to move last. Every piece
+# moves the same way mirrored left to right, so only positions with the white king on the A to
+# D columns are stored, and the others are looked up mirrored.
+
+import argparse
+import itertools
+import mmap
+import multiprocessing
+import os
+import struct
+from array import array
+from multiprocessing import shared_memory
+import ChessVar
+from ChessVar import EMPTY, PAWN, KNIGHT, KING
+
+
+DEFAULT_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Tablebases')
+
+DRAW = 0
+ILLEGAL = 255
+# Longest distance to checkmate a table can store, in plies
+MAX_PLIES = 253
+
+# File header: the magic bytes, format version, name of the material, longest mate in plies
+HEADER = struct.Struct('<4sB16sH9x')
+MAGIC = b'FHTB'
+VERSION = 1
+
+# Order of the piece letters within each side of a material name
+PIECE_ORDER = 'KQRBNFH'
+
+
+def get_material_name(codes):
+    """Returns the name of the table for the given piece codes, like 'KFvKH'."""
+    letters = [ChessVar.PIECE_LETTERS[abs(code)] for code in codes if code > 0]
+    black = [ChessVar.PIECE_LETTERS[abs(code)] for code in codes if code < 0]
+    return ''.join(sorted(letters, key=PIECE_ORDER.index)) + 'v' + \
+        ''.join(sorted(black, key=PIECE_ORDER.index))
+
+
+def get_material_codes(name):
+    """Returns the piece codes of a material name in table order. Raises ValueError if the
+    name is not one a table can be built for."""
+    white, separator, black = name.upper().partition('V')
+    if not separator or white[:1] != 'K' or black[:1] != 'K' or \
+            (white + black).count('K') != 2 or (white + black).strip(PIECE_ORDER):
+        raise ValueError('Not a material without pawns like KFvK: ' + repr(name))
+    codes = [ChessVar.PIECE_CODES[letter] for letter in sorted(white, key=PIECE_ORDER.index)]
+    codes += [-ChessVar.PIECE_CODES[letter] for letter in sorted(black, key=PIECE_ORDER.index)]
+    return codes
+
+
+def get_table_length(piece_count):
+    """Returns the number of positions in a table of the given number of pieces."""
+    return 2 * 32 * 64 ** (piece_count - 1)
+
+
+def encode_index(squares, turn):
+    """Returns the position number of the piece squares (in table order) with the given
+    player to move (0 for white, 1 for black), mirroring it if the white king is on the E to
+    H columns."""
+    king = squares[0]
+    if king & 4:
+        squares = [square ^ 7 for square in squares]
+        king ^= 7
+    index = (king >> 3) * 4 + (king & 3)
+    for square in squares[1:]:
+        index = index << 6 | square
+    return index << 1 | turn
+
+
+def decode_index(index, piece_count):
+    """Returns the piece squares and player to move of a position number."""
+    turn = index & 1
+    index >>= 1
+    squares = [0] * piece_count
+    for number in range(piece_count - 1, 0, -1):
+        squares[number] = index & 63
+        index >>= 6
+    squares[0] = (index >> 2) * 8 + (index & 3)
+    return squares, turn
+
+
+def get_result(value):
+    """Returns a stored byte as (result for the player to move, plies to checkmate), where the
+    result is 'WIN', 'LOSS' or 'DRAW' and the plies are None for a draw."""
+    if value == DRAW or value == ILLEGAL:
+        return 'DRAW', None
+    return ('WIN' if value % 2 == 0 else 'LOSS'), value - 1
+
+
+class Tablebase:
+    """The tables in a directory. A table is opened (memory mapped) the first time one of its
+    positions is looked up. Call close when done."""
+
+    def __init__(self, directory=DEFAULT_DIRECTORY):
+        self._directory = directory
+        # Memory map of each table by material name, or None if there is no such file
+        self._tables = {}
+
+    def get_path(self, name):
+        return os.path.join(self._directory, name + '.fhtb')
+
+    def _open(self, name):
+        if name not in self._tables:
+            try:
+                with open(self.get_path(name), 'rb') as file:
+                    table = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                table = None
+            if table is not None:
+                magic, version, stored_name, _ = HEADER.unpack_from(table)
+                if magic != MAGIC or version != VERSION or stored_name.rstrip(b'\0').decode() != name or \
+                        len(table) != HEADER.size + get_table_length(len(get_material_codes(name))):
+                    table.close()
+                    raise ValueError('Not a tablebase file for ' + name + ': ' + self.get_path(name))
+            self._tables[name] = table
+        return self._tables[name]
+
+    def has_table(self, name):
+        """Returns whether the positions of the material can be looked up, either in its own
+        table or in the one with the colors swapped."""
+        codes = get_material_codes(name)
+        return self._open(name) is not None or \
+            self._open(get_material_name([-code for code in codes])) is not None
+
+    def lookup(self, pieces, turn):
+        """Returns the stored byte (see the top of this file) of the position with the given
+        (piece code, square) pairs and player to move (0 for white, 1 for black), or None if
+        there is no table for it. Two bare kings are always a draw."""
+        if len(pieces) == 2:
+            return DRAW
+        pieces = sorted(pieces, key=lambda piece: (piece[0] < 0, PIECE_ORDER.index(ChessVar.PIECE_LETTERS[abs(piece[0])])))
+        name = get_material_name([code for code, square in pieces])
+        table = self._open(name)
+        if table is None:
+            # Looks it up with the colors swapped and the board turned upside down instead
+            pieces = [(-code, square ^ 56) for code, square in pieces]
+            pieces = [piece for piece in pieces if piece[0] > 0] + [piece for piece in pieces if piece[0] < 0]
+            table = self._open(get_material_name([code for code, square in pieces]))
+            if table is None:
+                return None
+            turn ^= 1
+        return table[HEADER.size + encode_index([square for code, square in pieces], turn)]
+
+    def probe(self, game):
+        """Returns the result of the ChessVar game's position with best play as (result for
+        the player to move, plies to checkmate) like get_result, or None if it is not covered
+        by the tables (it has pawns, a player can still enter a fairy piece now or after
+        losing a piece, or there is no table for its pieces)."""
+        pieces = []
+        for square, code in enumerate(game._squares):
+            if code != EMPTY:
+                if code == PAWN or code == -PAWN:
+                    return None
+                pieces.append((code, square))
+        # The tables are built with no pieces to enter, which a player with one left in
+        # reserve only matches while they cannot lose anything but their king
+        if not (game._white_falcon and game._white_hunter) and \
+                (game._white_pieces_lost > 0 or any(code > 0 and code != KING for code, square in pieces)):
+            return None
+        if not (game._black_falcon and game._black_hunter) and \
+                (game._black_pieces_lost > 0 or any(code < 0 and code != -KING for code, square in pieces)):
+            return None
+        value = self.lookup(pieces, 0 if game._player_turn == 'White' else 1)
+        return None if value is None else get_result(value)
+
+    def get_best_move(self, game):
+        """Returns (move, result, plies) for the ChessVar game's position if the tables cover
+        it: a move (packed as by ChessVar.encode_move) that wins fastest, holds the draw or
+        loses slowest, with the result and plies to checkmate as by probe. Returns None if
+        the position is not covered or there is no legal move."""
+        known = self.probe(game)
+        if known is None:
+            return None
+        best = None
+        for move in game.generate_moves():
+            game.push_move(move)
+            reply = self.probe(game)
+            game.pop_move()
+            if reply is None:
+                continue
+            result, plies = reply
+            # The opponent's loss is the mover's win, and faster is better for the winner
+            if result == 'LOSS':
+                rank = (2, -plies)
+            elif result == 'DRAW':
+                rank = (1, 0)
+            else:
+                rank = (0, plies)
+            if best is None or rank > best[0]:
+                best = (rank, move)
+        if best is None:
+            return None
+        return (best[1],) + known
+
+    def close(self):
+        for table in self._tables.values():
+            if table is not None:
+                table.close()
+        self._tables.clear()
+
+
+# The functions below work on a position given as a dictionary from square index to piece
+# code, which is much faster to set up than a ChessVar for the millions of positions in a table.
+
+def _attacks(board, origin, code, target):
+    """Returns whether the piece with the given code on origin attacks the target square."""
+    kind = code if code > 0 else -code
+    if kind == KING:
+        return ChessVar.KING_MASKS[origin] >> target & 1
+    if kind == KNIGHT:
+        return ChessVar.KNIGHT_MASKS[origin] >> target & 1
+    line = origin << 6 | target
+    direction = ChessVar.LINE_DIRECTIONS[line]
+    if direction < 0 or not ChessVar.SLIDER_DIRECTION_MASKS[code] >> direction & 1:
+        return False
+    for square in ChessVar.SQUARES_BETWEEN[line]:
+        if square in board:
+            return False
+    return True
+
+
+def _is_attacked(board, target, color):
+    """Returns whether a piece of the given color (1 for white, -1 for black) attacks target."""
+    for origin, code in board.items():
+        if code * color > 0 and _attacks(board, origin, code, target):
+            return True
+    return False
+
+
+def _get_targets(board, origin, code):
+    """Returns the squares the piece on origin can move to, empty or holding an enemy."""
+    kind = code if code > 0 else -code
+    if kind == KING or kind == KNIGHT:
+        jumps = ChessVar.KING_JUMPS if kind == KING else ChessVar.KNIGHT_JUMPS
+        return [target for target in jumps[origin] if board.get(target, 0) * code <= 0]
+    targets = []
+    for ray in ChessVar.SLIDER_RAYS[code][origin]:
+        for target in ray:
+            taken = board.get(target)
+            if taken is None:
+                targets.append(target)
+            else:
+                if taken * code < 0:
+                    targets.append(target)
+                break
+    return targets
+
+
+def _get_origins(board, target, code):
+    """Returns the empty squares the piece now on target could have moved from. The
+    directions are the other way round, which for a falcon or hunter are those of the same
+    piece of the other color."""
+    kind = code if code > 0 else -code
+    if kind == KING or kind == KNIGHT:
+        jumps = ChessVar.KING_JUMPS if kind == KING else ChessVar.KNIGHT_JUMPS
+        return [origin for origin in jumps[target] if origin not in board]
+    origins = []
+    for ray in ChessVar.SLIDER_RAYS[-code][target]:
+        for origin in ray:
+            if origin in board:
+                break
+            origins.append(origin)
+    return origins
+
+
+# State of a table building worker process, set up by _start_worker
+_worker = {}
+
+
+def _start_worker(name, memory_names, directory):
+    """Runs in each worker process: attaches the arrays of the table being built."""
+    codes = get_material_codes(name)
+    memories = [shared_memory.SharedMemory(name=memory_name) for memory_name in memory_names]
+    _worker.update(codes=codes, memories=memories, black_king=codes.index(-KING),
+                   arrays=[memory.buf for memory in memories], tablebase=Tablebase(directory))
+
+
+def _classify_king_square(half_square):
+    """Looks at every position with the white king on the given square of the stored half of
+    the board. Marks illegal positions, counts the moves of the others that stay within the
+    table and notes what the captures leading into smaller tables give. Returns the positions
+    whose result is already known at some distance as {plies: array of positions}."""
+    codes = _worker['codes']
+    table, counts, capture_wins, capture_losses = _worker['arrays']
+    tablebase = _worker['tablebase']
+    black_king = _worker['black_king']
+    piece_count = len(codes)
+    king = (half_square >> 2) * 8 + (half_square & 3)
+    known = {}
+    index = half_square * 64 ** (piece_count - 1) * 2
+    for others in itertools.product(range(64), repeat=piece_count - 1):
+        squares = (king,) + others
+        board = dict(zip(squares, codes))
+        if len(board) != piece_count:
+            table[index] = table[index + 1] = ILLEGAL
+            index += 2
+            continue
+        checked = (_is_attacked(board, king, -1), _is_attacked(board, squares[black_king], 1))
+        for turn in (0, 1):
+            # The player who just moved cannot have left their king attacked
+            if checked[turn ^ 1]:
+                table[index] = ILLEGAL
+                index += 1
+                continue
+            color = 1 - 2 * turn
+            own_king = 0 if turn == 0 else black_king
+            moves = quiet = win = loss = 0
+            draw = False
+            for number, origin in enumerate(squares):
+                code = codes[number]
+                if code * color < 0:
+                    continue
+                for target in _get_targets(board, origin, code):
+                    taken = board.get(target)
+                    del board[origin]
+                    board[target] = code
+                    safe = not _is_attacked(board, target if number == own_king else squares[own_king], -color)
+                    board[origin] = code
+                    if taken is None:
+                        del board[target]
+                    else:
+                        board[target] = taken
+                    if not safe:
+                        continue
+                    moves += 1
+                    if taken is None:
+                        quiet += 1
+                        continue
+                    # A capture leads into the table of the pieces that are left
+                    value = tablebase.lookup([(codes[other], target if other == number else square)
+                                              for other, square in enumerate(squares) if square != target],
+                                             turn ^ 1)
+                    if value is None:
+                        raise RuntimeError('A table for the pieces left after a capture is missing')
+                    if value == DRAW:
+                        draw = True
+                    elif value % 2:
+                        # The opponent loses, so this player wins a ply later
+                        win = value if not win or value < win else win
+                    else:
+                        loss = value if value > loss else loss
+            if not moves:
+                if checked[turn]:
+                    known.setdefault(0, array('I')).append(index)
+            else:
+                counts[index] = quiet
+                capture_wins[index] = win
+                capture_losses[index] = ILLEGAL if draw else loss
+                if win:
+                    known.setdefault(win, array('I')).append(index)
+                elif not quiet and not draw:
+                    known.setdefault(loss, array('I')).append(index)
+            index += 1
+    return known
+
+
+def _find_predecessors(positions):
+    """Returns the positions not yet solved from which a move leads to one of the given
+    positions (more than once if several moves do), as an array."""
+    codes = _worker['codes']
+    table = _worker['arrays'][0]
+    piece_count = len(codes)
+    found = array('I')
+    append = found.append
+    for index in positions:
+        squares, turn = decode_index(index, piece_count)
+        board = dict(zip(squares, codes))
+        # The player who moved last is the one not to move now
+        color = 1 if turn else -1
+        for number, target in enumerate(squares):
+            code = codes[number]
+            if code * color < 0:
+                continue
+            for origin in _get_origins(board, target, code):
+                squares[number] = origin
+                previous = encode_index(squares, turn ^ 1)
+                if not table[previous]:
+                    append(previous)
+            squares[number] = target
+    return found
+
+
+def build(name, directory=DEFAULT_DIRECTORY, workers=None, log=print):
+    """Builds the table of the named material (like 'KFvK') and writes it to the directory,
+    building the tables it captures into first if they are missing. Returns a dictionary
+    with how many positions are wins, losses and draws for the player to move and the
+    longest checkmate in plies."""
+    codes = get_material_codes(name)
+    name = get_material_name(codes)
+    os.makedirs(directory, exist_ok=True)
+    tablebase = Tablebase(directory)
+    # Every capture of a piece other than a king leads into a smaller table
+    for number, code in enumerate(codes):
+        smaller = codes[:number] + codes[number + 1:]
+        if abs(code) != KING and len(smaller) > 2 and not tablebase.has_table(get_material_name(smaller)):
+            build(get_material_name(smaller), directory, workers, log)
+    tablebase.close()
+
+    length = get_table_length(len(codes))
+    # The results being built (0 while unknown), how many moves within the table each
+    # position has left that do not lose, and its fastest win and slowest loss by capture
+    memories = [shared_memory.SharedMemory(create=True, size=length) for _ in range(4)]
+    try:
+        table, counts, capture_wins, capture_losses = [memory.buf for memory in memories]
+        with multiprocessing.Pool(workers or os.cpu_count(), _start_worker,
+                                  (name, [memory.name for memory in memories], directory)) as pool:
+            log(f'{name}: looking at {length} positions')
+            pending = {}
+            for known in pool.imap_unordered(_classify_king_square, range(32)):
+                for plies, positions in known.items():
+                    pending.setdefault(plies, array('I')).extend(positions)
+
+            # Goes backward one ply at a time from the checkmates. Positions one ply before a
+            # loss are wins, and positions whose every move leads to a win are losses.
+            plies = 0
+            frontier = array('I')
+            longest = 0
+            while frontier or pending:
+                for index in pending.pop(plies, ()):
+                    if not table[index]:
+                        table[index] = plies + 1
+                        frontier.append(index)
+                if plies > MAX_PLIES:
+                    raise ValueError(f'{name} has checkmates longer than {MAX_PLIES} plies')
+                if frontier:
+                    longest = plies
+                chunk = max(1000, len(frontier) // (4 * (workers or os.cpu_count())) + 1)
+                chunks = [frontier[start:start + chunk] for start in range(0, len(frontier), chunk)]
+                following = array('I')
+                for predecessors in pool.imap_unordered(_find_predecessors, chunks):
+                    if plies % 2:
+                        # The frontier are wins, so each predecessor has one less move left
+                        for index in predecessors:
+                            if table[index]:
+                                continue
+                            counts[index] -= 1
+                            if not counts[index] and not capture_wins[index] and capture_losses[index] != ILLEGAL:
+                                loss = max(plies + 1, capture_losses[index])
+                                if loss == plies + 1:
+                                    table[index] = loss + 1
+                                    following.append(index)
+                                else:
+                                    pending.setdefault(loss, array('I')).append(index)
+                    else:
+                        # The frontier are losses, so each predecessor wins
+                        for index in predecessors:
+                            if not table[index]:
+                                table[index] = plies + 2
+                                following.append(index)
+                frontier = following
+                plies += 1
+            pool.close()
+            pool.join()
+
+        header = HEADER.pack(MAGIC, VERSION, name.encode(), longest)
+        path = Tablebase(directory).get_path(name)
+        with open(path + '.tmp', 'wb') as file:
+            file.write(header)
+            file.write(table)
+        os.replace(path + '.tmp', path)
+        totals = array('Q', [0]) * 256
+        for value in table:
+            totals[value] += 1
+    finally:
+        # The views of the shared memory have to go before it can be closed
+        table = counts = capture_wins = capture_losses = None
+        for memory in memories:
+            memory.close()
+            memory.unlink()
+    stats = {'name': name, 'positions': length - totals[ILLEGAL], 'draws': totals[DRAW],
+             'wins': sum(totals[2:ILLEGAL:2]), 'losses': sum(totals[1:ILLEGAL:2]), 'longest': longest}
+    log(f"{name}: {stats['wins']} wins, {stats['losses']} losses and {stats['draws']} draws "
+        f"for the player to move, longest checkmate {longest} plies")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Endgame tablebases for Falcon-Hunter Chess')
+    parser.add_argument('materials', nargs='*', default=['KFvK', 'KHvK', 'KFvKH'],
+                        help='materials to build tables for, like KFvK (default: KFvK KHvK KFvKH)')
+    parser.add_argument('--directory', default=DEFAULT_DIRECTORY, help='where the tables are kept')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default: all cores)')
+    parser.add_argument('--probe', default=None, metavar='FEN',
+                        help='looks up a position (see ChessVar.START_FEN) instead of building')
+    args = parser.parse_args()
+
+    if args.probe is not None:
+        game = ChessVar.ChessVar()
+        game.set_fen(args.probe)
+        tablebase = Tablebase(args.directory)
+        known = tablebase.get_best_move(game)
+        if known is None:
+            print('not in the tables')
+        else:
+            move, result, plies = known
+            print(result if plies is None else f'{result} in {plies} plies',
+                  'best move', ' '.join(ChessVar.get_move_notation(move, game._player_turn)))
+        tablebase.close()
+        return
+    for material in args.materials:
+        build(material, args.directory, args.workers)
+
+
+if __name__ == '__main__':
+    main()
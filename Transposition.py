@@ -0,0 +1,109 @@
+# Description: Contains a fixed size transposition table keyed on the Zobrist hash of a
+#              ChessVar position (ChessVar.get_hash), so searches can reuse results for
+#              positions they have already looked at. The table can live in a buffer given
+#              to it, like shared memory, so several processes can search with one table.
+
+from array import array
+
+
+# Bound types stored with a score
+EXACT, LOWER_BOUND, UPPER_BOUND = 1, 2, 3
+
+# Each entry takes two 64-bit words: the key and the packed data below
+ENTRY_SIZE = 16
+# Number of entries in each bucket. The first slot keeps the deepest result and the second
+# slot always takes the newest one.
+BUCKET_SIZE = 2
+
+# Layout of the packed data word
+_DEPTH_SHIFT = 16
+_FLAG_SHIFT = 24
+_GENERATION_SHIFT = 26
+_SCORE_SHIFT = 32
+_SCORE_OFFSET = 1 << 31
+
+
+def get_table_size(memory_mb):
+    """Returns the number of bytes used by a table given memory_mb megabytes: the largest
+    power of two number of buckets that fits, and at least one bucket."""
+    buckets = 1
+    while buckets * 2 * BUCKET_SIZE * ENTRY_SIZE <= memory_mb * 1024 * 1024:
+        buckets *= 2
+    return buckets * BUCKET_SIZE * ENTRY_SIZE
+
+
+class TranspositionTable:
+    """Stores search results (depth, score, bound type and best move) by position hash in a
+    fixed amount of memory. The table is a power of two number of buckets of two entries.
+    When a bucket is full, the first slot is only replaced by a result searched at least as
+    deep or by any result once the stored one is from an older search (see new_search), and
+    the second slot is always replaced."""
+
+    def __init__(self, memory_mb=16, buffer=None):
+        """Makes a table using at most the given number of megabytes. If buffer is given (a
+        writable buffer of at least get_table_size(memory_mb) bytes, such as the buf of a
+        multiprocessing.shared_memory.SharedMemory), the entries are kept in it instead of
+        in memory of the table's own, and whatever entries it already holds are used."""
+        size = get_table_size(memory_mb)
+        self._bucket_mask = size // (BUCKET_SIZE * ENTRY_SIZE) - 1
+        # Alternating key and data words for every entry. Keys are stored xor the data so an
+        # entry written in two halves (or by two processes at once) is not mistaken for a
+        # valid one.
+        if buffer is None:
+            self._table = array('Q', bytes(size))
+        else:
+            self._table = memoryview(buffer)[:size].cast('Q')
+        self._generation = 0
+
+    def __len__(self):
+        """Returns the number of entries the table can hold."""
+        return len(self._table) // 2
+
+    def clear(self):
+        """Removes every entry from the table."""
+        memoryview(self._table).cast('B')[:] = bytes(len(self._table) * 8)
+        self._generation = 0
+
+    def new_search(self):
+        """Marks the start of a new search, so results from earlier searches become the first
+        to be replaced."""
+        self._generation = (self._generation + 1) & 63
+
+    def store(self, key, depth, score, flag, move=0):
+        """Saves the result of searching the position with the given hash to the given depth.
+        The score is an integer and flag says whether it is EXACT, a LOWER_BOUND or an
+        UPPER_BOUND. The move is a packed ChessVar move or 0."""
+        table = self._table
+        data = move & 0xFFFF | min(depth, 255) << _DEPTH_SHIFT | flag << _FLAG_SHIFT | \
+            self._generation << _GENERATION_SHIFT | (score + _SCORE_OFFSET) << _SCORE_SHIFT
+        index = (key & self._bucket_mask) * BUCKET_SIZE * 2
+        old_data = table[index + 1]
+        if table[index] ^ old_data == key or old_data == 0 or \
+                depth >= (old_data >> _DEPTH_SHIFT & 255) or \
+                (old_data >> _GENERATION_SHIFT & 63) != self._generation:
+            # Keeps the best move of the position if the new result has none
+            if move == 0 and table[index] ^ old_data == key:
+                data |= old_data & 0xFFFF
+            table[index] = key ^ data
+            table[index + 1] = data
+        else:
+            table[index + 2] = key ^ data
+            table[index + 3] = data
+
+    def probe(self, key):
+        """Returns the (depth, score, flag, move) saved for the position with the given hash,
+        or None if it is not in the table."""
+        table = self._table
+        index = (key & self._bucket_mask) * BUCKET_SIZE * 2
+        for slot in range(index, index + BUCKET_SIZE * 2, 2):
+            data = table[slot + 1]
+            if data and table[slot] ^ data == key:
+                return (data >> _DEPTH_SHIFT & 255, (data >> _SCORE_SHIFT) - _SCORE_OFFSET,
+                        data >> _FLAG_SHIFT & 3, data & 0xFFFF)
+        return None
+
+    def get_fill(self):
+        """Returns how full the table is, as the fraction of the first 1000 entries in use."""
+        sample = min(1000, len(self))
+        used = sum(1 for slot in range(sample) if self._table[slot * 2 + 1])
+        return used / sample
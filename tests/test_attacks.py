@@ -0,0 +1,58 @@
+# Description: Tests for the attack counts ChessVar keeps up to date as moves are played and
+#              taken back.
+
+import random
+from array import array
+import ChessVar
+
+
+def test_attack_counts_follow_push_and_pop():
+    rng = random.Random(16)
+    game = ChessVar.ChessVar()
+    for _ in range(10):
+        game.initialize_board()
+        fens = [game.get_fen()]
+        for _ in range(150):
+            moves = game.generate_moves()
+            if not moves:
+                break
+            # Every move is tried and taken back before one of them is played
+            for move in moves:
+                game.push_move(move)
+                assert game._attacks == game.compute_attacks()
+                game.pop_move()
+                assert game._attacks == game.compute_attacks()
+            game.push_move(rng.choice(moves))
+            fens.append(game.get_fen())
+        # Taking every move back gives the same positions in reverse
+        while game.pop_move() is not None:
+            fens.pop()
+            assert game.get_fen() == fens[-1]
+            assert game._attacks == game.compute_attacks()
+        assert game.get_fen() == ChessVar.START_FEN
+
+
+def test_move_stack_does_not_keep_attack_counts():
+    game = ChessVar.ChessVar()
+    game.make_move('E2', 'E4')
+    assert not any(isinstance(field, (array, list)) for field in game._move_stack[-1])
+
+
+def test_check_and_mate():
+    game = ChessVar.ChessVar()
+    for moved_from, moved_to in (('F2', 'F3'), ('E7', 'E5'), ('G2', 'G4')):
+        assert game.make_move(moved_from, moved_to)
+    assert not game.is_in_check()
+    assert game.make_move('D8', 'H4')
+    assert game.is_in_check()
+    assert game.get_game_state() == 'BLACK_WON'
+    game.pop_move()
+    assert not game.is_in_check()
+    assert game.get_game_state() == 'UNFINISHED'
+
+
+def test_stalemate_is_a_draw():
+    game = ChessVar.ChessVar()
+    game.set_fen('7k/5Q2/6K1/8/8/8/8/8 b - 0/0 0')
+    assert not game.is_in_check()
+    assert game.get_game_state() == 'DRAW'
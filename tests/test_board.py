@@ -0,0 +1,205 @@
+# Description: Tests for the drawing code in Board.py, run on pygame's dummy video driver so no
+#              window is opened.
+
+import os
+import time
+import pytest
+import ChessVar
+
+pygame = pytest.importorskip('pygame')
+
+
+@pytest.fixture(scope='module')
+def board():
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    import Board
+    Board.init_display()
+    yield Board
+    pygame.quit()
+
+
+@pytest.fixture
+def screen(board):
+    board.redraw_everything()
+    board.screen.fill((0, 0, 0))
+    return board.screen
+
+
+def full_redraw(board, game, selected_piece=None, targets=()):
+    """Returns the screen contents drawn from scratch for the game."""
+    board.redraw_everything()
+    board.draw_board(game, selected_piece, targets)
+    return pygame.image.tostring(board.screen, 'RGB')
+
+
+def test_piece_images_are_loaded_once(board, monkeypatch):
+    image = board.make_image('w', 'k')
+    assert board.make_image('w', 'k') is image
+    assert board.make_image('w', 'K ') is image
+    assert board.make_image('b', 'k') is not image
+    assert board.make_image('w', 'q') is not image
+    # A different square size gets its own scaled copy
+    monkeypatch.setattr(board, 'ratio', board.ratio / 2)
+    smaller = board.make_image('w', 'k')
+    assert smaller is not image
+    assert smaller.get_width() == image.get_width() // 2
+
+
+def test_fonts_and_text_are_made_once(board):
+    font = board.get_font('arial', 40)
+    assert board.get_font('arial', 40) is font
+    assert board.get_font('arial', 20) is not font
+    text = board.render_text('299', 'arial', 40)
+    assert board.render_text('299', 'arial', 40) is text
+    assert board.render_text('298', 'arial', 40) is not text
+    smaller = board.render_text('299', 'arial', 20)
+    assert smaller is not text
+    assert smaller.get_height() < text.get_height()
+
+
+def test_first_draw_covers_the_screen(board, screen):
+    rects = board.draw_board(ChessVar.ChessVar())
+    assert rects == [screen.get_rect()]
+    # Nothing changed, so nothing is drawn again
+    assert board.draw_board(ChessVar.ChessVar()) == []
+
+
+def test_move_only_redraws_its_squares(board, screen):
+    game = ChessVar.ChessVar()
+    board.draw_board(game)
+    game.make_move('E2', 'E4')
+    rects = board.draw_board(game)
+    assert sorted((rect.x, rect.y) for rect in rects) == \
+        sorted((int(x), int(y)) for x, y in (board.get_square_location(1, 4), board.get_square_location(3, 4)))
+    drawn = pygame.image.tostring(screen, 'RGB')
+    assert drawn == full_redraw(board, game)
+
+
+def test_partial_redraws_match_full_redraws(board, screen):
+    game = ChessVar.ChessVar()
+    board.draw_board(game)
+    for moved_from, moved_to in (('E2', 'E4'), ('D7', 'D5'), ('E4', 'D5'), ('D8', 'D5'), ('G1', 'F3'),
+                                 ('E7', 'E6'), ('F3', 'G5'), ('D5', 'G5')):
+        assert game.make_move(moved_from, moved_to)
+        board.draw_board(game)
+        drawn = pygame.image.tostring(screen, 'RGB')
+        assert drawn == full_redraw(board, game)
+    # White has lost the knight, so a fairy piece can be entered from the reserve panel
+    assert game.enter_fairy_piece('H', 'G1')
+    board.draw_board(game)
+    drawn = pygame.image.tostring(screen, 'RGB')
+    assert drawn == full_redraw(board, game)
+
+
+def test_target_highlights_come_and_go(board, screen):
+    game = ChessVar.ChessVar()
+    board.draw_board(game)
+    targets = game.legal_targets('G1')
+    assert len(board.draw_board(game, None, targets)) == len(targets)
+    assert len(board.draw_board(game)) == len(targets)
+    assert pygame.image.tostring(screen, 'RGB') == full_redraw(board, game)
+
+
+def test_timer_only_redraws_when_the_second_changes(board, screen):
+    board.draw_board(ChessVar.ChessVar())
+    position = (board.ratio * 12, board.screen_height - board.ratio * 3)
+    assert board.draw_timer(100.9, position)
+    assert board.draw_timer(100.2, position) == []
+    assert board.draw_timer(99.9, position)
+
+
+def test_dragged_reserve_piece_does_not_erase_the_side_panel(board, screen, monkeypatch):
+    game = ChessVar.ChessVar()
+    timer = (board.ratio * 12, board.screen_height - board.ratio * 3)
+    board.draw_board(game)
+    board.draw_timer(100, timer)
+    board.draw_analysis(None)
+    # The hunter is dragged over the timer, then over the analysis, then back to its place
+    for x, y in ((timer[0] + board.ratio, timer[1] + board.ratio / 2),
+                 (board.ratio * 11, board.screen_height - board.ratio * 4.5),
+                 (board.ratio * 9.75, board.screen_height - board.ratio)):
+        monkeypatch.setattr(pygame.mouse, 'get_pos', lambda: (int(x), int(y)))
+        board.draw_board(game, 'H')
+        board.draw_timer(100, timer)
+        board.draw_analysis(None)
+        drawn = pygame.image.tostring(screen, 'RGB')
+        full_redraw(board, game, 'H')
+        board.draw_timer(100, timer)
+        board.draw_analysis(None)
+        assert drawn == pygame.image.tostring(screen, 'RGB')
+
+
+def test_engine_move_arrives_as_an_event(board):
+    import Engine
+    pygame.event.clear()
+    game = ChessVar.ChessVar()
+    game.make_move('E2', 'E4')
+    fen = game.get_fen()
+    thread, stop = board.start_engine_move(Engine.Engine(memory_mb=4), game, 3)
+    event = pygame.event.wait(10000)
+    thread.join()
+    assert event.type == board.ENGINE_EVENT
+    assert event.game is game
+    assert event.move in game.generate_moves()
+    # The search ran on a copy, so the shown game was never changed under the main loop
+    assert game.get_fen() == fen
+
+
+def test_stopped_engine_move_posts_nothing(board):
+    import Engine
+    pygame.event.clear()
+    search = board.start_engine_move(Engine.Engine(memory_mb=4), ChessVar.ChessVar(), 3000, 1)
+    start = time.perf_counter()
+    board.stop_engine_move(search)
+    assert time.perf_counter() - start < 5
+    assert not pygame.event.get(board.ENGINE_EVENT)
+
+
+def test_idle_loop_wakes_for_an_event(board):
+    pygame.event.clear()
+    pygame.event.post(pygame.event.Event(pygame.USEREVENT))
+    start = time.perf_counter()
+    events = board.get_events(False, 5000)
+    assert time.perf_counter() - start < 1
+    assert [event.type for event in events] == [pygame.USEREVENT]
+
+
+def test_idle_loop_sleeps_until_the_timeout(board):
+    pygame.event.clear()
+    start = time.perf_counter()
+    events = board.get_events(False, 100)
+    assert time.perf_counter() - start >= 0.08
+    assert all(event.type == pygame.NOEVENT for event in events)
+    # A timeout that has already passed does not wait at all
+    start = time.perf_counter()
+    assert board.get_events(False, 0) == []
+    assert time.perf_counter() - start < 0.05
+
+
+def test_time_until_timer_changes(board):
+    assert board.time_until_timer_changes(10.25) == 251
+    assert board.time_until_timer_changes(10.0) == 1
+    assert board.time_until_timer_changes(0.999) == 1000
+
+
+def test_replay_slider_and_panel(board, screen):
+    import GameRecord
+    game = ChessVar.ChessVar()
+    for moved_from, moved_to in (('E2', 'E4'), ('E7', 'E5'), ('G1', 'F3'), ('B8', 'C6')):
+        game.make_move(moved_from, moved_to)
+    replay = GameRecord.GameReplay(game.get_move_history(), game.get_game_state())
+    slider = board.get_slider_rect()
+    assert board.get_slider_ply(replay, slider.left) == 0
+    assert board.get_slider_ply(replay, slider.right) == len(replay)
+    assert board.get_slider_ply(replay, slider.centerx) == 2
+    board.draw_board(replay.seek(3))
+    rects = board.draw_replay_panel(replay)
+    assert len(rects) == 1 and rects[0].contains(slider)
+    # Seeking redraws only what changed, the same as drawing that ply from scratch
+    board.draw_board(replay.seek(1))
+    board.draw_replay_panel(replay)
+    drawn = pygame.image.tostring(screen, 'RGB')
+    full_redraw(board, GameRecord.replay(game.get_move_history(), 1))
+    board.draw_replay_panel(replay)
+    assert drawn == pygame.image.tostring(screen, 'RGB')
@@ -0,0 +1,58 @@
+# Description: Tests for the alpha-beta computer player in Engine.py.
+
+import pytest
+import ChessVar
+import Engine
+
+# White mates in two moves (three plies) with the rooks, starting with A1 A7
+MATE_IN_TWO = '7k/8/8/8/8/8/1R6/R3K3 w - 0/0 0'
+
+
+def make_game(fen):
+    game = ChessVar.ChessVar()
+    game.set_fen(fen)
+    return game
+
+
+def test_finds_mate_in_one():
+    game = make_game('7k/R7/8/8/8/8/8/1R2K3 w - 0/0 0')
+    move, score, depth = Engine.Engine().search(game, max_depth=4)
+    game.push_move(move)
+    assert game.get_game_state() == 'WHITE_WON'
+    assert score == Engine.MATE_SCORE - 1
+
+
+def test_mate_distance_is_kept_through_the_table():
+    game = make_game(MATE_IN_TWO)
+    assert Engine.Engine().search(game, max_depth=6)[1] == Engine.MATE_SCORE - 3
+    # Searching the position after the first move fills the table with mates counted from
+    # there, one ply below the root of the next search
+    engine = Engine.Engine()
+    game.push_move(ChessVar.encode_move(0, 48))
+    assert engine.search(game, max_depth=6)[1] == -(Engine.MATE_SCORE - 2)
+    game.pop_move()
+    assert engine.search(game, max_depth=6)[1] == Engine.MATE_SCORE - 3
+
+
+@pytest.mark.parametrize('score', [0, 150, -150, Engine.MATE_SCORE - 5, -(Engine.MATE_SCORE - 7)])
+def test_table_scores_round_trip(score):
+    for ply in (0, 1, 9):
+        stored = Engine._score_to_table(score, ply)
+        assert Engine._score_from_table(stored, ply) == score
+    # A mate found deeper in the search is a shorter mate from the position itself
+    if abs(score) > Engine.MATE_THRESHOLD:
+        assert abs(Engine._score_to_table(score, 3)) == abs(score) + 3
+
+
+def test_search_leaves_the_game_unchanged():
+    game = ChessVar.ChessVar()
+    game.make_move('E2', 'E4')
+    fen, history = game.get_fen(), game.get_move_history()
+    move, score, depth = Engine.Engine().search(game, max_time=0.3)
+    assert move in game.generate_moves()
+    assert game.get_fen() == fen and game.get_move_history() == history
+
+
+def test_choose_move_plays_a_legal_move():
+    game = ChessVar.ChessVar()
+    assert Engine.Engine().choose_move(game, 3) in game.generate_moves()
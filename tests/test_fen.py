@@ -0,0 +1,132 @@
+# Description: Tests for reading and writing positions with ChessVar.get_fen and set_fen.
+
+import pickle
+import random
+import pytest
+import ChessVar
+
+
+def test_start_position_round_trip():
+    game = ChessVar.ChessVar()
+    assert game.get_fen() == ChessVar.START_FEN
+    game.set_fen(ChessVar.START_FEN)
+    assert game.get_fen() == ChessVar.START_FEN
+    assert game.get_hash() == game.compute_hash()
+
+
+def test_round_trip_through_random_games():
+    rng = random.Random(19)
+    game = ChessVar.ChessVar()
+    copy = ChessVar.ChessVar()
+    for _ in range(20):
+        game.initialize_board()
+        for _ in range(120):
+            moves = game.generate_moves()
+            if not moves:
+                break
+            game.push_move(rng.choice(moves))
+            fen = game.get_fen()
+            copy.set_fen(fen)
+            assert copy.get_fen() == fen
+            assert copy.get_hash() == game.get_hash()
+            assert copy.get_score() == game.get_score()
+            assert sorted(copy.generate_moves()) == sorted(game.generate_moves())
+
+
+def test_bad_position_leaves_game_unchanged():
+    game = ChessVar.ChessVar()
+    game.make_move('E2', 'E4')
+    fen = game.get_fen()
+    with pytest.raises(ValueError):
+        game.set_fen('8/8/8/8/8/8/8/8 w FHfh 0/0 0')
+    assert game.get_fen() == fen
+
+
+@pytest.mark.parametrize('fen', [
+    '',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w FHfh 0/0',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBN w FHfh 0/0 ff00000000ff00',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNX w FHfh 0/0 ff00000000ff00',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x FHfh 0/0 ff00000000ff00',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w FHfx 0/0 ff00000000ff00',
+    # Reserves out of order, repeated or mixed with '-'
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w HFfh 0/0 ff00000000ff00',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w FFfh 0/0 ff00000000ff00',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w F- 0/0 ff00000000ff00',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w -- 0/0 ff00000000ff00',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w fF 0/0 ff00000000ff00',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w FHfh 0/32 ff00000000ff00',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w FHfh -1/0 ff00000000ff00',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w FHfh +1/0 ff00000000ff00',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w FHfh 1_0/0 ff00000000ff00',
+    # Non-canonical forms of the first moves bitmask
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w FHfh 0/0 0xff00000000ff00',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w FHfh 0/0 ff_00000000ff00',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w FHfh 0/0 FF00000000FF00',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w FHfh 0/0 -1',
+])
+def test_malformed_positions_are_rejected(fen):
+    with pytest.raises(ValueError):
+        ChessVar.parse_fen(fen)
+
+
+@pytest.mark.parametrize('fen', [
+    # Pawns on their 7th row (the other color's starting row), which would otherwise step
+    # two squares off the board
+    '4k3/P7/8/8/8/8/8/4K3 w FHfh 0/0 1000000000000',
+    '4k3/8/8/8/8/8/p7/4K3 b FHfh 0/0 100',
+    # A pawn that has already left its starting row
+    '4k3/8/8/8/8/P7/8/4K3 w FHfh 0/0 10000',
+    # An empty square
+    '4k3/8/8/8/8/8/8/4K3 w FHfh 0/0 100',
+])
+def test_first_moves_must_match_unmoved_pawns(fen):
+    with pytest.raises(ValueError):
+        ChessVar.parse_fen(fen)
+    game = ChessVar.ChessVar()
+    with pytest.raises(ValueError):
+        game.set_fen(fen)
+    assert game.get_fen() == ChessVar.START_FEN
+
+
+def test_unmoved_pawns_keep_their_double_step():
+    game = ChessVar.ChessVar()
+    game.set_fen('4k3/p7/8/8/8/8/P7/4K3 w FHfh 0/0 1000000000100')
+    assert ChessVar.encode_move(8, 24) in game.generate_moves()
+    game.set_fen('4k3/p7/8/8/8/8/P7/4K3 w FHfh 0/0 0')
+    assert ChessVar.encode_move(8, 24) not in game.generate_moves()
+
+
+def test_every_canonical_reserves_field_is_read():
+    for reserves in ChessVar._FEN_RESERVES:
+        fen = '4k3/8/8/8/8/8/8/4K3 w %s 0/0 0' % reserves
+        game = ChessVar.ChessVar()
+        game.set_fen(fen)
+        assert game.get_fen() == fen
+    assert len(ChessVar._FEN_RESERVES) == 16
+
+
+def test_snapshots_match_the_position():
+    rng = random.Random(7)
+    game = ChessVar.ChessVar()
+    copy = ChessVar.ChessVar()
+    for _ in range(150):
+        moves = game.generate_moves()
+        if not moves:
+            break
+        game.push_move(rng.choice(moves))
+        copy.set_snapshot(pickle.loads(pickle.dumps(game.get_snapshot())))
+        assert copy.get_fen() == game.get_fen()
+        assert copy.get_hash() == game.get_hash() == copy.compute_hash()
+        assert copy.get_score() == game.get_score()
+        assert copy._attacks == copy.compute_attacks()
+        assert copy.get_game_state() == game.get_game_state()
+        assert sorted(copy.generate_moves()) == sorted(game.generate_moves())
+    # The loaded position is the start of a new history, and does not share the board
+    assert copy.pop_move() is None
+    fen = game.get_fen()
+    for move in copy.generate_moves():
+        copy.push_move(move)
+        copy.pop_move()
+    copy.push_move(copy.generate_moves()[0])
+    assert game.get_fen() == fen
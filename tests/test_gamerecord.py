@@ -0,0 +1,136 @@
+# Description: Tests for the binary game archives of GameRecord.
+
+import os
+import random
+import pytest
+import ChessVar
+import GameRecord
+
+
+def play_random_game(seed, max_plies=200):
+    """Returns a ChessVar game of random legal moves."""
+    rng = random.Random(seed)
+    game = ChessVar.ChessVar()
+    for _ in range(max_plies):
+        moves = game.generate_moves()
+        if not moves:
+            break
+        game.push_move(rng.choice(moves))
+    return game
+
+
+def write_games(path, games):
+    with GameRecord.GameWriter(path) as writer:
+        for game in games:
+            writer.write_chess_var(game)
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'games.fhgr')
+    games = [play_random_game(seed) for seed in range(6)]
+    write_games(path, games)
+    read = list(GameRecord.read_games(path))
+    assert [list(moves) for moves, result in read] == [game.get_move_history() for game in games]
+    assert [result for moves, result in read] == [game.get_game_state() for game in games]
+    with GameRecord.GameArchive(path) as archive:
+        assert len(archive) == 6
+        for number in (5, 0, 3):
+            moves, result = archive[number]
+            assert list(moves) == games[number].get_move_history()
+            assert GameRecord.replay(moves).get_fen() == games[number].get_fen()
+
+
+def test_appending_keeps_earlier_games(tmp_path):
+    path = str(tmp_path / 'games.fhgr')
+    games = [play_random_game(seed) for seed in range(4)]
+    write_games(path, games[:2])
+    write_games(path, games[2:])
+    with GameRecord.GameArchive(path) as archive:
+        assert [list(archive[number][0]) for number in range(len(archive))] == \
+            [game.get_move_history() for game in games]
+
+
+@pytest.mark.parametrize('damage', ['missing', 'stale', 'truncated'])
+def test_append_rebuilds_a_bad_index(tmp_path, damage):
+    path = str(tmp_path / 'games.fhgr')
+    index_path = GameRecord.get_index_path(path)
+    games = [play_random_game(seed) for seed in range(6)]
+    write_games(path, games[:3])
+    if damage == 'missing':
+        os.remove(index_path)
+    elif damage == 'stale':
+        # An index left from an archive with fewer games
+        write_games(str(tmp_path / 'other.fhgr'), games[:1])
+        os.replace(str(tmp_path / 'other.fhgr.idx'), index_path)
+    else:
+        with open(index_path, 'r+b') as index:
+            index.truncate(12)
+    write_games(path, games[3:])
+    with GameRecord.GameArchive(path) as archive:
+        assert len(archive) == 6
+        assert [list(archive[number][0]) for number in range(6)] == \
+            [game.get_move_history() for game in games]
+
+
+def test_archive_rebuilds_a_stale_index(tmp_path):
+    path = str(tmp_path / 'games.fhgr')
+    games = [play_random_game(seed) for seed in range(3)]
+    write_games(path, games)
+    with open(GameRecord.get_index_path(path), 'wb'):
+        pass
+    with GameRecord.GameArchive(path) as archive:
+        assert len(archive) == 3
+        assert list(archive[2][0]) == games[2].get_move_history()
+
+
+def test_new_archive_replaces_a_leftover_index(tmp_path):
+    path = str(tmp_path / 'games.fhgr')
+    write_games(path, [play_random_game(seed) for seed in range(3)])
+    os.remove(path)
+    game = play_random_game(7)
+    write_games(path, [game])
+    with GameRecord.GameArchive(path) as archive:
+        assert len(archive) == 1
+        assert list(archive[0][0]) == game.get_move_history()
+
+
+def test_not_an_archive(tmp_path):
+    path = str(tmp_path / 'games.fhgr')
+    with open(path, 'wb') as file:
+        file.write(b'not a game archive')
+    with pytest.raises(ValueError):
+        GameRecord.GameWriter(path)
+    with pytest.raises(ValueError):
+        GameRecord.GameArchive(path)
+
+
+@pytest.mark.parametrize('plies, interval', [(0, 16), (1, 16), (37, 16), (48, 16), (150, 16), (40, 1)])
+def test_replay_seek_matches_playing_from_the_start(plies, interval):
+    moves = play_random_game(25, plies).get_move_history()
+    replay = GameRecord.GameReplay(moves, 'UNFINISHED', interval)
+    assert len(replay) == len(moves)
+    rng = random.Random(len(moves))
+    # Jumps, single steps both ways and seeks past either end
+    targets = [rng.randint(-5, len(moves) + 5) for _ in range(40)]
+    targets += list(range(len(moves) + 1)) + list(range(len(moves), -1, -1))
+    for target in targets:
+        game = replay.seek(target)
+        ply = max(0, min(target, len(moves)))
+        assert replay.get_ply() == ply
+        expected = GameRecord.replay(moves, ply)
+        assert game.get_fen() == expected.get_fen()
+        assert game.get_hash() == expected.get_hash()
+        assert game.get_score() == expected.get_score()
+        assert game._attacks == game.compute_attacks()
+        assert replay.get_last_move() == (moves[ply - 1] if ply else None)
+
+
+def test_replay_of_an_archived_game(tmp_path):
+    path = str(tmp_path / 'games.fhgr')
+    game = play_random_game(11, 300)
+    write_games(path, [game])
+    with GameRecord.GameArchive(path) as archive:
+        replay = GameRecord.GameReplay(*archive[0])
+    assert replay.get_result() == game.get_game_state()
+    assert replay.seek(len(replay)).get_fen() == game.get_fen()
+    assert replay.seek(0).get_fen() == ChessVar.START_FEN
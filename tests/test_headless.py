@@ -0,0 +1,55 @@
+# Description: Tests for the text command interface in Headless.py.
+
+import io
+import pytest
+import ChessVar
+import Headless
+
+
+def test_commands_play_a_game():
+    game = Headless.HeadlessGame()
+    assert game.run_command('move E2 E4') == 'ok UNFINISHED'
+    assert game.run_command('move E7 E4') == 'error illegal move'
+    assert game.run_command('move E7E5') == 'ok UNFINISHED'
+    assert game.run_command('state') == 'ok UNFINISHED White'
+    assert game.run_command('undo') == 'ok'
+    assert game.run_command('state') == 'ok UNFINISHED Black'
+    assert game.run_command('hash') == 'ok ' + format(game.get_game().get_hash(), '016x')
+    assert game.run_command('') == ''
+    assert game.run_command('quit') is None
+
+
+def test_fen_round_trip():
+    game = Headless.HeadlessGame()
+    assert game.run_command('fen') == 'ok ' + ChessVar.START_FEN
+    fen = '4k3/8/8/8/8/8/8/4K3 b FHfh 1/2 0'
+    assert game.run_command('fen ' + fen) == 'ok'
+    assert game.run_command('fen') == 'ok ' + fen
+    assert game.run_command('fen 8/8/8/8/8/8/8/8 w - 0/0 0') == 'error bad position'
+
+
+@pytest.mark.parametrize('line', [
+    'undo now', 'new game', 'move', 'move E2 E4 E5', 'drop H', 'state White', 'go 1 2',
+])
+def test_wrong_number_of_arguments(line):
+    assert Headless.HeadlessGame().run_command(line) == 'error wrong arguments for ' + line.split()[0]
+
+
+@pytest.mark.parametrize('seconds', ['abc', '-1', '0', 'nan', 'inf'])
+def test_go_with_a_bad_time(seconds):
+    game = Headless.HeadlessGame()
+    assert game.run_command('go ' + seconds) == 'error bad time ' + seconds
+    assert game.run_command('state') == 'ok UNFINISHED White'
+
+
+def test_go_plays_a_move():
+    game = Headless.HeadlessGame()
+    assert game.run_command('go 0.2').startswith('ok ')
+    assert game.run_command('state') == 'ok UNFINISHED Black'
+
+
+def test_errors_do_not_stop_the_loop():
+    output = io.StringIO()
+    Headless.run(io.StringIO('go abc\nbogus\nmove E2 E4\nquit\nmove E7 E5\n'), output)
+    assert output.getvalue().splitlines() == ['error bad time abc', 'error unknown command bogus',
+                                              'ok UNFINISHED']
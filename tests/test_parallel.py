@@ -0,0 +1,67 @@
+# Description: Tests for the multi-process search in ParallelSearch.py.
+
+import time
+import pytest
+import ChessVar
+import Engine
+import ParallelSearch
+
+MATE_IN_TWO = '7k/8/8/8/8/8/1R6/R3K3 w - 0/0 0'
+
+
+@pytest.fixture(scope='module')
+def search():
+    with ParallelSearch.ParallelSearch(workers=2, memory_mb=4) as parallel:
+        yield parallel
+
+
+def test_search_returns_a_legal_move(search):
+    game = ChessVar.ChessVar()
+    game.make_move('E2', 'E4')
+    fen = game.get_fen()
+    result = search.search(game, max_depth=3)
+    assert result['move'] in game.generate_moves()
+    assert result['depth'] == 3
+    assert len(result['workers']) == 2 == search.get_worker_count()
+    assert result['nodes'] == sum(worker['nodes'] for worker in result['workers'])
+    assert game.get_fen() == fen
+
+
+def test_workers_agree_with_a_single_engine_on_a_mate(search):
+    game = ChessVar.ChessVar()
+    game.set_fen(MATE_IN_TWO)
+    result = search.search(game, max_depth=6)
+    assert result['score'] == Engine.Engine().search(game, max_depth=6)[1] == Engine.MATE_SCORE - 3
+    # The table is kept between searches, and still gives the right mate distance from the
+    # position after the first move
+    game.push_move(result['move'])
+    assert search.search(game, max_depth=6)['score'] == -(Engine.MATE_SCORE - 2)
+
+
+def test_time_limit(search):
+    result = search.search(ChessVar.ChessVar(), max_time=0.3)
+    assert result['move'] is not None
+    assert result['seconds'] < 5
+
+
+def test_no_legal_move(search):
+    game = ChessVar.ChessVar()
+    game.set_fen('7k/5Q2/6K1/8/8/8/8/8 b - 0/0 0')
+    assert search.search(game, max_depth=2)['move'] is None
+
+
+def test_measure_scaling():
+    rows = ParallelSearch.measure_scaling(ChessVar.ChessVar(), 2, [1, 2], memory_mb=1)
+    assert [row['worker_count'] for row in rows] == [1, 2]
+    assert rows[0]['speedup'] == rows[0]['nps_scaling'] == 1.0
+    assert all(row['depth'] == 2 for row in rows)
+
+
+def test_dead_worker_is_reported():
+    with ParallelSearch.ParallelSearch(workers=2, memory_mb=1) as parallel:
+        parallel._workers[1].terminate()
+        parallel._workers[1].join()
+        start = time.monotonic()
+        with pytest.raises(RuntimeError):
+            parallel.search(ChessVar.ChessVar(), max_depth=3)
+        assert time.monotonic() - start < 5
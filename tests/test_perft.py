@@ -0,0 +1,33 @@
+# Description: Checks the perft counts of Perft.py's positions against their known values,
+#              to the depths that run quickly.
+
+import pytest
+import ChessVar
+import Perft
+
+
+@pytest.mark.parametrize('name, depth', [(name, depth) for name, depth in sorted(Perft.EXPECTED)
+                                         if depth <= 3])
+def test_known_counts(name, depth):
+    assert Perft.perft(Perft.get_position(name), depth) == Perft.EXPECTED[name, depth]
+
+
+def test_fast_count_matches_the_split_count():
+    game = Perft.get_position('reserves')
+    assert game.perft(3) == Perft.perft(game, 3)[0]
+
+
+def test_perft_leaves_the_game_unchanged():
+    game = Perft.get_position('all fairies')
+    moves, game_hash = game.generate_moves(), game.get_hash()
+    Perft.perft(game, 2)
+    game.perft(2)
+    assert game.generate_moves() == moves
+    assert game.get_hash() == game_hash
+
+
+def test_divide_adds_up(capsys):
+    Perft.divide(ChessVar.ChessVar(), 3)
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 20
+    assert sum(int(line.split()[1]) for line in lines) == 8902
@@ -0,0 +1,61 @@
+# Description: Tests for the shared, immutable piece objects of ChessVar.
+
+import random
+import pytest
+import ChessVar
+
+
+def play_random_moves(seed, plies):
+    """Returns a ChessVar game after the given number of random legal moves."""
+    rng = random.Random(seed)
+    game = ChessVar.ChessVar()
+    for _ in range(plies):
+        moves = game.generate_moves()
+        if not moves:
+            break
+        game.push_move(rng.choice(moves))
+    return game
+
+
+@pytest.mark.parametrize('name, value', [('_color', 'Black'), ('_colour', 'Black'), ('extra', 1)])
+def test_pieces_cannot_be_changed(name, value):
+    piece = ChessVar.PIECE_OBJECTS[ChessVar.PAWN]
+    with pytest.raises(AttributeError):
+        setattr(piece, name, value)
+    assert piece.get_color() == 'White'
+    assert not hasattr(piece, '__dict__')
+
+
+def test_every_board_shares_the_same_pieces():
+    games = [ChessVar.ChessVar(), play_random_moves(1, 30), play_random_moves(2, 60)]
+    for game in games:
+        for square, name in enumerate(ChessVar.SQUARE_NAMES):
+            piece = game.search_square(name)
+            assert piece is ChessVar.PIECE_OBJECTS[game.get_piece_code(square)]
+        for row in game._board:
+            for piece in row:
+                assert piece is ChessVar.PIECE_OBJECTS[ChessVar.PIECE_CODES.get(piece.get_code().strip(), 0)]
+    # The same piece on two boards is the same object
+    assert games[0].search_square('A1') is ChessVar.ChessVar().search_square('A1')
+    assert games[0].search_square('E2') is games[0].search_square('D2')
+
+
+def test_is_legal_move_agrees_with_the_move_rules():
+    for seed in range(5):
+        game = play_random_moves(seed, 40)
+        generated = {(move & 63, move >> ChessVar.MOVE_TARGET_SHIFT & 63)
+                     for move in game.generate_moves() if not move >> ChessVar.MOVE_DROP_SHIFT}
+        for origin, origin_name in enumerate(ChessVar.SQUARE_NAMES):
+            code = game.get_piece_code(origin)
+            if not code:
+                continue
+            piece = game.search_square(origin_name)
+            for target, target_name in enumerate(ChessVar.SQUARE_NAMES):
+                legal = piece.is_legal_move(game, origin_name, target_name)
+                assert legal == ChessVar.MOVE_RULES[abs(code)](game, origin, target)
+                if (origin, target) in generated:
+                    assert legal
+            # Every target shown while dragging the piece is allowed by its rule
+            if piece.get_color() == game._player_turn:
+                assert set(game.legal_targets(origin_name)) <= {
+                    name for name in ChessVar.SQUARE_NAMES if piece.is_legal_move(game, origin_name, name)}
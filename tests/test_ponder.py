@@ -0,0 +1,64 @@
+# Description: Tests for the background analysis process in Ponder.py.
+
+import queue
+import time
+import pytest
+import ChessVar
+import Engine
+import Ponder
+
+
+@pytest.fixture
+def ponderer():
+    results = queue.Queue()
+    analysis = Ponder.Ponderer(memory_mb=4, on_result=results.put)
+    yield analysis, results
+    analysis.close()
+
+
+def wait_for(results, game_hash, depth, timeout=30):
+    """Returns the first result for the position with the given hash reaching depth."""
+    deadline = time.monotonic() + timeout
+    while True:
+        result = results.get(timeout=max(0.01, deadline - time.monotonic()))
+        if result['hash'] == game_hash and result['depth'] >= depth:
+            return result
+
+
+def test_results_are_reported_for_each_depth(ponderer):
+    analysis, results = ponderer
+    game = ChessVar.ChessVar()
+    game.make_move('E2', 'E4')
+    analysis.analyse(game)
+    result = wait_for(results, game.get_hash(), 3)
+    analysis.stop()
+    assert result['turn'] == 'Black'
+    assert result['pv'] and result['pv'][0] in game.generate_moves()
+    assert result['nodes'] > 0
+
+
+def test_analysis_moves_on_to_the_new_position(ponderer):
+    analysis, results = ponderer
+    game = ChessVar.ChessVar()
+    analysis.analyse(game)
+    game.make_move('D2', 'D4')
+    analysis.analyse(game)
+    assert wait_for(results, game.get_hash(), 2)['turn'] == 'Black'
+
+
+def test_engine_reuses_the_shared_table(ponderer):
+    analysis, results = ponderer
+    game = ChessVar.ChessVar()
+    game.set_fen('7k/8/8/8/8/8/1R6/R3K3 w - 0/0 0')
+    analysis.analyse(game)
+    result = wait_for(results, game.get_hash(), 1)
+    # The analysis stops by itself once it has found the mate
+    while result['score'] < Engine.MATE_THRESHOLD:
+        result = wait_for(results, game.get_hash(), result['depth'] + 1)
+    assert result['score'] == Engine.MATE_SCORE - 3
+    entry = analysis.get_table().probe(game.get_hash())
+    assert entry is not None and entry[3] == result['pv'][0]
+    # An engine searching with the table has less left to do than one starting empty
+    engine, fresh = Engine.Engine(table=analysis.get_table()), Engine.Engine(memory_mb=4)
+    assert engine.search(game, max_depth=3)[:2] == fresh.search(game, max_depth=3)[:2]
+    assert engine.get_nodes() < fresh.get_nodes()
@@ -0,0 +1,56 @@
+# Description: Tests for the opt-in call counters in Profiling.py.
+
+import json
+import pytest
+import ChessVar
+import Profiling
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    Profiling.reset()
+    yield
+    Profiling.disable()
+    Profiling.reset()
+
+
+def test_nothing_is_measured_until_enabled():
+    ChessVar.ChessVar().make_move('E2', 'E4')
+    assert not Profiling.is_enabled()
+    assert Profiling.get_stats() == {}
+
+
+def test_enabled_calls_are_counted():
+    Profiling.enable()
+    game = ChessVar.ChessVar()
+    assert game.make_move('E2', 'E4')
+    assert game.make_move('E7', 'E5')
+    game.generate_moves()
+    stats = Profiling.get_stats()
+    assert stats['ChessVar.make_move']['calls'] == 2
+    assert stats['ChessVar.pawn_functionality']['calls'] == 2
+    assert stats['ChessVar.generate_moves']['calls'] >= 1
+    assert stats['ChessVar.make_move']['total_ms'] >= 0
+
+
+def test_disable_puts_the_originals_back():
+    make_move = ChessVar.ChessVar.make_move
+    rules = ChessVar.MOVE_RULES
+    Profiling.enable()
+    Profiling.enable()
+    assert ChessVar.ChessVar.make_move is not make_move
+    Profiling.disable()
+    assert ChessVar.ChessVar.make_move is make_move
+    assert ChessVar.MOVE_RULES is rules
+    assert not Profiling.is_enabled()
+    ChessVar.ChessVar().make_move('E2', 'E4')
+    assert 'ChessVar.make_move' not in Profiling.get_stats()
+
+
+def test_record_and_dump(tmp_path):
+    Profiling.record('frame', 0.002)
+    Profiling.record('frame', 0.004)
+    path = tmp_path / 'profile.json'
+    Profiling.dump_json(str(path))
+    stats = json.loads(path.read_text())
+    assert stats == {'frame': {'calls': 2, 'total_ms': 6.0, 'mean_us': 3000.0, 'max_ms': 4.0}}
@@ -0,0 +1,101 @@
+# Description: Tests for the move rules of ChessVar, played through make_move.
+
+import random
+import ChessVar
+
+
+def play(game, moves):
+    """Plays the given (from, to) moves, which must all be legal."""
+    for moved_from, moved_to in moves:
+        assert game.make_move(moved_from, moved_to), moved_from + moved_to
+
+
+def test_opening_moves():
+    game = ChessVar.ChessVar()
+    assert not game.make_move('E7', 'E5')
+    assert not game.make_move('E2', 'E5')
+    play(game, [('E2', 'E4'), ('E7', 'E5'), ('G1', 'F3')])
+    assert not game.make_move('F8', 'F6')
+    play(game, [('F8', 'C5')])
+    assert game.get_piece_code(ChessVar.get_square_index('C5')) == -ChessVar.BISHOP
+
+
+def test_rooks_cannot_jump_over_pieces_sideways():
+    game = ChessVar.ChessVar()
+    play(game, [('A2', 'A4'), ('H7', 'H5'), ('A1', 'A3'), ('H5', 'H4'), ('B2', 'B3'), ('H8', 'H5')])
+    assert not game.make_move('A3', 'C3')
+    play(game, [('A3', 'A1'), ('H5', 'A5')])
+    assert not game.make_move('A1', 'C1')
+
+
+def test_pawn_loses_its_double_step_after_capturing():
+    game = ChessVar.ChessVar()
+    play(game, [('A2', 'A3'), ('E7', 'E5'), ('A3', 'A4'), ('E5', 'E4'), ('A4', 'A5'), ('E4', 'E3'),
+                ('D2', 'E3'), ('H7', 'H6')])
+    assert not game.make_move('E3', 'E5')
+    assert game.make_move('E3', 'E4')
+
+
+def leaves_king_attacked(game, move):
+    """Returns whether playing the move leaves the mover's own king attacked."""
+    player = game._player_turn
+    game.push_move(move)
+    king = game._king_squares[player != 'White']
+    attacked = king >= 0 and game.is_square_attacked(king, game._player_turn)
+    game.pop_move()
+    return attacked
+
+
+def test_generated_moves_match_the_move_rules():
+    rng = random.Random(2)
+    for _ in range(10):
+        game = ChessVar.ChessVar()
+        for _ in range(150):
+            moves = game.generate_moves()
+            if not moves:
+                break
+            color = 1 if game._player_turn == 'White' else -1
+            expected = {(origin, target) for origin in range(64) for target in range(64)
+                        if game.get_piece_code(origin) * color > 0 and origin != target
+                        and ChessVar.MOVE_RULES[abs(game.get_piece_code(origin))](game, origin, target)
+                        and not leaves_king_attacked(game, ChessVar.encode_move(origin, target))}
+            assert {ChessVar.decode_move(move)[:2] for move in moves
+                    if not ChessVar.decode_move(move)[2]} == expected
+            # Whichever move is picked, make_move or enter_fairy_piece accepts it
+            move = rng.choice(moves)
+            origin, target, drop = ChessVar.decode_move(move)
+            square = ChessVar.get_board_notation(target >> 3, target & 7)
+            if drop:
+                assert game.enter_fairy_piece(ChessVar.PIECE_LETTERS[drop * color], square)
+            else:
+                assert game.make_move(ChessVar.get_board_notation(origin >> 3, origin & 7), square)
+
+
+def get_position(game):
+    """Returns everything that describes the game's position, for comparing positions."""
+    return (bytes(game._squares), game._player_turn, game._first_moves, game.get_game_state(),
+            game._white_falcon, game._white_hunter, game._black_falcon, game._black_hunter,
+            game._white_pieces_lost, game._black_pieces_lost)
+
+
+def test_pop_move_takes_back_push_move():
+    rng = random.Random(3)
+    for _ in range(10):
+        game = ChessVar.ChessVar()
+        positions = [get_position(game)]
+        for _ in range(150):
+            moves = game.generate_moves()
+            if not moves:
+                break
+            for move in moves:
+                game.push_move(move)
+                assert game.pop_move() == move
+                assert get_position(game) == positions[-1]
+            game.push_move(rng.choice(moves))
+            positions.append(get_position(game))
+        while positions[1:]:
+            positions.pop()
+            assert game.pop_move() is not None
+            assert get_position(game) == positions[-1]
+        assert game.pop_move() is None
+        assert game.generate_moves() == ChessVar.ChessVar().generate_moves()
@@ -0,0 +1,47 @@
+# Description: Tests for the piece-square score ChessVar keeps up to date as moves are played
+#              and taken back.
+
+import random
+import ChessVar
+
+
+def get_move_kind(game, move):
+    """Returns whether the move is a 'drop', 'promotion', 'capture' or 'quiet' move."""
+    origin, target, drop = ChessVar.decode_move(move)
+    if drop:
+        return 'drop'
+    if abs(game._squares[origin]) == ChessVar.PAWN and target >> 3 in (0, 7):
+        return 'promotion'
+    if game._squares[target]:
+        return 'capture'
+    return 'quiet'
+
+
+def test_score_follows_push_and_pop():
+    rng = random.Random(23)
+    game = ChessVar.ChessVar()
+    seen = set()
+    for _ in range(10):
+        game.initialize_board()
+        scores = [game.get_score()]
+        assert scores[0] == game.compute_score()
+        for _ in range(200):
+            moves = game.generate_moves()
+            if not moves:
+                break
+            # Every move is tried and taken back before one of them is played
+            for move in moves:
+                seen.add(get_move_kind(game, move))
+                game.push_move(move)
+                assert game.get_score() == game.compute_score()
+                game.pop_move()
+                assert game.get_score() == scores[-1]
+            # Captures, drops and promotions are played more often than a random choice would
+            special = [move for move in moves if get_move_kind(game, move) != 'quiet']
+            game.push_move(rng.choice(special if special and rng.random() < 0.5 else moves))
+            assert game.get_score() == game.compute_score()
+            scores.append(game.get_score())
+        while game.pop_move() is not None:
+            scores.pop()
+            assert game.get_score() == scores[-1] == game.compute_score()
+    assert seen == {'drop', 'promotion', 'capture', 'quiet'}
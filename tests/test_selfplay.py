@@ -0,0 +1,64 @@
+# Description: Tests for the self-play game runner in SelfPlay.py.
+
+import json
+import pytest
+import GameRecord
+import SelfPlay
+
+
+def test_games_are_repeatable():
+    first = SelfPlay.play_game(3, 'random', 'greedy', seed=5, max_plies=80, record=True)
+    second = SelfPlay.play_game(3, 'random', 'greedy', seed=5, max_plies=80, record=True)
+    first.pop('seconds'), second.pop('seconds')
+    assert first == second
+    assert len(first['moves']) == first['plies'] <= 80
+    # The recorded moves replay to the reported result
+    assert GameRecord.replay(first['moves']).get_game_state() == first['winner']
+
+
+def test_engine_policy_plays_legal_moves():
+    result = SelfPlay.play_game(0, 'engine:1', 'random', seed=1, max_plies=10, record=True)
+    assert result['plies'] == len(result['moves'])
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        SelfPlay.make_policy('perfect')
+
+
+def test_run_games_writes_results_and_records(tmp_path):
+    output = str(tmp_path / 'results.jsonl')
+    archive = str(tmp_path / 'games.fhgr')
+    totals = SelfPlay.run_games(6, 'random', 'random', output, workers=2, seed=2, max_plies=60,
+                                record_path=archive)
+    with open(output) as file:
+        results = [json.loads(line) for line in file]
+    assert sorted(result['game'] for result in results) == list(range(6))
+    assert sum(totals.values()) == 6
+    games = list(GameRecord.read_games(archive))
+    assert len(games) == 6
+    # Each recorded game replays to the result saved with it
+    for moves, winner in games:
+        replayed = GameRecord.replay(moves)
+        assert replayed.get_game_state() == winner
+    assert sorted(len(moves) for moves, winner in games) == sorted(result['plies'] for result in results)
+
+
+def test_archive_is_closed_when_a_game_fails(tmp_path, monkeypatch):
+    closed = []
+
+    class Writer(GameRecord.GameWriter):
+        def close(self):
+            closed.append(self)
+            super().close()
+
+    monkeypatch.setattr(GameRecord, 'GameWriter', Writer)
+    output = str(tmp_path / 'results.jsonl')
+    archive = str(tmp_path / 'games.fhgr')
+    with pytest.raises(ValueError):
+        SelfPlay.run_games(2, 'perfect', 'random', output, workers=1, record_path=archive)
+    assert len(closed) == 1
+    # More games can be added to the closed archive
+    SelfPlay.run_games(2, 'random', 'random', output, workers=1, max_plies=20, record_path=archive)
+    with GameRecord.GameArchive(archive) as games:
+        assert len(games) == 2
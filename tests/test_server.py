@@ -0,0 +1,142 @@
+# Description: Loopback tests of the game server in Server.py, played through Client.py.
+
+import asyncio
+import json
+import socket
+import threading
+import pytest
+import Client
+import Server
+
+
+@pytest.fixture
+def port():
+    """Runs a game server on a free local port in a background thread."""
+    loop = asyncio.new_event_loop()
+    server = Server.GameServer(time_control=60)
+    server_port = loop.run_until_complete(server.start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield server_port
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    # Lets the handlers of connections still open finish before the loop goes
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    loop.close()
+
+
+def receive(client, message_type):
+    """Returns the next message of the given type, skipping any others."""
+    while True:
+        message = client.receive(timeout=5)
+        assert message is not None, 'connection closed'
+        if message['type'] == message_type:
+            return message
+
+
+def start_game(port):
+    """Connects two clients and starts a game between them, White first."""
+    white = Client.GameClient('127.0.0.1', port)
+    black = Client.GameClient('127.0.0.1', port)
+    white.send('new', time=60, color='White')
+    number = receive(white, 'joined')['game']
+    black.send('join', game=number)
+    assert receive(black, 'joined')['color'] == 'Black'
+    receive(white, 'start')
+    receive(black, 'start')
+    return white, black
+
+
+def test_moves_are_checked_and_pushed_to_both_players(port):
+    white, black = start_game(port)
+    try:
+        black.send('move', **{'from': 'E7', 'to': 'E5'})
+        assert receive(black, 'error')['message'] == 'not your turn'
+        white.send('move', **{'from': 'E2', 'to': 'E5'})
+        assert receive(white, 'error')['message'] == 'illegal move'
+        white.send('move', **{'from': 'E2', 'to': 'E4'})
+        for client in (white, black):
+            update = receive(client, 'update')
+            assert update['move'] == ['E2', 'E4']
+            assert update['turn'] == 'Black'
+            assert update['state'] == 'UNFINISHED'
+    finally:
+        white.close()
+        black.close()
+
+
+def test_fools_mate(port):
+    white, black = start_game(port)
+    try:
+        for player, moved_from, moved_to in ((white, 'F2', 'F3'), (black, 'E7', 'E5'),
+                                             (white, 'G2', 'G4'), (black, 'D8', 'H4')):
+            player.send('move', **{'from': moved_from, 'to': moved_to})
+            receive(white, 'update')
+            update = receive(black, 'update')
+        assert update['state'] == 'BLACK_WON'
+    finally:
+        white.close()
+        black.close()
+
+
+def test_leaving_forfeits(port):
+    white, black = start_game(port)
+    try:
+        white.close()
+        assert receive(black, 'update')['state'] == 'BLACK_WON'
+    finally:
+        black.close()
+
+
+@pytest.mark.parametrize('message_type, fields', [
+    ('join', {'game': [1]}),
+    ('join', {'game': {'number': 1}}),
+    ('join', {'game': True}),
+    ('join', {'game': 1.5}),
+    ('join', {'game': '1'}),
+    ('new', {'time': 'soon'}),
+    ('new', {'time': [300]}),
+    ('new', {'time': True}),
+    ('new', {'time': float('inf')}),
+    ('new', {'color': ['White']}),
+    ('move', {'from': ['E2'], 'to': 'E4'}),
+    ('move', {'from': 'E2', 'to': {'square': 'E4'}}),
+    ('move', {'from': None, 'to': None}),
+    ([], {}),
+    ('no such type', {}),
+])
+def test_bad_fields_get_an_error_and_keep_the_game(port, message_type, fields):
+    white, black = start_game(port)
+    try:
+        white.send(message_type, **fields)
+        assert receive(white, 'error')
+        # The connection and the game are still there
+        white.send('move', **{'from': 'E2', 'to': 'E4'})
+        assert receive(white, 'update')['state'] == 'UNFINISHED'
+        assert receive(black, 'update')['move'] == ['E2', 'E4']
+    finally:
+        white.close()
+        black.close()
+
+
+@pytest.mark.parametrize('line', [
+    b'not json\n',
+    b'[1, 2, 3]\n',
+    b'"move"\n',
+    b'\xff\xfe\n',
+    b'[' * 100000 + b'\n',
+    b'{"type": "state", "padding": "' + b'x' * 200000 + b'"}\n',
+])
+def test_malformed_lines_get_an_error(port, line):
+    with socket.create_connection(('127.0.0.1', port)) as connection:
+        reader = connection.makefile('rb')
+        connection.settimeout(5)
+        connection.sendall(line)
+        assert json.loads(reader.readline())['type'] == 'error'
+        connection.sendall(b'{"type": "new"}\n')
+        assert json.loads(reader.readline())['type'] == 'joined'
@@ -0,0 +1,38 @@
+# Description: Tests for the square lookup tables and notation helpers of ChessVar.
+
+import pytest
+import ChessVar
+
+
+def test_names_and_indexes_round_trip():
+    assert len(ChessVar.SQUARE_NAMES) == 64
+    assert ChessVar.SQUARE_NAMES[0] == 'A1' and ChessVar.SQUARE_NAMES[63] == 'H8'
+    for square, name in enumerate(ChessVar.SQUARE_NAMES):
+        row, column = square >> 3, square & 7
+        assert ChessVar.SQUARE_INDEXES[name] == ChessVar.SQUARE_INDEXES[name.lower()] == square
+        assert ChessVar.get_square_index(name) == square
+        assert ChessVar.get_board_indexes(name) == (row, column)
+        assert ChessVar.get_board_notation(row, column) == name
+
+
+@pytest.mark.parametrize('name', ['I1', 'A0', 'A9', 'Z9', 'E10', '', 'E', '44'])
+def test_names_off_the_board_are_not_indexed(name):
+    assert name not in ChessVar.SQUARE_INDEXES
+
+
+@pytest.mark.parametrize('name', ['I1', 'A0', 'A9', 'Z9'])
+def test_off_board_names_give_off_board_indexes(name):
+    assert not ChessVar.is_on_board(*ChessVar.get_board_indexes(name))
+
+
+def test_off_board_notation():
+    assert ChessVar.get_board_notation(8, 8) == 'I9'
+    assert ChessVar.get_board_notation(-1, 0) == 'A0'
+
+
+@pytest.mark.parametrize('moved_from, moved_to', [('Z9', 'A1'), ('E2', 'E9'), ('I2', 'E4'), ('E2', 'E')])
+def test_moves_with_bad_squares_are_refused(moved_from, moved_to):
+    game = ChessVar.ChessVar()
+    assert not game.make_move(moved_from, moved_to)
+    assert game.get_game_state() == 'UNFINISHED'
+    assert game.make_move('E2', 'E4')
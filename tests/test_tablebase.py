@@ -0,0 +1,70 @@
+# Description: Tests for the endgame tablebases in Tablebase.py, using a K+F vs K table built
+#              for the tests.
+
+import pytest
+import ChessVar
+import Engine
+import Tablebase
+
+# White king and falcon against the black king, white to move
+KFVK = '4k3/8/8/8/3F4/8/8/4K3 w %s %s 0'
+
+
+@pytest.fixture(scope='module')
+def tablebase(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('tables'))
+    Tablebase.build('KFvK', directory, workers=1, log=lambda *args: None)
+    tables = Tablebase.Tablebase(directory)
+    yield tables
+    tables.close()
+
+
+def make_game(fen):
+    game = ChessVar.ChessVar()
+    game.set_fen(fen)
+    return game
+
+
+def test_covered_positions(tablebase):
+    result, plies = tablebase.probe(make_game(KFVK % ('-', '0/0')))
+    assert result == 'WIN' and plies % 2 == 1
+    # Black has only a king to lose, so its falcon and hunter can never be entered
+    assert tablebase.probe(make_game(KFVK % ('fh', '0/0'))) == (result, plies)
+    # The same with the colors swapped, through the same table
+    assert tablebase.probe(make_game('4k3/8/8/3f4/8/8/8/4K3 b FH 0/0 0')) == (result, plies)
+
+
+@pytest.mark.parametrize('reserves, lost', [
+    # White's falcon could be taken, letting white enter the hunter
+    ('H', '0/0'),
+    ('F', '0/0'),
+    # Black has lost a piece and can enter a fairy piece now
+    ('f', '0/1'),
+])
+def test_positions_with_pieces_to_enter_are_not_covered(tablebase, reserves, lost):
+    game = make_game(KFVK % (reserves, lost))
+    assert tablebase.probe(game) is None
+    assert tablebase.get_best_move(game) is None
+
+
+def test_pawns_and_missing_tables_are_not_covered(tablebase):
+    assert tablebase.probe(make_game('4k3/8/8/8/3F4/8/4P3/4K3 w - 0/0 0')) is None
+    assert tablebase.probe(make_game('4k3/8/8/8/3H4/8/8/4K3 w - 0/0 0')) is None
+
+
+def test_best_move_follows_the_table(tablebase):
+    game = make_game(KFVK % ('-', '0/0'))
+    result, plies = tablebase.probe(game)
+    # Playing the table's moves for both sides mates in exactly the stored number of plies
+    for played in range(plies):
+        move, move_result, move_plies = tablebase.get_best_move(game)
+        assert move_plies == plies - played
+        game.push_move(move)
+    assert game.get_game_state() == 'WHITE_WON'
+
+
+def test_engine_plays_the_table_move(tablebase):
+    game = make_game(KFVK % ('-', '0/0'))
+    move, score, depth = Engine.Engine(tablebase=tablebase).search(game, max_depth=2)
+    assert move == tablebase.get_best_move(game)[0]
+    assert score == Engine.MATE_SCORE - tablebase.probe(game)[1]
@@ -0,0 +1,106 @@
+# Description: Tests for the Zobrist hash of ChessVar positions and the TranspositionTable.
+
+import random
+from multiprocessing import shared_memory
+import ChessVar
+from Transposition import TranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND, get_table_size
+
+
+def test_store_and_probe():
+    table = TranspositionTable(1)
+    table.store(0x1234, 5, -250, LOWER_BOUND, 777)
+    assert table.probe(0x1234) == (5, -250, LOWER_BOUND, 777)
+    assert table.probe(0x1235) is None
+
+
+def test_table_size_is_a_power_of_two_number_of_buckets():
+    assert get_table_size(1) == 1024 * 1024
+    assert get_table_size(0) == 32
+    assert len(TranspositionTable(1)) == 1024 * 1024 // 16
+
+
+def colliding_keys(table, count):
+    """Returns count different keys that all fall into bucket 0 of the table."""
+    return [number * (table._bucket_mask + 1) + 7 * (1 << 40) for number in range(1, count + 1)]
+
+
+def test_deeper_result_keeps_the_first_slot():
+    table = TranspositionTable(0)
+    deep, shallow, newer = colliding_keys(table, 3)
+    table.store(deep, 8, 10, EXACT, 1)
+    table.store(shallow, 2, 20, EXACT, 2)
+    # The shallower result goes to the second slot, keeping the deep one
+    assert table.probe(deep) == (8, 10, EXACT, 1)
+    assert table.probe(shallow) == (2, 20, EXACT, 2)
+    # The second slot always takes the newest result
+    table.store(newer, 1, 30, UPPER_BOUND, 3)
+    assert table.probe(deep) == (8, 10, EXACT, 1)
+    assert table.probe(shallow) is None
+    assert table.probe(newer) == (1, 30, UPPER_BOUND, 3)
+
+
+def test_results_from_older_searches_are_replaced():
+    table = TranspositionTable(0)
+    old, new = colliding_keys(table, 2)
+    table.store(old, 8, 10, EXACT, 1)
+    table.new_search()
+    table.store(new, 2, 20, EXACT, 2)
+    assert table.probe(old) is None
+    assert table.probe(new) == (2, 20, EXACT, 2)
+
+
+def test_same_position_keeps_its_best_move():
+    table = TranspositionTable(0)
+    table.store(99, 3, 10, EXACT, 123)
+    table.store(99, 4, 15, UPPER_BOUND)
+    assert table.probe(99) == (4, 15, UPPER_BOUND, 123)
+
+
+def test_clear():
+    table = TranspositionTable(1)
+    table.store(42, 1, 0, EXACT)
+    table.clear()
+    assert table.probe(42) is None
+    assert table.get_fill() == 0
+
+
+def test_tables_on_one_buffer_share_entries():
+    memory = shared_memory.SharedMemory(create=True, size=get_table_size(1))
+    try:
+        first = TranspositionTable(1, buffer=memory.buf)
+        second = TranspositionTable(1, buffer=memory.buf)
+        first.store(5, 6, 7, EXACT, 8)
+        assert second.probe(5) == (6, 7, EXACT, 8)
+    finally:
+        first = second = None
+        memory.close()
+        memory.unlink()
+
+
+def test_incremental_hash_matches_a_full_recompute():
+    rng = random.Random(4)
+    game = ChessVar.ChessVar()
+    hashes = [game.get_hash()]
+    for _ in range(200):
+        moves = game.generate_moves()
+        if not moves:
+            break
+        game.push_move(rng.choice(moves))
+        assert game.get_hash() == game.compute_hash()
+        hashes.append(game.get_hash())
+    while game.pop_move() is not None:
+        hashes.pop()
+        assert game.get_hash() == hashes[-1]
+
+
+def test_transpositions_have_the_same_hash():
+    first, second = ChessVar.ChessVar(), ChessVar.ChessVar()
+    for moved_from, moved_to in (('G1', 'F3'), ('G8', 'F6'), ('B1', 'C3')):
+        first.make_move(moved_from, moved_to)
+    for moved_from, moved_to in (('B1', 'C3'), ('G8', 'F6'), ('G1', 'F3')):
+        second.make_move(moved_from, moved_to)
+    assert first.get_hash() == second.get_hash()
+    # The same pieces with the other player to move are a different position
+    third = ChessVar.ChessVar()
+    third.make_move('G1', 'F3')
+    assert third.get_hash() != first.get_hash()